@@ -0,0 +1,35 @@
+import sys
+import types
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+EXTENSION_ROOT = REPO_ROOT / "exts" / "tmrobot.digital_robot"
+
+
+def install_package_paths():
+    # Expose the tmrobot.digital_robot sub-packages without running the package
+    # __init__, which imports the Kit-only extension entry point
+    packages = {
+        "tmrobot": EXTENSION_ROOT / "tmrobot",
+        "tmrobot.digital_robot": EXTENSION_ROOT / "tmrobot" / "digital_robot",
+    }
+    for name, path in packages.items():
+        if name not in sys.modules:
+            module = types.ModuleType(name)
+            module.__path__ = [str(path)]
+            sys.modules[name] = module
+
+
+def install_constants_fallback():
+    # The compiled ui.constants module only loads on the Kit Python it was built for;
+    # elsewhere provide the values the services need
+    try:
+        from tmrobot.digital_robot.ui import constants  # noqa: F401
+    except ImportError:
+        ui = types.ModuleType("tmrobot.digital_robot.ui")
+        ui.__path__ = [str(EXTENSION_ROOT / "tmrobot" / "digital_robot" / "ui")]
+        constants = types.ModuleType("tmrobot.digital_robot.ui.constants")
+        constants.PORT_ETHERNET = 5891
+        ui.constants = constants
+        sys.modules["tmrobot.digital_robot.ui"] = ui
+        sys.modules["tmrobot.digital_robot.ui.constants"] = constants
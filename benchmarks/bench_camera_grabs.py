@@ -0,0 +1,216 @@
+"""Camera lookup and concurrent getGrabImageData, before and after the camera registry.
+
+    python benchmarks/bench_camera_grabs.py [--ips 16] [--clients 4] [--grabs 20]
+
+"lookup" times `_find_camera_by_ip_sn` and `_find_camera_by_sn` for the last camera of
+--ips TMflow IPs with --cameras-per-ip cameras each: the compiled VirtualCameraServerSecure
+methods against CameraRegistry. The grab workloads call getGrabImageData of the server
+directly (no gRPC transport) on the Kit loop. "shared": --clients clients grab the same
+camera of an unchanged scene at once. "busy": one client keeps --clients grabs of camera A
+in flight while the scene changes, another grabs camera B one at a time; reported is the
+latency of the second client. "previous" is VirtualCameraServer with the compiled lookups
+and one capture per grab, "registry" the current server. Needs Kit's Python 3.10.
+"""
+
+import argparse
+import asyncio
+import json
+import queue
+import time
+
+import _bootstrap
+import kit_stubs
+import numpy as np
+
+_bootstrap.install_package_paths()
+kit_stubs.install()
+_bootstrap.install_constants_fallback()
+
+# isort: off
+from bench_end_to_end import _make_cameras  # noqa: E402
+from tmrobot.digital_robot.grpcs import VirtualCameraAPI_pb2  # noqa: E402
+from tmrobot.digital_robot.models.digital_camera import Resolution  # noqa: E402
+from tmrobot.digital_robot.services.camera_registry import CameraRegistry  # noqa: E402
+from tmrobot.digital_robot.services.image_encoder import ImageEncoder  # noqa: E402
+from tmrobot.digital_robot.services.virtual_camera_server import (  # noqa: E402
+    VirtualCameraServer,
+)
+from tmrobot.digital_robot.services.virtual_camera_server_secure import (  # noqa: E402
+    VirtualCameraServerSecure,
+)
+
+# isort: on
+
+MODES = ("previous", "registry")
+CLIENT_IP = "127.0.0.1"
+
+
+class _PreviousServer(VirtualCameraServer):
+    # Nested dict lookups and one capture per grab, as before the registry
+    def _find_camera_by_ip_sn(self, client_ip: str, serial_number: str):
+        return VirtualCameraServerSecure._find_camera_by_ip_sn(
+            self, client_ip, serial_number
+        )
+
+    def _find_camera_by_sn(self, serial_number: str):
+        return VirtualCameraServerSecure._find_camera_by_sn(self, serial_number)
+
+    async def _grab(self, camera) -> bytes:
+        self.grab_limiter.capture_count += 1
+        return await self._capture(camera, camera.get_serial_number(), None)
+
+
+class _Context:
+    def __init__(self, client_ip: str):
+        self._peer = f"ipv4:{client_ip}:50000"
+
+    def peer(self) -> str:
+        return self._peer
+
+    def set_code(self, code):
+        raise RuntimeError(code)
+
+    def set_details(self, details):
+        pass
+
+
+def _dg_cameras(ips: int, cameras_per_ip: int, resolution) -> dict:
+    # TMflow IPs 10.0.0.x, the benchmark client is the last one plus CLIENT_IP
+    dg_cameras = {}
+    for ip_index in range(ips):
+        cameras = _make_cameras(cameras_per_ip, resolution)
+        dg_cameras[f"10.0.0.{ip_index + 1}"] = {
+            f"{serial_number}-{ip_index}": camera
+            for serial_number, camera in cameras.items()
+        }
+    dg_cameras[CLIENT_IP] = _make_cameras(2, resolution)
+    return dg_cameras
+
+
+def measure_lookup(args) -> list[dict]:
+    dg_cameras = _dg_cameras(args.ips, args.cameras_per_ip, (64, 48))
+    server = VirtualCameraServerSecure(queue.Queue(), dg_cameras)
+    registry = CameraRegistry(dg_cameras)
+    last_ip = f"10.0.0.{args.ips}"
+    serial_number = list(dg_cameras[last_ip])[-1]
+    calls = {
+        "previous": (
+            lambda: server._find_camera_by_ip_sn(last_ip, serial_number),
+            lambda: server._find_camera_by_sn(serial_number),
+        ),
+        "registry": (
+            lambda: registry.get(last_ip, serial_number),
+            lambda: registry.get_by_serial(serial_number),
+        ),
+    }
+
+    results = []
+    for mode, (by_ip_serial, by_serial) in calls.items():
+        result = {"workload": "lookup", "mode": mode, "cameras": len(registry)}
+        for name, call in (("by_ip_sn_us", by_ip_serial), ("by_sn_us", by_serial)):
+            assert call() is not None
+            start = time.perf_counter()
+            for _ in range(args.lookups):
+                call()
+            result[name] = (time.perf_counter() - start) / args.lookups * 1e6
+        results.append(result)
+    return results
+
+
+async def _grab(server, serial_number: str) -> float:
+    request = VirtualCameraAPI_pb2.CameraSerialNumberRequest(SerialNumber=serial_number)
+    start = time.perf_counter()
+    response = await server.getGrabImageData(request, _Context(CLIENT_IP))
+    assert response.EncodeString
+    return time.perf_counter() - start
+
+
+async def measure_grabs(mode: str, workload: str, args) -> dict:
+    resolution = Resolution.get_resolution_by_key(args.resolution)
+    dg_cameras = {CLIENT_IP: _make_cameras(2, resolution)}
+    camera_a, camera_b = list(dg_cameras[CLIENT_IP])
+    frame_index = 0
+    server_class = _PreviousServer if mode == "previous" else VirtualCameraServer
+    server = server_class(
+        queue.Queue(),
+        dg_cameras,
+        ImageEncoder(workers=args.workers),
+        frame_index=lambda: frame_index,
+    )
+
+    latencies = []
+    start = time.perf_counter()
+    if workload == "shared":
+        for _ in range(args.grabs):
+            latencies += await asyncio.gather(
+                *(_grab(server, camera_a) for _ in range(args.clients))
+            )
+    else:
+        running = True
+
+        async def _busy_client():
+            nonlocal frame_index
+            while running:
+                frame_index += 1
+                dg_cameras[CLIENT_IP][camera_a]._camera.render()
+                await _grab(server, camera_a)
+
+        busy = [asyncio.ensure_future(_busy_client()) for _ in range(args.clients)]
+        await asyncio.sleep(0.05)
+        for _ in range(args.grabs):
+            latencies.append(await _grab(server, camera_b))
+        running = False
+        await asyncio.gather(*busy)
+    elapsed = time.perf_counter() - start
+    server.image_encoder.shutdown()
+
+    latencies_ms = np.array(latencies) * 1e3
+    return {
+        "workload": workload,
+        "mode": mode,
+        "grabs": len(latencies),
+        "elapsed_s": elapsed,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        **server.grab_limiter.get_stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ips", type=int, default=16)
+    parser.add_argument("--cameras-per-ip", type=int, default=4)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--grabs", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=2, help="encoder workers")
+    parser.add_argument("--resolution", default="5MP")
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = measure_lookup(args)
+    for workload in ("shared", "busy"):
+        for mode in MODES:
+            results.append(asyncio.run(measure_grabs(mode, workload, args)))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        if result["workload"] == "lookup":
+            print(
+                f"lookup  {result['mode']:<9} cameras={result['cameras']}"
+                f" by ip+sn={result['by_ip_sn_us']:.2f}us by sn={result['by_sn_us']:.2f}us"
+            )
+        else:
+            print(
+                f"{result['workload']:<7} {result['mode']:<9} grabs={result['grabs']}"
+                f" elapsed={result['elapsed_s']:.2f}s p50={result['p50_ms']:.1f}ms"
+                f" p99={result['p99_ms']:.1f}ms captures={result['captures']}"
+                f" shared={result['shared']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
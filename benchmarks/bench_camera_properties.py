@@ -0,0 +1,165 @@
+"""loadCameraList and hand-eye parameters of many cameras, with and without CameraPropertyCache.
+
+    python benchmarks/bench_camera_properties.py [--cameras 4 16 64] [--calls 200]
+
+"compiled" is DigitalCamera.get_handeye_parameters: two prim attribute reads and the scalar
+quaternion to Euler conversion per camera. "cached" answers from CameraPropertyCache, and
+"changed" reports a change of one camera prim before every call, so its pose is read again.
+Reported are the loadCameraList handler of VirtualCameraServerSecure (called directly, no
+gRPC transport) and the conversion of every camera's pose, scalar versus batched. USD is
+stubbed (kit_stubs), so the attribute reads cost far less than on a real stage; the time
+saved per read is larger in Kit. Needs Kit's Python 3.10.
+"""
+
+import argparse
+import asyncio
+import json
+import queue
+import time
+
+import _bootstrap
+import kit_stubs
+import numpy as np
+
+_bootstrap.install_package_paths()
+kit_stubs.install()
+_bootstrap.install_constants_fallback()
+
+# isort: off
+from bench_end_to_end import _make_cameras  # noqa: E402
+from google.protobuf import empty_pb2  # noqa: E402
+from tmrobot.digital_robot.services.camera_properties import (  # noqa: E402
+    CameraPropertyCache,
+    quaternions_to_euler,
+)
+from tmrobot.digital_robot.services.virtual_camera_server_secure import (  # noqa: E402
+    VirtualCameraServerSecure,
+)
+
+# Skips the request and response dumps of VirtualCameraServerSecure, as in the extension
+from tmrobot.digital_robot.services import virtual_camera_server  # noqa: E402, F401
+
+# isort: on
+
+MODES = ("compiled", "cached", "changed")
+CLIENT_IP = "127.0.0.1"
+
+
+class _Context:
+    def peer(self) -> str:
+        return f"ipv4:{CLIENT_IP}:50000"
+
+
+class _Path(str):
+    def GetPrimPath(self) -> "_Path":
+        return _Path(self.split(".")[0])
+
+
+class _ChangedNotice:
+    # Usd.Notice.ObjectsChanged of one attribute
+    def __init__(self, attribute_path: str):
+        self._paths = [_Path(attribute_path)]
+
+    def GetChangedInfoOnlyPaths(self) -> list:
+        return self._paths
+
+    def GetResyncedPaths(self) -> list:
+        return []
+
+
+def measure_load_camera_list(mode: str, camera_count: int, args) -> dict:
+    cameras = _make_cameras(camera_count, (64, 48))
+    cache = None
+    if mode != "compiled":
+        cache = CameraPropertyCache(max_age=0)
+        cache.attach(cameras.values())
+    notice = _ChangedNotice(
+        f"{next(iter(cameras.values()))._prim.GetPath()}.xformOp:translate"
+    )
+
+    async def _calls() -> list[float]:
+        server = VirtualCameraServerSecure(queue.Queue(), {CLIENT_IP: cameras})
+        seconds = []
+        for _ in range(args.calls):
+            if mode == "changed":
+                cache._on_objects_changed(notice, None)
+            start = time.perf_counter()
+            await server.loadCameraList(empty_pb2.Empty(), _Context())
+            seconds.append(time.perf_counter() - start)
+        return seconds
+
+    seconds_us = np.array(asyncio.run(_calls())) * 1e6
+    result = {
+        "workload": "loadCameraList",
+        "mode": mode,
+        "cameras": camera_count,
+        "p50_us": float(np.percentile(seconds_us, 50)),
+        "p99_us": float(np.percentile(seconds_us, 99)),
+    }
+    if cache is not None:
+        result.update(cache.get_stats())
+        cache.close()
+    return result
+
+
+def measure_conversion(camera_count: int, args) -> list[dict]:
+    camera = next(iter(_make_cameras(1, (64, 48)).values()))
+    rng = np.random.default_rng(0)
+    quaternions = rng.normal(size=(camera_count, 4))
+    quaternions /= np.linalg.norm(quaternions, axis=1, keepdims=True)
+    rows = [tuple(float(value) for value in row) for row in quaternions]
+
+    def _scalar():
+        return [camera._quaternion_to_euler(*row) for row in rows]
+
+    def _batched():
+        return quaternions_to_euler(quaternions)
+
+    assert np.allclose(_scalar(), _batched(), atol=1e-9)
+    results = []
+    for mode, convert in (("scalar", _scalar), ("batched", _batched)):
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            convert()
+        results.append(
+            {
+                "workload": "euler",
+                "mode": mode,
+                "cameras": camera_count,
+                "p50_us": (time.perf_counter() - start) / args.calls * 1e6,
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cameras", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = []
+    for camera_count in args.cameras:
+        for mode in MODES:
+            results.append(measure_load_camera_list(mode, camera_count, args))
+        results += measure_conversion(camera_count, args)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        line = (
+            f"{result['workload']:<14} {result['mode']:<8} cameras={result['cameras']:<3}"
+            f" p50={result['p50_us']:.1f}us"
+        )
+        if "p99_us" in result:
+            line += f" p99={result['p99_us']:.1f}us"
+        if "reads" in result:
+            line += f" reads={result['reads']} hits={result['hits']}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""N robot cells in one process (batch mode) versus one process per cell.
+
+    python benchmarks/bench_cells.py [--cells 1 2 4 8] [--seconds 3] [--resolution 1MP]
+
+Every cell has one TM12S with an EIH camera and its own fake TMSVR slave on a loopback
+address (127.0.0.2 and up, Linux only). "batch" builds every cell in one fresh process
+with CellBatch: one TMSVRMasterLoop, one articulation view for every robot, one
+VirtualCameraServer that serves each cell's camera under its template serial number to
+that cell's TMflow IP. "processes" builds one cell per fresh process, as running one
+Isaac Sim per cell. Reported are the time until every cell's master is connected (with
+and without process start and imports), the resident memory of all processes, the mean
+step time per cell (applying the newest frame of its robots at 60 Hz), the frames
+applied per cell and second, and whether every cell's loadCameraList and
+getGrabImageData returned its own camera. USD and Isaac Sim are stubbed (kit_stubs), so
+the memory of a real Isaac Sim process (GBs) is not included; the prims are not cloned.
+Needs Kit's Python 3.10.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import queue
+import time
+
+import _bootstrap
+import kit_stubs
+import numpy as np
+from PIL import Image
+
+_bootstrap.install_package_paths()
+kit_stubs.install()
+_bootstrap.install_constants_fallback()
+
+# isort: off
+from fake_tmsvr_slave import FakeTMSVRSlave  # noqa: E402
+from google.protobuf import empty_pb2  # noqa: E402
+from pxr import Usd  # noqa: E402
+from tmrobot.digital_robot.grpcs import VirtualCameraAPI_pb2  # noqa: E402
+from tmrobot.digital_robot.models.digital_camera import Resolution  # noqa: E402
+from tmrobot.digital_robot.models.digital_robot import DigitalRobot  # noqa: E402
+from tmrobot.digital_robot.models.setting import RobotSetting  # noqa: E402
+from tmrobot.digital_robot.services.articulation_batch import (  # noqa: E402
+    BatchedJointTargets,
+)
+from tmrobot.digital_robot.services.cell_batch import CellBatch  # noqa: E402
+from tmrobot.digital_robot.services.cell_batch import get_rss_bytes  # noqa: E402
+from tmrobot.digital_robot.services.motion_mailbox import MotionMailbox  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr_master import TMSVRMaster  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr_master import TMSVRMasterLoop  # noqa: E402
+from tmrobot.digital_robot.services.virtual_camera_server import (  # noqa: E402
+    VirtualCameraServer,
+)
+
+# isort: on
+
+MODES = ("batch", "processes")
+STEP_SIZE = 1 / 60
+
+
+class _Context:
+    def __init__(self, client_ip: str):
+        self._client_ip = client_ip
+        self.code = None
+
+    def peer(self) -> str:
+        return f"ipv4:{self._client_ip}:50000"
+
+    def set_code(self, code):
+        self.code = code
+
+    def set_details(self, details):
+        pass
+
+
+def _serve_slaves(count: int, port: int, ready):
+    async def _main():
+        for index in range(count):
+            slave = FakeTMSVRSlave(_cell_ip(index), port)
+            await slave.start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(_main())
+
+
+def _cell_ip(index: int) -> str:
+    return f"127.0.0.{2 + index}"
+
+
+def _template(first_cell: int) -> RobotSetting:
+    return RobotSetting(
+        name="Robot01",
+        ip=_cell_ip(first_cell),
+        model="TM12S",
+        activated=True,
+        robot_prim_path="/World/Cell/Robot01",
+        cameras_activated={"EIH": True, "EXT01": False, "EXT02": False},
+    )
+
+
+def _check_cameras(dg_cameras: dict, frames: dict) -> bool:
+    # Every cell's TMflow sees the template serial number and gets its own frame
+    async def _check() -> bool:
+        server = VirtualCameraServer(queue.Queue(), dg_cameras)
+        try:
+            for client_ip, robot_name in frames:
+                context = _Context(client_ip)
+                listed = await server.loadCameraList(empty_pb2.Empty(), context)
+                serials = [
+                    device.SerialNumber for device in listed.CameraIDList.Devices
+                ]
+                if serials != ["Robot01_EIH"]:
+                    return False
+                response = await server.getGrabImageData(
+                    VirtualCameraAPI_pb2.CameraSerialNumberRequest(
+                        SerialNumber="Robot01_EIH"
+                    ),
+                    context,
+                )
+                rgb = np.asarray(
+                    Image.open(io.BytesIO(response.EncodeString)), np.int16
+                )
+                errors = {
+                    key: np.abs(rgb - frame).mean() for key, frame in frames.items()
+                }
+                if min(errors, key=errors.get) != (client_ip, robot_name):
+                    return False
+            return True
+        finally:
+            server.image_encoder.shutdown()
+
+    return asyncio.run(_check())
+
+
+def _run(count: int, first_cell: int, args, results):
+    start = time.perf_counter()
+    resolution = Resolution.get_resolution_by_key(args.resolution)
+    cells = CellBatch([_template(first_cell)], count)
+    stage = Usd.Stage()
+
+    robots, frames = {}, {}
+    dg_cameras: dict[str, dict] = {}
+    for setting in cells.settings:
+        rss = get_rss_bytes()
+        robots[setting.name] = DigitalRobot(setting, stage)
+        cameras = robots[setting.name].get_activated_cameras()
+        dg_cameras[setting.ip] = {}
+        for camera in cameras:
+            # A frame per cell that tells the cells apart
+            cell_index = first_cell + cells.cell_of(setting.name).index
+            camera._camera = kit_stubs.FakeAnnotatorCamera(
+                camera.get_serial_number(), resolution, seed=cell_index
+            )
+            camera._camera.frame = np.roll(camera._camera.frame, 40 * cell_index, 0)
+            frames[setting.ip, setting.name] = camera._camera.frame.astype(np.int16)
+            key = cells.camera_key(setting.name, camera.get_serial_number())
+            dg_cameras[setting.ip][key] = camera
+        cells.add_robot(setting.name, get_rss_bytes() - rss, cameras)
+
+    mailbox = MotionMailbox([setting.name for setting in cells.settings])
+    master_loop = TMSVRMasterLoop()
+    master_loop.start()
+    masters = [
+        TMSVRMaster(setting.name, setting.ip, mailbox, port=args.port)
+        for setting in cells.settings
+    ]
+
+    async def _add_all():
+        await asyncio.gather(*(master_loop.add_master(master) for master in masters))
+
+    asyncio.run(_add_all())
+    ready_seconds = time.perf_counter() - start
+
+    joint_targets = BatchedJointTargets(
+        {
+            setting.name: (setting.model, setting.robot_prim_path)
+            for setting in cells.settings
+        },
+        view_factory=lambda prim_paths, name: kit_stubs.FakeArticulationView(
+            prim_paths, name
+        ),
+    )
+    steps = 0
+    step_start = time.perf_counter()
+    next_step = step_start
+    while time.perf_counter() - step_start < args.seconds:
+        for motion in mailbox.take_all():
+            apply_start = time.perf_counter()
+            joint_targets.set_targets(motion.robot_name, motion.joint_radian)
+            cells.add_step_time(motion.robot_name, time.perf_counter() - apply_start)
+        joint_targets.flush()
+        cells.end_step()
+        steps += 1
+        next_step += STEP_SIZE
+        time.sleep(max(0.0, next_step - time.perf_counter()))
+    elapsed = time.perf_counter() - step_start
+
+    cameras_ok = _check_cameras(dg_cameras, frames)
+    master_loop.stop()
+
+    mailbox_stats = mailbox.get_stats()
+    results.put(
+        {
+            "ready_s": ready_seconds,
+            "rss_mb": get_rss_bytes() / 2**20,
+            "step_us": [
+                cell.step_seconds.to_dict()["mean_ms"] * 1e3 for cell in cells.cells
+            ],
+            "applied_per_s": [
+                sum(mailbox_stats[name]["applied"] for name in cell.template_names)
+                / elapsed
+                for cell in cells.cells
+            ],
+            "cameras_ok": cameras_ok,
+        }
+    )
+
+
+def measure(mode: str, count: int, args) -> dict:
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    slaves = context.Process(
+        target=_serve_slaves, args=(count, args.port, ready), daemon=True
+    )
+    slaves.start()
+    ready.wait()
+
+    results = context.Queue()
+    if mode == "batch":
+        groups = [(count, 0)]
+    else:
+        groups = [(1, index) for index in range(count)]
+    start = time.perf_counter()
+    processes = [
+        context.Process(target=_run, args=(cells, first, args, results))
+        for cells, first in groups
+    ]
+    for process in processes:
+        process.start()
+    runs = [results.get(timeout=120) for _ in processes]
+    for process in processes:
+        process.join()
+    slaves.terminate()
+    slaves.join()
+
+    step_us = [value for run in runs for value in run["step_us"]]
+    applied = [value for run in runs for value in run["applied_per_s"]]
+    return {
+        "mode": mode,
+        "cells": count,
+        "processes": len(processes),
+        # Setup until every master is connected, and with process start and imports
+        "ready_s": max(run["ready_s"] for run in runs),
+        "startup_s": time.perf_counter() - start - args.seconds,
+        "rss_mb": sum(run["rss_mb"] for run in runs),
+        "step_us_mean": float(np.mean(step_us)),
+        "step_us_max": float(np.max(step_us)),
+        "applied_per_s_min": float(np.min(applied)),
+        "cameras_ok": all(run["cameras_ok"] for run in runs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cells", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--resolution", default="1MP")
+    parser.add_argument("--port", type=int, default=15891)
+    parser.add_argument("--modes", nargs="+", default=list(MODES))
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = [
+        measure(mode, count, args) for count in args.cells for mode in args.modes
+    ]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(
+            f"{result['mode']:<9} cells={result['cells']:<2}"
+            f" processes={result['processes']:<2} ready={result['ready_s']:.2f}s"
+            f" startup={result['startup_s']:.2f}s"
+            f" rss={result['rss_mb']:.0f}MB step={result['step_us_mean']:.1f}us"
+            f" (max {result['step_us_max']:.1f}us)"
+            f" applied>={result['applied_per_s_min']:.0f}/s"
+            f" cameras={'ok' if result['cameras_ok'] else 'MIXED'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,515 @@
+"""Frame rate and latency of the motion and vision paths against local TMflow stand-ins.
+
+    python benchmarks/bench_end_to_end.py [--output results.json] [--baseline old.json]
+
+Motion: a fake TMSVR slave per robot streams joint frames (synthetic or --recording) and a
+physics step thread applies them to stub articulations. Latency is the receive time of a
+frame to the first physics step that applies it. "legacy" is the compiled EthernetMaster,
+one receive_data thread per robot feeding the shared queue; "mailbox" and "trajectory" are
+TMSVRMasterLoop feeding MotionMailbox or JointTrajectoryBuffer.
+
+Vision: the camera server runs on its own event loop standing in for the Kit loop, with
+DigitalCamera objects over fake annotator cameras. A fake TMflow client calls
+loadCameraList, connectCamera and getGrabImageData over TLS; latency is grab request to
+image response. "secure" is the compiled VirtualCameraServerSecure, "pool" and "cached" are
+VirtualCameraServer without and with an ImageCache. In a "moving" scene every grab sees a
+new frame, in a "static" scene the same one.
+
+Results are written as JSON together with the extension version, so runs of two versions can
+be compared: --baseline prints every fps drop or p99 increase above --tolerance and exits
+with status 1. --metrics adds the timing histograms the services recorded during each run
+(services/metrics.py) to its result. The compiled modules are built for Kit's Python 3.10;
+paths that need them are reported as skipped on other versions.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+
+import _bootstrap
+import kit_stubs
+import numpy as np
+
+_bootstrap.install_package_paths()
+kit_stubs.install()
+_bootstrap.install_constants_fallback()
+
+# isort: off
+from fake_tmsvr_slave import FakeTMSVRSlave  # noqa: E402
+from tmrobot.digital_robot.services import metrics  # noqa: E402
+from tmrobot.digital_robot.services.image_cache import ImageCache  # noqa: E402
+from tmrobot.digital_robot.services.image_encoder import ImageEncoder  # noqa: E402
+from tmrobot.digital_robot.services.motion_mailbox import MotionMailbox  # noqa: E402
+from tmrobot.digital_robot.services.trajectory_buffer import (  # noqa: E402
+    JointTrajectoryBuffer,
+)
+from tmrobot.digital_robot.services.tmsvr_master import TMSVRMaster  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr_master import TMSVRMasterLoop  # noqa: E402
+from tmrobot.digital_robot.ui import constants as const  # noqa: E402
+from tmsvr_stream import load_recording  # noqa: E402
+
+# isort: on
+
+try:
+    from tmrobot.digital_robot.services.ethernet_master import (  # noqa: E402
+        EthernetMaster,
+    )
+except ImportError as e:
+    EthernetMaster = None
+    LEGACY_MOTION_ERROR = f"compiled ethernet_master not importable: {e}"
+
+try:
+    from fake_tmflow_client import FakeTMflowClient  # noqa: E402
+    from tmrobot.digital_robot.models.digital_camera import DigitalCamera  # noqa: E402
+    from tmrobot.digital_robot.models.digital_camera import HandeyeType  # noqa: E402
+    from tmrobot.digital_robot.models.digital_camera import Resolution  # noqa: E402
+    from tmrobot.digital_robot.services.virtual_camera_server import (  # noqa: E402
+        VirtualCameraServer,
+    )
+    from tmrobot.digital_robot.services.virtual_camera_server_secure import (  # noqa: E402
+        VirtualCameraServerSecure,
+    )
+except ImportError as e:
+    VirtualCameraServerSecure = None
+    VISION_ERROR = f"compiled camera modules not importable: {e}"
+
+MOTION_MODES = ("legacy", "mailbox", "trajectory")
+VISION_MODES = ("secure", "pool", "cached")
+SCENES = ("moving", "static")
+# Fields that identify a result when comparing with a baseline
+RESULT_KEYS = ("path", "mode", "scene", "robots", "cameras", "resolution")
+
+
+def _percentiles(latencies: list[float]) -> dict:
+    if not latencies:
+        return {"p50_ms": None, "p99_ms": None, "max_ms": None}
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "p99_ms": float(np.percentile(latencies, 99)) * 1000,
+        "max_ms": float(max(latencies)) * 1000,
+    }
+
+
+def _split_packets(data: bytes) -> list[bytes]:
+    return [b"$TMSVR," + packet for packet in data.split(b"$TMSVR,")[1:]]
+
+
+class _LoopThread:
+    # An event loop in a background thread, like the Kit main loop seen from the harness
+    def __init__(self, name: str):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name=name, daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def run(self, coro, timeout: float = 30.0):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+# ---- Motion ----
+
+
+def measure_motion(mode: str, args, packets: list[bytes]) -> dict:
+    result = {"path": "motion", "mode": mode, "robots": args.robots}
+    if mode == "legacy" and EthernetMaster is None:
+        return {**result, "skipped": LEGACY_MOTION_ERROR}
+
+    # EthernetMaster always connects to PORT_ETHERNET, so every robot gets its own
+    # loopback address
+    robot_ips = {
+        f"Robot{index:02d}": f"127.0.0.{index}" for index in range(1, args.robots + 1)
+    }
+    slaves = [
+        FakeTMSVRSlave(ip, const.PORT_ETHERNET, args.rate, packets=packets)
+        for ip in robot_ips.values()
+    ]
+    slave_thread = _LoopThread("fake-tmsvr-slaves")
+    slave_thread.start()
+    for slave in slaves:
+        slave_thread.run(slave.start())
+
+    latencies = []
+    applied = 0
+    step_size = 1.0 / args.physics_rate
+
+    if mode == "legacy":
+        # The previous extension: one blocking receive thread per robot, one shared queue
+        # read once per physics step
+        motion_queue = queue.Queue(maxsize=len(robot_ips))
+        masters = [EthernetMaster(name, ip) for name, ip in robot_ips.items()]
+        for master in masters:
+            master.get_robot_model()
+        threads = [
+            threading.Thread(
+                target=master.receive_data, args=(motion_queue,), daemon=True
+            )
+            for master in masters
+        ]
+        for thread in threads:
+            thread.start()
+
+        def step():
+            nonlocal applied
+            try:
+                motion = motion_queue.get_nowait()
+            except queue.Empty:
+                return
+            # EthernetData.timestamp is the wall clock time of the receive
+            latencies.append(time.time() - motion.timestamp)
+            applied += 1
+
+        def stop():
+            for master in masters:
+                master.stop()
+            for thread in threads:
+                thread.join(timeout=0)
+
+    else:
+        if mode == "mailbox":
+            target = MotionMailbox(list(robot_ips))
+        else:
+            target = JointTrajectoryBuffer(list(robot_ips))
+        master_loop = TMSVRMasterLoop()
+        master_loop.start()
+
+        async def _add_all():
+            await asyncio.gather(
+                *(
+                    master_loop.add_master(TMSVRMaster(name, ip, target))
+                    for name, ip in robot_ips.items()
+                )
+            )
+
+        asyncio.run(_add_all())
+        last_sequences = {}
+
+        def step():
+            nonlocal applied
+            if mode == "mailbox":
+                motions = target.take_all()
+            else:
+                motions = [
+                    sample.frame
+                    for sample in target.sample_all(target.advance(step_size))
+                ]
+            now = time.monotonic()
+            for frame in motions:
+                # A frame counts once, at the first step that applies it
+                if last_sequences.get(frame.robot_name) == frame.sequence:
+                    continue
+                last_sequences[frame.robot_name] = frame.sequence
+                latencies.append(now - frame.timestamp)
+                applied += 1
+
+        def stop():
+            master_loop.stop()
+
+    # Physics steps on an absolute schedule, like the Kit physics callback
+    time.sleep(args.warmup)
+    latencies.clear()
+    applied = 0
+    sent = sum(slave.sent_count for slave in slaves)
+    start = next_step = time.monotonic()
+    while next_step - start < args.seconds:
+        step()
+        next_step += step_size
+        time.sleep(max(0.0, next_step - time.monotonic()))
+    elapsed = time.monotonic() - start
+    sent = sum(slave.sent_count for slave in slaves) - sent
+
+    stop()
+    for slave in slaves:
+        slave_thread.run(slave.stop())
+    slave_thread.stop()
+
+    return {
+        **result,
+        "sent_fps": sent / elapsed,
+        "fps": applied / elapsed,
+        **_percentiles(latencies),
+    }
+
+
+# ---- Vision ----
+
+
+async def _ticker(stalls: list[float], stop: asyncio.Event):
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(0.001)
+        now = time.perf_counter()
+        stalls.append(now - last - 0.001)
+        last = now
+
+
+def _make_cameras(count: int, resolution: tuple[int, int]) -> dict:
+    cameras = {}
+    for index in range(1, count + 1):
+        serial_number = f"VC{index:04d}"
+        prim_path = f"/World/Robot{index:02d}/camera"
+        cameras[serial_number] = DigitalCamera(
+            serial_number,
+            kit_stubs.FakeAnnotatorCamera(prim_path, resolution, seed=index),
+            HandeyeType.EIH,
+            kit_stubs.FakePrim(prim_path),
+        )
+    return cameras
+
+
+def measure_vision(mode: str, scene: str, args) -> dict:
+    result = {
+        "path": "vision",
+        "mode": mode,
+        "scene": scene,
+        "cameras": args.cameras,
+        "resolution": args.resolution,
+    }
+    if VirtualCameraServerSecure is None:
+        return {**result, "skipped": VISION_ERROR}
+
+    cameras = _make_cameras(
+        args.cameras, Resolution.get_resolution_by_key(args.resolution)
+    )
+    # TMflow runs on the same host, its cameras are registered under the loopback address
+    dg_cameras = {"127.0.0.1": cameras}
+    frame_index = 0
+
+    kit_loop = _LoopThread("kit-loop")
+    kit_loop.start()
+    stalls = []
+    stop_ticker = asyncio.Event()
+
+    async def _start():
+        if mode == "secure":
+            server = VirtualCameraServerSecure(queue.Queue(), dg_cameras)
+        else:
+            encoder = ImageEncoder(cache=ImageCache() if mode == "cached" else None)
+            server = VirtualCameraServer(
+                queue.Queue(), dg_cameras, encoder, frame_index=lambda: frame_index
+            )
+        asyncio.ensure_future(server.start())
+        asyncio.ensure_future(_ticker(stalls, stop_ticker))
+        return server
+
+    server = kit_loop.run(_start())
+
+    def _render():
+        nonlocal frame_index
+        frame_index += 1
+        for camera in cameras.values():
+            camera._camera.render()
+
+    def _client() -> dict:
+        client = FakeTMflowClient(port=args.camera_port)
+        client.connect()
+        try:
+            start = time.perf_counter()
+            client.load_camera_list()
+            load_camera_list = time.perf_counter() - start
+            connect_status = {
+                client.connect_camera(serial_number).name for serial_number in cameras
+            }
+
+            latencies = []
+            responses = []
+
+            def _grab_all(serial_number: str):
+                for _ in range(args.grabs):
+                    if scene == "moving":
+                        kit_loop.loop.call_soon_threadsafe(_render)
+                    start = time.perf_counter()
+                    responses.append(client.grab(serial_number))
+                    latencies.append(time.perf_counter() - start)
+
+            # One TMflow vision job per camera
+            threads = [
+                threading.Thread(target=_grab_all, args=(serial_number,))
+                for serial_number in cameras
+            ]
+            stalls.clear()
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            client.close()
+
+        return {
+            "fps": len(latencies) / elapsed,
+            **_percentiles(latencies),
+            "max_stall_ms": max(stalls) * 1000 if stalls else None,
+            "load_camera_list_ms": load_camera_list * 1000,
+            "connect_camera": sorted(connect_status),
+            "image_type": responses[-1].ImageType,
+            "kbytes": float(np.mean([len(r.EncodeString) for r in responses])) / 1024,
+        }
+
+    try:
+        measured = _client()
+    finally:
+
+        async def _stop():
+            stop_ticker.set()
+            await server.stop()
+
+        kit_loop.run(_stop())
+        kit_loop.stop()
+
+    return {**result, **measured}
+
+
+# ---- Report ----
+
+
+def get_extension_version() -> str:
+    text = (_bootstrap.EXTENSION_ROOT / "config" / "extension.toml").read_text()
+    match = re.search(r'^version\s*=\s*"([^"]+)"', text, re.MULTILINE)
+    return match.group(1) if match else None
+
+
+def get_git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=_bootstrap.REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    def _key(result):
+        return tuple(result.get(name) for name in RESULT_KEYS)
+
+    previous = {_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(_key(result))
+        if old is None or "skipped" in result or "skipped" in old:
+            continue
+        name = " ".join(str(value) for value in _key(result) if value is not None)
+        if old["fps"] and result["fps"] < old["fps"] * (1 - tolerance):
+            regressions.append(f"{name}: fps {old['fps']:.1f} -> {result['fps']:.1f}")
+        if old["p99_ms"] and result["p99_ms"] > old["p99_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p99 {old['p99_ms']:.1f} ms -> {result['p99_ms']:.1f} ms"
+            )
+    return regressions
+
+
+def _print_result(result: dict):
+    if "skipped" in result:
+        print(f"{result['path']:<6} {result['mode']:<10} skipped: {result['skipped']}")
+        return
+    if result["path"] == "motion":
+        print(
+            f"motion {result['mode']:<10} robots={result['robots']:<3}"
+            f" {result['fps']:>8.1f} frames/s (sent {result['sent_fps']:.1f})"
+            f" p50={result['p50_ms']:>7.1f}ms p99={result['p99_ms']:>7.1f}ms"
+        )
+    else:
+        print(
+            f"vision {result['mode']:<10} {result['scene']:<7} {result['resolution']:<4}"
+            f" cameras={result['cameras']:<2} {result['fps']:>8.1f} grabs/s"
+            f" p50={result['p50_ms']:>7.1f}ms p99={result['p99_ms']:>7.1f}ms"
+            f" stall={result['max_stall_ms']:>6.1f}ms {result['kbytes']:>6.0f} KiB"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paths", nargs="+", default=["motion", "vision"])
+    parser.add_argument("--motion-modes", nargs="+", default=list(MOTION_MODES))
+    parser.add_argument("--robots", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=125.0, help="slave frames/s")
+    parser.add_argument("--physics-rate", type=float, default=60.0)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--warmup", type=float, default=0.5)
+    parser.add_argument("--recording", help="TMSVR byte stream to replay")
+    parser.add_argument("--vision-modes", nargs="+", default=list(VISION_MODES))
+    parser.add_argument("--scenes", nargs="+", default=list(SCENES))
+    parser.add_argument("--cameras", type=int, default=2)
+    parser.add_argument("--resolution", default="5MP")
+    parser.add_argument("--grabs", type=int, default=20, help="grabs per camera")
+    parser.add_argument("--camera-port", type=int, default=9701)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--json", action="store_true", help="print the JSON report")
+    parser.add_argument("--baseline", help="JSON report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument(
+        "--metrics", action="store_true", help="add the service histograms"
+    )
+    args = parser.parse_args()
+
+    packets = _split_packets(load_recording(args.recording)) if args.recording else None
+    runs = []
+    if "motion" in args.paths:
+        runs += [(measure_motion, mode, args, packets) for mode in args.motion_modes]
+    if "vision" in args.paths:
+        runs += [
+            (measure_vision, mode, scene, args)
+            for mode in args.vision_modes
+            for scene in args.scenes
+        ]
+
+    results = []
+    # The compiled modules print to stdout, keep it for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        for measure, *measure_args in runs:
+            metrics.registry.clear()
+            result = measure(*measure_args)
+            if args.metrics and "skipped" not in result:
+                result["metrics"] = metrics.registry.snapshot()["metrics"]
+            results.append(result)
+
+    report = {
+        "extension_version": get_extension_version(),
+        "git_commit": get_git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "arguments": vars(args),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for result in results:
+            _print_result(result)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
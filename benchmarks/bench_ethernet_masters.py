@@ -0,0 +1,181 @@
+"""Thread, context switch and CPU cost of the Ethernet masters as robots are added.
+
+    python benchmarks/bench_ethernet_masters.py [--robots 1 2 4 8 16] [--seconds 3]
+
+Each robot connects to its own fake TMSVR slave (run in a child process). "threads" is the
+previous model, one blocking receive thread per robot; "asyncio" is TMSVRMasterLoop.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import resource
+import socket
+import threading
+import time
+
+import _bootstrap
+
+_bootstrap.install_package_paths()
+_bootstrap.install_constants_fallback()
+
+# isort: off
+from fake_tmsvr_slave import FakeTMSVRSlave  # noqa: E402
+from tmrobot.digital_robot.services.motion_mailbox import MotionMailbox  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr import TMSVRStreamParser  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr_master import TMSVRMaster  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr_master import TMSVRMasterLoop  # noqa: E402
+
+# isort: on
+
+
+def _serve_slaves(count: int, rate: float, ports, ready):
+    async def _main():
+        slaves = [FakeTMSVRSlave(rate=rate) for _ in range(count)]
+        for slave in slaves:
+            await slave.start()
+        ports.extend([slave.port for slave in slaves])
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(_main())
+
+
+def run_threads(ports: list[int], mailbox: MotionMailbox, seconds: float) -> float:
+    running = True
+    sockets = [socket.create_connection(("127.0.0.1", port)) for port in ports]
+
+    def _receive(index: int, sock: socket.socket):
+        parser = TMSVRStreamParser(f"Robot{index:02d}")
+        while running:
+            try:
+                if parser.recv_from(sock) == 0:
+                    break
+            except OSError:
+                break
+            for frame in parser.frames():
+                mailbox.put(frame)
+
+    threads = [
+        threading.Thread(target=_receive, args=(index, sock))
+        for index, sock in enumerate(sockets, start=1)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+
+    start = time.perf_counter()
+    running = False
+    for sock in sockets:
+        sock.shutdown(socket.SHUT_RDWR)
+        sock.close()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def run_asyncio(ports: list[int], mailbox: MotionMailbox, seconds: float) -> float:
+    master_loop = TMSVRMasterLoop()
+    master_loop.start()
+
+    async def _add_all():
+        await asyncio.gather(
+            *(
+                master_loop.add_master(
+                    TMSVRMaster(f"Robot{index:02d}", "127.0.0.1", mailbox, port=port)
+                )
+                for index, port in enumerate(ports, start=1)
+            )
+        )
+
+    asyncio.run(_add_all())
+    time.sleep(seconds)
+
+    start = time.perf_counter()
+    master_loop.stop()
+    return time.perf_counter() - start
+
+
+def measure(mode: str, robots: int, rate: float, seconds: float) -> dict:
+    manager = multiprocessing.Manager()
+    ports = manager.list()
+    ready = manager.Event()
+    slaves = multiprocessing.Process(
+        target=_serve_slaves, args=(robots, rate, ports, ready), daemon=True
+    )
+    slaves.start()
+    ready.wait()
+
+    mailbox = MotionMailbox([f"Robot{index:02d}" for index in range(1, robots + 1)])
+    run = run_threads if mode == "threads" else run_asyncio
+    threads_before = threading.active_count()
+    peak_threads = threads_before
+
+    def _sample_threads():
+        nonlocal peak_threads
+        while sampling:
+            peak_threads = max(peak_threads, threading.active_count())
+            time.sleep(0.1)
+
+    sampling = True
+    sampler = threading.Thread(target=_sample_threads)
+    sampler.start()
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = time.process_time()
+    shutdown = run(list(ports), mailbox, seconds)
+    cpu = time.process_time() - cpu
+    after = resource.getrusage(resource.RUSAGE_SELF)
+
+    sampling = False
+    sampler.join()
+    slaves.terminate()
+    manager.shutdown()
+
+    received = sum(stats["received"] for stats in mailbox.get_stats().values())
+    switches = (after.ru_nvcsw - usage.ru_nvcsw) + (after.ru_nivcsw - usage.ru_nivcsw)
+    return {
+        "mode": mode,
+        "robots": robots,
+        "frames_per_second": received / seconds,
+        "extra_threads": peak_threads - threads_before - 1,  # minus the sampler
+        "context_switches_per_second": switches / seconds,
+        "cpu_percent": cpu / seconds * 100,
+        "shutdown_ms": shutdown * 1000,
+        "threads_left": threading.active_count() - threads_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--robots", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--rate", type=float, default=125.0)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = [
+        measure(mode, robots, args.rate, args.seconds)
+        for robots in args.robots
+        for mode in ("threads", "asyncio")
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(
+            f"{result['mode']:<8} robots={result['robots']:<3}"
+            f" {result['frames_per_second']:>8,.0f} frames/s"
+            f" threads={result['extra_threads']:<3}"
+            f" {result['context_switches_per_second']:>8,.0f} ctx switches/s"
+            f" cpu={result['cpu_percent']:>5.1f}%"
+            f" shutdown={result['shutdown_ms']:>6.1f}ms"
+            f" left={result['threads_left']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
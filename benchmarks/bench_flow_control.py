@@ -0,0 +1,188 @@
+"""Motion flow between a TMSVR master and the physics step, with and without FlowController.
+
+    python benchmarks/bench_flow_control.py [--seconds 4] [--scenarios real-time lagging starved]
+
+A fake TMSVR slave (child process) streams frames to a TMSVRMaster and a simulated physics
+step of 1/60 s takes them from a JointTrajectoryBuffer ("trajectory") or a MotionMailbox
+("mailbox"). "real-time" steps at 60 Hz with a 125 Hz slave, "lagging" steps at half real
+time and "starved" gets a 20 Hz slave. Reported are the health FlowController reported,
+the frames parsed and skipped by decimation per second, the parse time per second, and
+per source: the spread of the trajectory sample time per step (coefficient of variation,
+0 is evenly spaced) and the clock snaps back to wall time, or the mean age of applied
+mailbox frames and the overwritten frames per second.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+
+import _bootstrap
+import numpy as np
+
+_bootstrap.install_package_paths()
+_bootstrap.install_constants_fallback()
+
+# isort: off
+from fake_tmsvr_slave import FakeTMSVRSlave  # noqa: E402
+from tmrobot.digital_robot.services.flow_control import FlowController  # noqa: E402
+from tmrobot.digital_robot.services.motion_mailbox import MotionMailbox  # noqa: E402
+from tmrobot.digital_robot.services.trajectory_buffer import (  # noqa: E402
+    JointTrajectoryBuffer,
+)
+from tmrobot.digital_robot.services.tmsvr_master import TMSVRMaster  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr_master import TMSVRMasterLoop  # noqa: E402
+
+# isort: on
+
+ROBOT = "Robot01"
+STEP_SIZE = 1 / 60
+# [scenario] slave rate, real time factor of the physics
+SCENARIOS = {
+    "real-time": (125.0, 1.0),
+    "lagging": (125.0, 0.5),
+    "starved": (20.0, 1.0),
+}
+SOURCES = ("trajectory", "mailbox")
+MODES = ("off", "flow")
+
+
+def _serve_slave(rate: float, port, ready):
+    async def _main():
+        slave = FakeTMSVRSlave(rate=rate)
+        await slave.start()
+        port.value = slave.port
+        ready.set()
+        await asyncio.Event().wait()
+
+    asyncio.run(_main())
+
+
+def measure(scenario: str, source_name: str, mode: str, args) -> dict:
+    slave_rate, real_time_factor = SCENARIOS[scenario]
+    port = multiprocessing.Value("i", 0)
+    ready = multiprocessing.Event()
+    slave = multiprocessing.Process(
+        target=_serve_slave, args=(slave_rate, port, ready), daemon=True
+    )
+    slave.start()
+    ready.wait()
+
+    if source_name == "trajectory":
+        source = JointTrajectoryBuffer([ROBOT])
+    else:
+        source = MotionMailbox([ROBOT])
+    master = TMSVRMaster(ROBOT, "127.0.0.1", source, port=port.value)
+    # The histogram of the robot is shared by every run
+    parse_before = master._parse_seconds.to_dict()["sum"]
+    master_loop = TMSVRMasterLoop()
+    master_loop.start()
+
+    async def _add():
+        await master_loop.add_master(master)
+
+    asyncio.run(_add())
+
+    controller = None
+    if mode == "flow":
+        controller = FlowController({ROBOT: master}, source)
+
+    clocks = []
+    snaps = 0
+    wall_step = STEP_SIZE / real_time_factor
+    start = time.monotonic()
+    next_step = start
+    while time.monotonic() - start < args.seconds:
+        if source_name == "trajectory":
+            previous = source._clock
+            clock = source.advance(STEP_SIZE)
+            if previous is not None and clock != previous + STEP_SIZE * (
+                source.time_scale
+            ):
+                snaps += 1
+            source.sample_all(clock)
+            clocks.append(clock)
+        else:
+            source.take_all()
+        if controller is not None:
+            controller.step(STEP_SIZE)
+        next_step += wall_step
+        time.sleep(max(0.0, next_step - time.monotonic()))
+    elapsed = time.monotonic() - start
+
+    parse_seconds = master._parse_seconds.to_dict()["sum"] - parse_before
+    master_loop.stop()
+    slave.terminate()
+    slave.join()
+
+    stats = source.get_stats()[ROBOT]
+    result = {
+        "scenario": scenario,
+        "source": source_name,
+        "mode": mode,
+        "health": controller.get_stats()[ROBOT]["health"] if controller else "-",
+        "parsed_per_s": master.receive_count / elapsed,
+        "skipped_per_s": master.parser.skip_count / elapsed,
+        "parse_ms_per_s": parse_seconds / elapsed * 1e3,
+    }
+    if source_name == "trajectory":
+        steps = np.diff(clocks)
+        result.update(
+            {
+                "sample_step_cv": float(np.std(steps) / np.mean(steps)),
+                "snaps": snaps,
+                "underruns": stats["underruns"],
+                "latency_ms": source.latency * 1e3,
+            }
+        )
+    else:
+        result.update(
+            {
+                "mean_age_ms": stats["mean_age_ms"],
+                "overwrites_per_s": stats["overwrites"] / elapsed,
+            }
+        )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=4.0)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS))
+    parser.add_argument("--sources", nargs="+", default=list(SOURCES))
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = [
+        measure(scenario, source, mode, args)
+        for scenario in args.scenarios
+        for source in args.sources
+        for mode in MODES
+    ]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        line = (
+            f"{result['scenario']:<9} {result['source']:<10} {result['mode']:<4}"
+            f" health={result['health']:<8} parsed={result['parsed_per_s']:.0f}/s"
+            f" skipped={result['skipped_per_s']:.0f}/s"
+            f" parse={result['parse_ms_per_s']:.2f}ms/s"
+        )
+        if result["source"] == "trajectory":
+            line += (
+                f" sample_step_cv={result['sample_step_cv']:.3f} snaps={result['snaps']}"
+                f" underruns={result['underruns']} latency={result['latency_ms']:.0f}ms"
+            )
+        else:
+            line += (
+                f" age={result['mean_age_ms']:.1f}ms"
+                f" overwrites={result['overwrites_per_s']:.0f}/s"
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
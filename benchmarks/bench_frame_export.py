@@ -0,0 +1,203 @@
+"""Camera frames delivered to a vision process on the same host: JPEG versus the frame ring.
+
+    python benchmarks/bench_frame_export.py [--resolution 5MP] [--seconds 3] [--rate 0]
+
+A producer renders a changing frame of a fake camera as fast as possible (or at --rate
+frames/s) and a consumer process reads every frame it can as a NumPy array. "jpeg" is the
+getGrabImageData path without the gRPC transport: the frame is encoded as JPEG at
+--quality, sent through a pipe and decoded by the consumer. "ring" is FramePublisher: the
+raw frame is written to a frame ring and read zero-copy by FrameRingReader. Reported are
+the producer time per frame, frames the consumer got per second, the latency from reading
+the frame to the consumer having its pixels, and the largest and mean pixel error of every
+10th frame against the rendered one. Needs Kit's Python 3.10.
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+import _bootstrap
+import kit_stubs
+import numpy as np
+from PIL import Image
+
+_bootstrap.install_package_paths()
+kit_stubs.install()
+
+# isort: off
+from bench_end_to_end import _make_cameras  # noqa: E402
+from tmrobot.digital_robot.models.digital_camera import Resolution  # noqa: E402
+from tmrobot.digital_robot.services import image_encoder  # noqa: E402
+from tmrobot.digital_robot.services.frame_publisher import FramePublisher  # noqa: E402
+from tmrobot.digital_robot.services.frame_ring import FrameRingReader  # noqa: E402
+
+# isort: on
+
+MODES = ("jpeg", "ring")
+CHECK_EVERY = 10
+# A camera 1 m above the table looking down
+POSE = np.array(
+    [[1, 0, 0, 0], [0, -1, 0, 0], [0, 0, -1, 0], [0, 0, 1, 1]], dtype=np.float64
+)
+
+
+class _Publisher(FramePublisher):
+    # The stubbed USD has no transforms
+    def _get_pose(self, camera) -> np.ndarray:
+        return POSE
+
+
+def _consume(mode: str, source, resolution, stop, results):
+    # source: the pipe of "jpeg", the ring path of "ring"
+    first_frame = kit_stubs.FakeAnnotatorCamera("", resolution, seed=1).frame
+    latencies, max_errors, mean_errors = [], [], []
+    frames = skipped = 0
+    reader = None
+    last = 0
+    while not stop.is_set() or (mode == "jpeg" and source.poll()):
+        if mode == "jpeg":
+            if not source.poll(0.1):
+                continue
+            timestamp, frame_index, data = source.recv()
+            rgb = np.asarray(Image.open(io.BytesIO(data)))
+        else:
+            if reader is None:
+                if not os.path.exists(source):
+                    time.sleep(0.001)
+                    continue
+                try:
+                    reader = FrameRingReader(source)
+                except ValueError:
+                    # Created by the first publish, the header follows
+                    continue
+            frame = reader.wait(after=last, timeout=0.1)
+            if frame is None:
+                continue
+            skipped += frame.sequence - last - 1
+            last = frame.sequence
+            timestamp, frame_index, rgb = frame.timestamp, frame.frame_index, frame.rgb
+        latencies.append(time.time() - timestamp)
+        frames += 1
+        if frames % CHECK_EVERY == 1:
+            # Copied first, the frame is only compared if the ring didn't overwrite it
+            rgb = rgb.astype(np.int16)
+            if mode == "ring" and not (frame.is_valid() and (frame.pose == POSE).all()):
+                continue
+            # The fake camera shifts its first frame by one row per render
+            error = np.abs(rgb - np.roll(first_frame, frame_index, axis=0))
+            max_errors.append(int(error.max()))
+            mean_errors.append(float(error.mean()))
+    results.put(
+        {
+            "frames": frames,
+            "skipped": skipped,
+            "latencies": latencies,
+            "max_errors": max_errors,
+            "mean_errors": mean_errors,
+        }
+    )
+
+
+def measure(mode: str, args) -> dict:
+    resolution = Resolution.get_resolution_by_key(args.resolution)
+    camera = _make_cameras(1, resolution)["VC0001"]
+    directory = tempfile.mkdtemp(prefix="bench_frames_")
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    frame_index = 0
+
+    if mode == "jpeg":
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        source = receiver
+        backend = image_encoder.resolve_backend(args.backend)
+
+        def _produce():
+            rgb = image_encoder.copy_frame(camera._camera.get_rgb())
+            data = image_encoder.encode_frame(rgb, "jpg", args.quality, backend)
+            sender.send((time.time(), frame_index, data))
+
+    else:
+        publisher = _Publisher(directory, frame_index=lambda: frame_index)
+        source = publisher.add_camera("Robot01", camera)
+
+        def _produce():
+            publisher.publish()
+
+    consumer = multiprocessing.Process(
+        target=_consume, args=(mode, source, resolution, stop, results), daemon=True
+    )
+    consumer.start()
+
+    produce_seconds = []
+    interval = 1.0 / args.rate if args.rate else 0.0
+    start = time.perf_counter()
+    next_frame = start
+    while time.perf_counter() - start < args.seconds:
+        frame_index += 1
+        camera._camera.render()
+        produce_start = time.perf_counter()
+        _produce()
+        produce_seconds.append(time.perf_counter() - produce_start)
+        next_frame += interval
+        time.sleep(max(0.0, next_frame - time.perf_counter()))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    consumed = results.get(timeout=30)
+    consumer.join()
+    if mode == "ring":
+        publisher.close()
+    os.rmdir(directory)
+
+    latencies_ms = np.array(consumed["latencies"] or [np.nan]) * 1e3
+    return {
+        "mode": mode,
+        "resolution": args.resolution,
+        "produced": len(produce_seconds),
+        "produce_ms": float(np.median(produce_seconds)) * 1e3,
+        "consumed": consumed["frames"],
+        "consumed_fps": consumed["frames"] / elapsed,
+        "skipped": consumed["skipped"],
+        "latency_p50_ms": float(np.percentile(latencies_ms, 50)),
+        "latency_p99_ms": float(np.percentile(latencies_ms, 99)),
+        "checked": len(consumed["max_errors"]),
+        "max_error": max(consumed["max_errors"], default=None),
+        "mean_error": float(np.mean(consumed["mean_errors"] or [np.nan])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--resolution", default="5MP")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument(
+        "--rate", type=float, default=0.0, help="0: as fast as possible"
+    )
+    parser.add_argument("--quality", type=int, default=50)
+    parser.add_argument("--backend", default="auto")
+    parser.add_argument("--modes", nargs="+", default=list(MODES))
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = [measure(mode, args) for mode in args.modes]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(
+            f"{result['mode']:<5} {result['resolution']} produced={result['produced']}"
+            f" produce={result['produce_ms']:.2f}ms consumed={result['consumed']}"
+            f" ({result['consumed_fps']:.1f}/s, skipped {result['skipped']})"
+            f" latency p50={result['latency_p50_ms']:.2f}ms"
+            f" p99={result['latency_p99_ms']:.2f}ms error max={result['max_error']}"
+            f" mean={result['mean_error']:.2f} ({result['checked']} frames)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Grab latency and event loop stall of image encoding at every camera Resolution.
+
+    python benchmarks/bench_image_encoding.py [--grabs 20] [--cameras 2] [--quality 50]
+
+"inline" encodes on the event loop like DigitalCamera.get_jpg; "pool" awaits ImageEncoder,
+one row per installed JPEG backend plus PNG; "cached" grabs the same frame again through an
+ImageCache. The stall column is the longest time a 1 ms ticker task on the same loop was
+kept from running, i.e. what rendering and physics see.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import _bootstrap
+import numpy as np
+
+_bootstrap.install_package_paths()
+
+# isort: off
+from tmrobot.digital_robot.services import image_encoder  # noqa: E402
+from tmrobot.digital_robot.services.image_cache import ImageCache  # noqa: E402
+
+# isort: on
+
+# Sensor sizes of the DigitalCamera Resolution options
+RESOLUTIONS = {
+    "1MP": (1280, 960),
+    "5MP": (2592, 1944),
+    "12MP": (4096, 3000),
+}
+
+
+def make_frame(width: int, height: int) -> np.ndarray:
+    # RGBA like the annotator output, smooth gradients with some sensor noise
+    y, x = np.mgrid[0:height, 0:width]
+    rng = np.random.default_rng(0)
+    frame = np.empty((height, width, 4), dtype=np.uint8)
+    frame[:, :, 0] = (x * 255 // width).astype(np.uint8)
+    frame[:, :, 1] = (y * 255 // height).astype(np.uint8)
+    frame[:, :, 2] = ((x + y) % 256).astype(np.uint8)
+    frame[:, :, :3] += rng.integers(0, 8, (height, width, 3), dtype=np.uint8)
+    frame[:, :, 3] = 255
+    return frame
+
+
+async def _ticker(stalls: list[float], stop: asyncio.Event):
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(0.001)
+        now = time.perf_counter()
+        stalls.append(now - last - 0.001)
+        last = now
+
+
+async def _run(grab, frame: np.ndarray, grabs: int, cameras: int) -> dict:
+    latencies = []
+    stalls = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(stalls, stop))
+    await asyncio.sleep(0.01)
+
+    async def _camera():
+        for _ in range(grabs):
+            start = time.perf_counter()
+            size = len(await grab(frame))
+            latencies.append(time.perf_counter() - start)
+            # Give the ticker a turn between grabs, like separate gRPC requests
+            await asyncio.sleep(0)
+        return size
+
+    sizes = await asyncio.gather(*(_camera() for _ in range(cameras)))
+    stop.set()
+    await ticker
+
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "p99_ms": float(np.percentile(latencies, 99)) * 1000,
+        "max_stall_ms": max(stalls) * 1000,
+        "kbytes": sizes[0] / 1024,
+    }
+
+
+def measure(resolution: str, args) -> list[dict]:
+    frame = make_frame(*RESOLUTIONS[resolution])
+    results = []
+
+    async def _inline(rgb):
+        return image_encoder.encode_frame(
+            image_encoder.copy_frame(rgb), quality=args.quality
+        )
+
+    runs = [("inline", "pil", _inline, None)]
+    for backend in image_encoder.get_available_backends():
+        encoder = image_encoder.ImageEncoder(
+            quality=args.quality, backend=backend, workers=args.workers
+        )
+        runs.append(("pool", backend, encoder.encode, encoder))
+    png_encoder = image_encoder.ImageEncoder(
+        image_type=image_encoder.IMAGE_TYPE_PNG, workers=args.workers
+    )
+    runs.append(("pool", "png", png_encoder.encode, png_encoder))
+    # Repeated grabs of an unchanged frame only pay for the copy and the digest
+    cached_encoder = image_encoder.ImageEncoder(
+        quality=args.quality, workers=args.workers, cache=ImageCache()
+    )
+    runs.append(
+        ("cached", cached_encoder.backend, cached_encoder.encode, cached_encoder)
+    )
+
+    for mode, backend, grab, encoder in runs:
+        result = asyncio.run(_run(grab, frame, args.grabs, args.cameras))
+        results.append(
+            {"resolution": resolution, "mode": mode, "backend": backend, **result}
+        )
+        if encoder is not None:
+            encoder.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS))
+    parser.add_argument("--grabs", type=int, default=20, help="grabs per camera")
+    parser.add_argument("--cameras", type=int, default=2, help="concurrent cameras")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--quality", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = [
+        result
+        for resolution in args.resolutions
+        for result in measure(resolution, args)
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(
+            f"{result['resolution']:<5} {result['mode']:<7} {result['backend']:<11}"
+            f" p50={result['p50_ms']:>7.1f}ms p99={result['p99_ms']:>7.1f}ms"
+            f" stall={result['max_stall_ms']:>7.1f}ms {result['kbytes']:>8.0f} KiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
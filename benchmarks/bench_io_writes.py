@@ -0,0 +1,173 @@
+"""Cost of DI writes for the physics step and packets on the wire, before and after merging.
+
+    python benchmarks/bench_io_writes.py [--robots 4] [--seconds 3] [--writes-per-step 4]
+
+A physics thread steps at --physics-rate and toggles --writes-per-step DIs of every robot per
+step, each robot connected to a fake TMSVR slave (run in a child process). "per-call" is the
+former `_write_threadsafe`: a packet with a new UUID per write, handed to the master loop
+with `call_soon_threadsafe`. "merged" is IOCommandChannel: `set_end_di` per write and one
+`flush_io` per step. Reported are the time the physics thread spends per step, packets sent
+and, for "merged", the acknowledgment round trip.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import multiprocessing
+import time
+import uuid
+
+import _bootstrap
+import numpy as np
+
+_bootstrap.install_package_paths()
+_bootstrap.install_constants_fallback()
+
+# isort: off
+from bench_ethernet_masters import _serve_slaves  # noqa: E402
+from tmrobot.digital_robot.services import metrics  # noqa: E402
+from tmrobot.digital_robot.services.motion_mailbox import MotionMailbox  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr import MODE_STRING  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr import build_packet  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr_master import TMSVRMaster  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr_master import TMSVRMasterLoop  # noqa: E402
+
+# isort: on
+
+MODES = ("per-call", "merged")
+
+
+class _PerCallMaster(TMSVRMaster):
+    # The DI write path before IOCommandChannel
+    packet_count = 0
+
+    def set_end_di(self, index: int, value: int):
+        packet = build_packet(
+            base64.urlsafe_b64encode(uuid.uuid4().bytes)[:8].decode(),
+            MODE_STRING,
+            f"End_DI[{index}]={value}",
+        )
+        self._loop.call_soon_threadsafe(self._write, packet)
+
+    def flush_io(self):
+        pass
+
+    def _write(self, packet: bytes):
+        if self.connected:
+            self._transport.write(packet)
+            self.packet_count += 1
+
+
+def measure(mode: str, args) -> dict:
+    manager = multiprocessing.Manager()
+    ports = manager.list()
+    ready = manager.Event()
+    slaves = multiprocessing.Process(
+        target=_serve_slaves,
+        args=(args.robots, args.rate, ports, ready),
+        daemon=True,
+    )
+    slaves.start()
+    ready.wait()
+
+    metrics.registry.clear()
+    robot_names = [f"Robot{index:02d}" for index in range(1, args.robots + 1)]
+    mailbox = MotionMailbox(robot_names)
+    master_class = _PerCallMaster if mode == "per-call" else TMSVRMaster
+    masters = [
+        master_class(name, "127.0.0.1", mailbox, port=port)
+        for name, port in zip(robot_names, ports)
+    ]
+    master_loop = TMSVRMasterLoop()
+    master_loop.start()
+
+    async def _add_all():
+        await asyncio.gather(*(master_loop.add_master(master) for master in masters))
+
+    asyncio.run(_add_all())
+
+    # The physics step: a few DI writes per robot, then the end-of-step flush
+    step_size = 1.0 / args.physics_rate
+    step_seconds = []
+    next_step = time.monotonic()
+    end = next_step + args.seconds
+    step = 0
+    while next_step < end:
+        start = time.perf_counter()
+        for master in masters:
+            for index in range(args.writes_per_step):
+                master.set_end_di(index % 4, (step + index) % 2)
+            master.flush_io()
+        step_seconds.append(time.perf_counter() - start)
+        step += 1
+        next_step += step_size
+        time.sleep(max(0.0, next_step - time.monotonic()))
+
+    # Let the last acknowledgments arrive
+    time.sleep(0.2)
+    master_loop.stop()
+    slaves.terminate()
+    manager.shutdown()
+
+    writes = step * args.robots * args.writes_per_step
+    step_us = np.array(step_seconds) * 1e6
+    result = {
+        "mode": mode,
+        "robots": args.robots,
+        "steps": step,
+        "writes": writes,
+        "step_p50_us": float(np.percentile(step_us, 50)),
+        "step_p99_us": float(np.percentile(step_us, 99)),
+    }
+    if mode == "per-call":
+        result["packets"] = sum(master.packet_count for master in masters)
+        return result
+
+    rtt = [
+        metrics.registry.histogram("digital_robot_tmsvr_io_rtt_seconds", robot=name)
+        for name in robot_names
+    ]
+    result.update(
+        packets=sum(master.io.sent_count for master in masters),
+        acknowledged=sum(master.io.ack_count for master in masters),
+        timeouts=sum(master.io.timeout_count for master in masters),
+        rtt_p50_ms=float(np.median([histogram.quantile(0.5) for histogram in rtt]))
+        * 1e3,
+        rtt_p99_ms=float(max(histogram.quantile(0.99) for histogram in rtt)) * 1e3,
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--robots", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=125.0, help="slave frames/s")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--physics-rate", type=float, default=60.0)
+    parser.add_argument("--writes-per-step", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", default=list(MODES))
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = [measure(mode, args) for mode in args.modes]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        line = (
+            f"{result['mode']:<9} robots={result['robots']} writes={result['writes']}"
+            f" step p50={result['step_p50_us']:.1f}us p99={result['step_p99_us']:.1f}us"
+            f" packets={result['packets']}"
+        )
+        if "acknowledged" in result:
+            line += (
+                f" acked={result['acknowledged']} timeouts={result['timeouts']}"
+                f" rtt p50={result['rtt_p50_ms']:.2f}ms p99={result['rtt_p99_ms']:.2f}ms"
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
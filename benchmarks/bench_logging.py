@@ -0,0 +1,225 @@
+"""Cost of logging for the thread that logs, before and after the log pipeline.
+
+    python benchmarks/bench_logging.py [--calls 20000] [--grpc-calls 2000]
+
+"legacy" is the former _console: strftime, print and logger.info with the handlers on the
+calling thread. "pipeline" is LogPipeline: `logger.info(..., extra=CONSOLE)` with lazy
+`%`-formatting, rate limiting and the handlers on a background thread. The "distinct"
+workload logs a different DI write every call, "repeated" the same warning every call.
+A file handler stands in for Kit's log and stdout is written to a file. With the compiled
+virtual camera server (Kit's Python 3.10) getGain is also timed with and without the
+request and response dumps.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import _bootstrap
+import kit_stubs
+import numpy as np
+
+_bootstrap.install_package_paths()
+kit_stubs.install()
+
+# isort: off
+from tmrobot.digital_robot.services.log_pipeline import (  # noqa: E402
+    CONSOLE,
+    LogPipeline,
+)
+
+# isort: on
+
+MODES = ("legacy", "pipeline")
+WORKLOADS = ("distinct", "repeated")
+
+logger = logging.getLogger("tmrobot.digital_robot.services.tmsvr_master")
+
+
+def _legacy_console(message: str):
+    current_time = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+    print(f"{current_time} [Info] [tmrobot.digital_robot] {message}")
+    logger.info(message)
+
+
+def _log_call(mode: str, workload: str):
+    if workload == "repeated":
+        if mode == "legacy":
+            return lambda index: logger.warning(
+                f"Robot01: not connected, drop Ctrl_DI[{0}]"
+            )
+        return lambda index: logger.warning(
+            "%s: not connected, drop %s[%s]", "Robot01", "Ctrl_DI", 0
+        )
+
+    if mode == "legacy":
+        return lambda index: _legacy_console(
+            f"Robot01: Set Ctrl_DI[{index % 16}]={index}"
+        )
+    return lambda index: logger.info(
+        "%s: Set %s[%s]=%s", "Robot01", "Ctrl_DI", index % 16, index, extra=CONSOLE
+    )
+
+
+def _count_lines(*paths: str) -> int:
+    lines = 0
+    for path in paths:
+        with open(path, "rb") as file:
+            lines += sum(1 for _ in file)
+    return lines
+
+
+def measure(mode: str, workload: str, args) -> dict:
+    directory = tempfile.mkdtemp(prefix="bench-logging-")
+    log_path = os.path.join(directory, "kit.log")
+    stdout_path = os.path.join(directory, "stdout.log")
+
+    root = logging.getLogger()
+    kit_log = logging.FileHandler(log_path)
+    kit_log.setFormatter(
+        logging.Formatter("%(asctime)s [%(levelname)s] [%(name)s] %(message)s")
+    )
+    root.addHandler(kit_log)
+    root.setLevel(logging.INFO)
+
+    log = _log_call(mode, workload)
+    durations = np.empty(args.calls)
+    with open(stdout_path, "w") as stdout, contextlib.redirect_stdout(stdout):
+        pipeline = LogPipeline(rate_limit_interval=args.rate_limit)
+        if mode == "pipeline":
+            pipeline.start()
+
+        start = time.perf_counter()
+        for index in range(args.calls):
+            call_start = time.perf_counter()
+            log(index)
+            durations[index] = time.perf_counter() - call_start
+        elapsed = time.perf_counter() - start
+
+        # Includes writing everything still queued
+        pipeline.stop()
+        drained = time.perf_counter() - start
+
+    root.removeHandler(kit_log)
+    kit_log.close()
+    durations *= 1e6
+    return {
+        "mode": mode,
+        "workload": workload,
+        "calls": args.calls,
+        "call_p50_us": float(np.percentile(durations, 50)),
+        "call_p99_us": float(np.percentile(durations, 99)),
+        "call_max_us": float(durations.max()),
+        "caller_total_ms": elapsed * 1000,
+        "drained_ms": drained * 1000,
+        "lines_written": _count_lines(log_path, stdout_path),
+    }
+
+
+def measure_grpc(args) -> list[dict]:
+    try:
+        from google.protobuf import json_format
+
+        from tmrobot.digital_robot.grpcs import VirtualCameraAPI_pb2
+        from tmrobot.digital_robot.services import virtual_camera_server
+        from tmrobot.digital_robot.services import virtual_camera_server_secure
+    except ImportError as e:
+        return [{"mode": "grpc", "skipped": str(e)}]
+
+    class _Context:
+        def peer(self):
+            return "ipv4:127.0.0.1:50000"
+
+        def set_code(self, code):
+            pass
+
+        def set_details(self, details):
+            pass
+
+    class _Camera:
+        def get_serial_number(self):
+            return "VC0001"
+
+        def get_gain(self):
+            return 1.0
+
+    server = virtual_camera_server_secure.VirtualCameraServerSecure(None, {})
+    server._find_camera_by_ip_sn = lambda ip, serial_number: _Camera()
+    request = VirtualCameraAPI_pb2.CameraSerialNumberRequest(SerialNumber="VC0001")
+    context = _Context()
+    logging.getLogger().handlers.clear()
+
+    results = []
+    for mode, message_to_json in (
+        ("grpc with dumps", json_format.MessageToJson),
+        ("grpc debug only", virtual_camera_server._message_to_json),
+    ):
+        virtual_camera_server_secure.MessageToJson = message_to_json
+
+        async def _calls():
+            durations = np.empty(args.grpc_calls)
+            for index in range(args.grpc_calls):
+                start = time.perf_counter()
+                await server.getGain(request, context)
+                durations[index] = time.perf_counter() - start
+            return durations * 1e6
+
+        durations = asyncio.run(_calls())
+        results.append(
+            {
+                "mode": mode,
+                "calls": args.grpc_calls,
+                "call_p50_us": float(np.percentile(durations, 50)),
+                "call_p99_us": float(np.percentile(durations, 99)),
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--grpc-calls", type=int, default=2000)
+    parser.add_argument("--rate-limit", type=float, default=1.0)
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = [
+        measure(mode, workload, args) for workload in WORKLOADS for mode in MODES
+    ]
+    results += measure_grpc(args)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        if "skipped" in result:
+            print(f"{result['mode']:<16} skipped: {result['skipped']}")
+        elif "workload" in result:
+            print(
+                f"{result['mode']:<16} {result['workload']:<9}"
+                f" call p50={result['call_p50_us']:>6.2f}us"
+                f" p99={result['call_p99_us']:>7.2f}us"
+                f" max={result['call_max_us']:>8.1f}us"
+                f" caller={result['caller_total_ms']:>7.1f}ms"
+                f" drained={result['drained_ms']:>7.1f}ms"
+                f" lines={result['lines_written']}"
+            )
+        else:
+            print(
+                f"{result['mode']:<16} getGain   "
+                f" call p50={result['call_p50_us']:>6.2f}us"
+                f" p99={result['call_p99_us']:>7.2f}us"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Record TMSVR motion to motion logs and replay them without a controller.
+
+    python benchmarks/bench_motion_replay.py [--robots 4] [--seconds 5] [--speeds 1 10 0]
+    python benchmarks/bench_motion_replay.py --logs recordings/20250314-101500 --speeds 0
+
+Without --logs, fake TMSVR slaves (one per robot, in a child process) stream for --seconds
+through TMSVRMasterLoop with a MotionLogRecorder, which reports the append cost per frame
+and the log size per frame. Each replay then feeds the logs into a
+MotionMailbox at --speeds (0 is as fast as possible), like the extension does: up to speed 1
+with MotionReplay.run while a physics step thread takes the frames at --physics-rate, faster
+in lockstep, one MotionReplay.step per physics step and the steps paced to the replay speed.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+import _bootstrap
+
+_bootstrap.install_package_paths()
+_bootstrap.install_constants_fallback()
+
+# isort: off
+from bench_ethernet_masters import _serve_slaves  # noqa: E402
+from tmrobot.digital_robot.services.motion_log import (  # noqa: E402
+    MotionLogRecorder,
+    MotionReplay,
+    find_motion_logs,
+)
+from tmrobot.digital_robot.services.motion_mailbox import MotionMailbox  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr_master import TMSVRMaster  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr_master import TMSVRMasterLoop  # noqa: E402
+
+# isort: on
+
+
+class _TimedRecorder(MotionLogRecorder):
+    def __init__(self, directory: str):
+        super().__init__(directory)
+        self.append_seconds = 0.0
+
+    def append(self, frame):
+        start = time.perf_counter()
+        super().append(frame)
+        self.append_seconds += time.perf_counter() - start
+
+
+def record(directory: str, args) -> dict:
+    manager = multiprocessing.Manager()
+    ports = manager.list()
+    ready = manager.Event()
+    slaves = multiprocessing.Process(
+        target=_serve_slaves,
+        args=(args.robots, args.rate, ports, ready),
+        daemon=True,
+    )
+    slaves.start()
+    ready.wait()
+
+    robot_names = [f"Robot{index:02d}" for index in range(1, args.robots + 1)]
+    mailbox = MotionMailbox(robot_names)
+    recorder = _TimedRecorder(directory)
+    masters = [
+        TMSVRMaster(name, "127.0.0.1", mailbox, port=port, recorder=recorder)
+        for name, port in zip(robot_names, ports)
+    ]
+    master_loop = TMSVRMasterLoop()
+    master_loop.start()
+
+    async def _add_all():
+        await asyncio.gather(*(master_loop.add_master(master) for master in masters))
+
+    asyncio.run(_add_all())
+    time.sleep(args.seconds)
+    master_loop.stop()
+    recorder.close()
+    slaves.terminate()
+    manager.shutdown()
+
+    frames = sum(master.receive_count for master in masters)
+    log_bytes = sum(os.path.getsize(path) for path in recorder.paths)
+    return {
+        "mode": "record",
+        "robots": args.robots,
+        "frames": frames,
+        "append_us": recorder.append_seconds / max(frames, 1) * 1e6,
+        "log_bytes": log_bytes,
+        "bytes_per_frame": log_bytes / max(frames, 1),
+    }
+
+
+def _replay_lockstep(motion_replay: MotionReplay, mailbox: MotionMailbox) -> int:
+    applied = 0
+    start = time.monotonic()
+    while motion_replay.step():
+        applied += len(mailbox.take_all())
+        if motion_replay.speed:
+            delay = start + motion_replay.time / motion_replay.speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    return applied + len(mailbox.take_all())
+
+
+def replay(directory: str, speed: float, args) -> dict:
+    mailbox = MotionMailbox([], max_age=None)
+    motion_replay = MotionReplay.from_directory(directory, mailbox, speed)
+    if speed == 0 or speed > 1:
+        start = time.perf_counter()
+        applied = _replay_lockstep(motion_replay, mailbox)
+        return _replay_result(motion_replay, time.perf_counter() - start, applied)
+
+    applied = 0
+    running = True
+
+    def _physics():
+        nonlocal applied
+        step_size = 1.0 / args.physics_rate
+        next_step = time.monotonic()
+        while running:
+            applied += len(mailbox.take_all())
+            next_step += step_size
+            time.sleep(max(0.0, next_step - time.monotonic()))
+
+    physics = threading.Thread(target=_physics, name="physics-step")
+    physics.start()
+    start = time.perf_counter()
+    asyncio.run(motion_replay.run())
+    elapsed = time.perf_counter() - start
+    running = False
+    physics.join()
+    return _replay_result(motion_replay, elapsed, applied)
+
+
+def _replay_result(motion_replay: MotionReplay, elapsed: float, applied: int) -> dict:
+    duration = motion_replay.duration
+    motion_replay.close()
+    return {
+        "mode": "replay",
+        "speed": motion_replay.speed,
+        "logs": len(motion_replay.logs),
+        "frames": motion_replay.frame_count,
+        "recorded_s": duration,
+        "elapsed_s": elapsed,
+        "speedup": duration / elapsed if elapsed else 0.0,
+        "frames_per_s": motion_replay.frame_count / elapsed if elapsed else 0.0,
+        "applied": applied,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logs", help="directory of motion logs to replay")
+    parser.add_argument("--robots", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=125.0, help="slave frames/s")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--speeds", type=float, nargs="+", default=[1.0, 10.0, 0.0])
+    parser.add_argument("--physics-rate", type=float, default=60.0)
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = []
+    directory = args.logs
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix="motion-logs-")
+        results.append(record(directory, args))
+    if not find_motion_logs(directory):
+        parser.error(f"no motion logs in {directory}")
+
+    results += [replay(directory, speed, args) for speed in args.speeds]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        if result["mode"] == "record":
+            print(
+                f"record   robots={result['robots']} frames={result['frames']}"
+                f" append={result['append_us']:.2f}us/frame"
+                f" log={result['log_bytes'] / 1024:,.0f}KiB"
+                f" ({result['bytes_per_frame']:.0f} bytes/frame)"
+            )
+        else:
+            print(
+                f"replay   speed={result['speed']:<5g} frames={result['frames']}"
+                f" recorded={result['recorded_s']:.2f}s elapsed={result['elapsed_s']:.2f}s"
+                f" ({result['speedup']:.1f}x, {result['frames_per_s']:,.0f} frames/s)"
+                f" applied={result['applied']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
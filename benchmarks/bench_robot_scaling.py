@@ -0,0 +1,179 @@
+"""Physics step cost of applying received joint angles as robots are added.
+
+    python benchmarks/bench_robot_scaling.py [--robots 1 2 4 8 16] [--call-cost-us 0]
+
+Every robot connects to its own fake TMSVR slave (run in a child process) through
+TMSVRMasterLoop into a MotionMailbox. A physics step thread takes the newest frames at
+--physics-rate and applies them like the extension's physics callback: "per-robot" writes
+one articulation at a time as `DigitalRobot.apply_action` does, "batched" stores the rows in
+BatchedJointTargets and writes them with one call per robot model. The articulation views
+are kit_stubs.FakeArticulationView; --call-cost-us adds the fixed cost of one tensor write of
+the physics backend, which is what batching saves in Isaac Sim.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import threading
+import time
+
+import _bootstrap
+import numpy as np
+from kit_stubs import FakeArticulationView
+
+_bootstrap.install_package_paths()
+_bootstrap.install_constants_fallback()
+
+# isort: off
+from bench_ethernet_masters import _serve_slaves  # noqa: E402
+from tmrobot.digital_robot.services.articulation_batch import (  # noqa: E402
+    BatchedJointTargets,
+)
+from tmrobot.digital_robot.services.motion_mailbox import MotionMailbox  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr_master import TMSVRMaster  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr_master import TMSVRMasterLoop  # noqa: E402
+
+# isort: on
+
+MODES = ("per-robot", "batched")
+JOINT_INDICES = np.arange(6)
+ROBOT_INDEX = np.zeros(1, dtype=np.int64)
+
+
+def _make_apply(mode: str, robot_names: list[str], call_cost: float):
+    # Returns apply(frames) and the views it writes to
+    if mode == "batched":
+        joint_targets = BatchedJointTargets(
+            {name: ("TM12S", f"/World/{name}") for name in robot_names},
+            view_factory=lambda prim_paths, name: FakeArticulationView(
+                prim_paths, name, call_cost=call_cost
+            ),
+        )
+
+        def apply(frames):
+            for frame in frames:
+                joint_targets.set_targets(frame.robot_name, frame.joint_radian)
+            joint_targets.flush()
+
+        return apply, joint_targets.views
+
+    views = {
+        name: FakeArticulationView([f"/World/{name}"], name, call_cost=call_cost)
+        for name in robot_names
+    }
+
+    def apply(frames):
+        # ArticulationController.apply_action: one single-prim view write per robot
+        for frame in frames:
+            views[frame.robot_name].set_joint_position_targets(
+                np.asarray(frame.joint_radian)[None, :6],
+                indices=ROBOT_INDEX,
+                joint_indices=JOINT_INDICES,
+            )
+
+    return apply, list(views.values())
+
+
+def measure(mode: str, robots: int, args) -> dict:
+    manager = multiprocessing.Manager()
+    ports = manager.list()
+    ready = manager.Event()
+    slaves = multiprocessing.Process(
+        target=_serve_slaves, args=(robots, args.rate, ports, ready), daemon=True
+    )
+    slaves.start()
+    ready.wait()
+
+    robot_names = [f"Robot{index:02d}" for index in range(1, robots + 1)]
+    mailbox = MotionMailbox(robot_names)
+    master_loop = TMSVRMasterLoop()
+    master_loop.start()
+
+    async def _add_all():
+        await asyncio.gather(
+            *(
+                master_loop.add_master(
+                    TMSVRMaster(name, "127.0.0.1", mailbox, port=port)
+                )
+                for name, port in zip(robot_names, ports)
+            )
+        )
+
+    asyncio.run(_add_all())
+    apply, views = _make_apply(mode, robot_names, args.call_cost_us / 1e6)
+
+    step_times = []
+    applied = 0
+    running = True
+
+    def _physics():
+        nonlocal applied
+        step_size = 1.0 / args.physics_rate
+        next_step = time.monotonic()
+        while running:
+            start = time.perf_counter()
+            frames = mailbox.take_all()
+            apply(frames)
+            step_times.append(time.perf_counter() - start)
+            applied += len(frames)
+            next_step += step_size
+            time.sleep(max(0.0, next_step - time.monotonic()))
+
+    physics = threading.Thread(target=_physics, name="physics-step")
+    time.sleep(args.warmup)
+    physics.start()
+    time.sleep(args.seconds)
+    running = False
+    physics.join()
+
+    master_loop.stop()
+    slaves.terminate()
+    manager.shutdown()
+
+    step_times = np.array(step_times[1:]) * 1e6
+    steps = max(len(step_times), 1)
+    return {
+        "mode": mode,
+        "robots": robots,
+        "applied_fps": applied / args.seconds,
+        "step_p50_us": float(np.percentile(step_times, 50)),
+        "step_p99_us": float(np.percentile(step_times, 99)),
+        "step_per_robot_us": float(np.mean(step_times)) / robots,
+        "writes_per_step": sum(view.call_count for view in views) / steps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--robots", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--modes", nargs="+", default=list(MODES))
+    parser.add_argument("--rate", type=float, default=125.0, help="slave frames/s")
+    parser.add_argument("--physics-rate", type=float, default=60.0)
+    parser.add_argument("--call-cost-us", type=float, default=0.0)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--warmup", type=float, default=0.5)
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = [
+        measure(mode, robots, args) for robots in args.robots for mode in args.modes
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(
+            f"{result['mode']:<9} robots={result['robots']:<3}"
+            f" {result['applied_fps']:>7,.0f} frames/s"
+            f" step p50={result['step_p50_us']:>7.1f}us"
+            f" p99={result['step_p99_us']:>7.1f}us"
+            f" {result['step_per_robot_us']:>6.1f}us/robot"
+            f" writes/step={result['writes_per_step']:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
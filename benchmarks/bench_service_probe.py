@@ -0,0 +1,217 @@
+"""Time to check the TMflow services of every robot when the services start.
+
+    python benchmarks/bench_service_probe.py [--robots 4] [--offline 1]
+
+Each online robot gets a fake echo gRPC server (TLS, like the TMSimulator Virtual Camera
+API) and an Ethernet listener on its own loopback address. The last --offline robots are
+black holes: their accept queues are full, so connections hang until the deadline like an
+unplugged controller. "sequential" is the previous start: a new secure channel, a blocking
+connectTMFlow and a blocking socket connect per robot, one after the other on the Kit loop.
+"concurrent" is probe_robots with an empty channel pool, "pooled" the same again with the
+channels of the first run. The stall column is the longest time a 1 ms ticker on the loop
+was kept from running. Needs the compiled echo_client, i.e. Kit's Python 3.10.
+"""
+
+import argparse
+import asyncio
+import json
+import socket
+import time
+from concurrent import futures
+
+import _bootstrap
+import grpc
+import kit_stubs
+from google.protobuf import empty_pb2
+
+_bootstrap.install_package_paths()
+kit_stubs.install()
+
+# isort: off
+from tmrobot.digital_robot.grpcs import OmniverseAPI_pb2_grpc  # noqa: E402
+from tmrobot.digital_robot.services.service_probe import (  # noqa: E402
+    ChannelPool,
+    probe_robots,
+)
+from tmrobot.digital_robot.ui import constants as const  # noqa: E402
+
+# isort: on
+
+MODES = ("sequential", "concurrent", "pooled")
+CREDENTIALS_PATH = (
+    _bootstrap.EXTENSION_ROOT / "tmrobot" / "digital_robot" / "services" / "credentials"
+)
+# The fake echo servers present the digital-robot certificate, issued for localhost
+TARGET_NAME = "localhost"
+
+
+class _EchoServicer(OmniverseAPI_pb2_grpc.OmniverseApiServicer):
+    def connectTMFlow(self, request, context):
+        return empty_pb2.Empty()
+
+
+def _start_echo_server(ips: list[str]) -> grpc.Server:
+    credentials = grpc.ssl_server_credentials(
+        [
+            (
+                (CREDENTIALS_PATH / "digital-robot.key").read_bytes(),
+                (CREDENTIALS_PATH / "digital-robot.crt").read_bytes(),
+            )
+        ]
+    )
+    server = grpc.server(futures.ThreadPoolExecutor(4))
+    OmniverseAPI_pb2_grpc.add_OmniverseApiServicer_to_server(_EchoServicer(), server)
+    for ip in ips:
+        server.add_secure_port(f"{ip}:{const.PORT_ECHO_SERVER}", credentials)
+    server.start()
+    return server
+
+
+def _listen(ip: str, port: int) -> socket.socket:
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((ip, port))
+    listener.listen(16)
+    return listener
+
+
+def _black_hole(ip: str, port: int) -> list[socket.socket]:
+    # A listener that never accepts, with its queue full new SYNs are dropped
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((ip, port))
+    listener.listen(0)
+    sockets = [listener]
+    for _ in range(3):
+        client = socket.socket()
+        client.setblocking(False)
+        client.connect_ex((ip, port))
+        sockets.append(client)
+    return sockets
+
+
+def _make_pool() -> ChannelPool:
+    return ChannelPool(
+        const.PORT_ECHO_SERVER,
+        str(CREDENTIALS_PATH / "digital-robot.crt"),
+        TARGET_NAME,
+    )
+
+
+def _probe_sequential(robots: list[tuple[str, str]], args, on_result):
+    # The previous _on_start_service: EchoClient and _is_service_on per robot
+    for robot_name, ip in robots:
+        start = time.monotonic()
+        pool = _make_pool()
+        stub = OmniverseAPI_pb2_grpc.OmniverseApiStub(pool.get(ip))
+        try:
+            stub.connectTMFlow(empty_pb2.Empty(), timeout=args.echo_timeout)
+        except grpc.RpcError:
+            pass
+        pool.close()
+        on_result(time.monotonic() - start)
+
+        start = time.monotonic()
+        with socket.socket() as sock:
+            sock.settimeout(args.ethernet_timeout)
+            try:
+                sock.connect((ip, const.PORT_ETHERNET))
+            except OSError:
+                pass
+        on_result(time.monotonic() - start)
+
+
+async def _run(mode: str, robots: list[tuple[str, str]], pool, args) -> dict:
+    stalls = []
+    stop = asyncio.Event()
+
+    async def _ticker():
+        last = time.perf_counter()
+        while not stop.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            stalls.append(now - last - 0.001)
+            last = now
+
+    ticker = asyncio.create_task(_ticker())
+    await asyncio.sleep(0.01)
+    arrivals = []
+    start = time.monotonic()
+
+    def _on_result(_):
+        arrivals.append(time.monotonic() - start)
+
+    if mode == "sequential":
+        _probe_sequential(robots, args, _on_result)
+        results = None
+    else:
+        results = await probe_robots(
+            robots,
+            _on_result,
+            echo_timeout=args.echo_timeout,
+            ethernet_timeout=args.ethernet_timeout,
+            pool=pool,
+        )
+    total = time.monotonic() - start
+    stop.set()
+    await ticker
+
+    return {
+        "mode": mode,
+        "robots": len(robots),
+        "offline": args.offline,
+        "first_result_ms": arrivals[0] * 1000,
+        "total_ms": total * 1000,
+        "max_stall_ms": max(stalls) * 1000,
+        "available": (
+            None if results is None else sum(result.available for result in results)
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--robots", type=int, default=4)
+    parser.add_argument("--offline", type=int, default=1)
+    parser.add_argument("--echo-timeout", type=float, default=3.0)
+    parser.add_argument("--ethernet-timeout", type=float, default=1.0)
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    robots = [
+        (f"Robot{index:02d}", f"127.0.0.{10 + index}")
+        for index in range(1, args.robots + 1)
+    ]
+    online = robots[: len(robots) - args.offline]
+    offline = robots[len(robots) - args.offline :]
+
+    server = _start_echo_server([ip for _, ip in online])
+    sockets = [_listen(ip, const.PORT_ETHERNET) for _, ip in online]
+    for _, ip in offline:
+        sockets += _black_hole(ip, const.PORT_ETHERNET)
+        sockets += _black_hole(ip, const.PORT_ECHO_SERVER)
+
+    # "pooled" reuses the channels "concurrent" opened
+    pool = _make_pool()
+    results = [asyncio.run(_run(mode, robots, pool, args)) for mode in MODES]
+
+    pool.close()
+    server.stop(None)
+    for sock in sockets:
+        sock.close()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(
+            f"{result['mode']:<10} robots={result['robots']} offline={result['offline']}"
+            f" first={result['first_result_ms']:>7.1f}ms"
+            f" total={result['total_ms']:>7.1f}ms"
+            f" stall={result['max_stall_ms']:>7.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
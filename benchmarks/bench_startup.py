@@ -0,0 +1,113 @@
+"""Time to import the extension and to run on_startup, in a fresh interpreter per run.
+
+    python benchmarks/bench_startup.py [--runs 5] [--tree ../digital-robot-2.22.12]
+
+Kit, USD and Isaac Sim are stubbed (kit_stubs), so the times cover the extension's own
+modules and the Python packages they pull in (gRPC, protobuf, NumPy, ...), not Kit's. The
+modules loaded by on_startup are listed by group: with the UI-only startup, Isaac Sim,
+gRPC and the Ethernet services are only imported by Start Service. --tree measures
+another checkout of the repository, e.g. a worktree of a previous release. Needs the
+Python the compiled modules were built for (Kit's Python 3.10).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Runs in the child interpreter; prints one JSON line
+CHILD = r"""
+import json, sys, time
+from pathlib import Path
+
+sys.path.insert(0, {benchmarks!r})
+import _bootstrap, kit_stubs
+
+_bootstrap.EXTENSION_ROOT = Path({tree!r}) / "exts" / "tmrobot.digital_robot"
+kit_stubs.install()
+_bootstrap.install_package_paths()
+
+before = set(sys.modules)
+start = time.perf_counter()
+from tmrobot.digital_robot import extension
+
+imported = time.perf_counter()
+ext = extension.TMDigitalRobotExtension()
+ext.on_startup("tmrobot.digital_robot")
+started = time.perf_counter()
+loaded = sorted(set(sys.modules) - before)
+ext._log_pipeline.stop()
+print(json.dumps({{
+    "import_ms": (imported - start) * 1e3,
+    "on_startup_ms": (started - imported) * 1e3,
+    "modules": loaded,
+}}))
+"""
+
+GROUPS = {
+    "tmrobot": ("tmrobot.",),
+    "isaac": ("omni.isaac.",),
+    "grpc": ("grpc", "google.protobuf"),
+    "numpy": ("numpy",),
+    "imaging": ("PIL", "simplejpeg", "turbojpeg"),
+}
+
+
+def _run_once(tree: str) -> dict:
+    code = CHILD.format(
+        benchmarks=os.path.dirname(os.path.abspath(__file__)), tree=tree
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure(tree: str, runs: int) -> dict:
+    samples = [_run_once(tree) for _ in range(runs)]
+    modules = samples[0]["modules"]
+    return {
+        "tree": tree,
+        "runs": runs,
+        "import_ms": statistics.median(sample["import_ms"] for sample in samples),
+        "on_startup_ms": statistics.median(
+            sample["on_startup_ms"] for sample in samples
+        ),
+        "modules": len(modules),
+        "groups": {
+            group: sum(module.startswith(prefixes) for module in modules)
+            for group, prefixes in GROUPS.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--tree",
+        nargs="+",
+        default=[os.path.dirname(os.path.dirname(os.path.abspath(__file__)))],
+        help="repository checkouts to measure",
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    results = [measure(os.path.abspath(tree), args.runs) for tree in args.tree]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        groups = " ".join(f"{name}={count}" for name, count in result["groups"].items())
+        print(
+            f"{result['tree']}: import={result['import_ms']:.0f}ms"
+            f" on_startup={result['on_startup_ms']:.0f}ms"
+            f" modules={result['modules']} ({groups})"
+        )
+
+
+if __name__ == "__main__":
+    main()
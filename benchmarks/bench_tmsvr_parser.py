@@ -0,0 +1,152 @@
+"""Compare the TMSVR stream parser against the str/json based parsing it replaces.
+
+    python benchmarks/bench_tmsvr_parser.py [--recording stream.bin] [--frames 20000]
+
+Without --recording a synthetic stream with the sample project item layout is used; record
+a real one with `python benchmarks/tmsvr_stream.py <tmflow ip> stream.bin`.
+"""
+
+import argparse
+import json
+import math
+import time
+import tracemalloc
+
+import _bootstrap
+
+_bootstrap.install_package_paths()
+
+# isort: off
+from tmrobot.digital_robot.services.tmsvr import TMSVRStreamParser  # noqa: E402
+from tmsvr_stream import load_recording, synthesize_stream  # noqa: E402
+
+# isort: on
+
+
+class LegacyEthernetData:
+    def __init__(self, robot_name, joint_radian, ctrl_di, ctrl_do, end_di, end_do):
+        self.robot_name = robot_name
+        self.joint_radian = joint_radian
+        self.ctrl_di = ctrl_di
+        self.ctrl_do = ctrl_do
+        self.end_di = end_di
+        self.end_do = end_do
+
+
+def legacy_parse(chunk: bytes, robot_name: str) -> list:
+    # Same steps as EthernetMaster.receive_data <= 2.22.12: decode every chunk, split it
+    # into packets and lines, json-decode every item and convert angles one by one
+    motions = []
+    for packet in chunk.decode("utf-8").split("$TMSVR,")[1:]:
+        items = {}
+        content = packet.split(",", 3)[3].rsplit(",*", 1)[0]
+        for line in content.split("\r\n"):
+            line = line.strip()
+            if "=" not in line:
+                continue
+            name, value = line.split("=", 1)
+            items[name] = json.loads(value.replace("{", "[").replace("}", "]"))
+
+        motions.append(
+            LegacyEthernetData(
+                robot_name,
+                [math.radians(angle) for angle in items["Joint_Angle"]],
+                items["Ctrl_DI"],
+                items["Ctrl_DO"],
+                items["End_DI"],
+                items["End_DO"],
+            )
+        )
+    return motions
+
+
+def run_legacy(chunks: list[bytes]) -> int:
+    count = 0
+    for chunk in chunks:
+        count += len(legacy_parse(chunk, "Robot01"))
+    return count
+
+
+def make_stream_runner():
+    parser = TMSVRStreamParser("Robot01")
+
+    def run_stream(chunks: list[bytes]) -> int:
+        count = 0
+        for chunk in chunks:
+            parser.feed(chunk)
+            for _ in parser.frames():
+                count += 1
+        return count
+
+    return run_stream
+
+
+def measure(name: str, run, chunks: list[bytes], repeat: int) -> dict:
+    frames = run(chunks)  # warm up
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(chunks)
+        best = min(best, time.perf_counter() - start)
+
+    # Transient allocation peak of one chunk, averaged over the stream
+    sample = chunks[: min(len(chunks), 500)]
+    tracemalloc.start()
+    peaks = 0
+    for chunk in sample:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        run([chunk])
+        peaks += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    return {
+        "parser": name,
+        "frames": frames,
+        "frames_per_second": frames / best,
+        "us_per_frame": best / frames * 1e6,
+        "alloc_peak_bytes_per_frame": peaks / max(run(sample), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recording", help="raw TMSVR byte stream to replay")
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    if args.recording:
+        data = load_recording(args.recording)
+        # Split the recording at packet starts, like the slave writes them
+        chunks = [b"$TMSVR," + part for part in data.split(b"$TMSVR,")[1:]]
+    else:
+        chunks = synthesize_stream(args.frames)
+
+    results = [
+        measure("legacy", run_legacy, chunks, args.repeat),
+        measure("stream", make_stream_runner(), chunks, args.repeat),
+        # Several packets per recv, as seen when the receive thread falls behind
+        measure(
+            "stream (64 KiB reads)",
+            make_stream_runner(),
+            [b"".join(chunks[i : i + 256]) for i in range(0, len(chunks), 256)],
+            args.repeat,
+        ),
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(
+            f"{result['parser']:<24} {result['frames_per_second']:>12,.0f} frames/s"
+            f" {result['us_per_frame']:>8.2f} us/frame"
+            f" {result['alloc_peak_bytes_per_frame']:>8.0f} B peak alloc/frame"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Local stand-in for the TMflow vision client of the virtual camera gRPC server.
+
+    python benchmarks/fake_tmflow_client.py SERIAL [SERIAL ...] [--host 127.0.0.1] [--grabs 10]
+
+Calls loadCameraList and connectCamera like a TMflow vision job, then getGrabImageData
+`--grabs` times per camera, over the same TLS channel TMflow uses. The client is blocking:
+it runs in its own threads, away from the event loop of a server in the same process.
+"""
+
+import argparse
+import time
+
+import _bootstrap
+import grpc
+from google.protobuf import empty_pb2
+
+_bootstrap.install_package_paths()
+
+# isort: off
+from tmrobot.digital_robot.grpcs import VirtualCameraAPI_pb2  # noqa: E402
+from tmrobot.digital_robot.grpcs import VirtualCameraAPI_pb2_grpc  # noqa: E402
+
+# isort: on
+
+PORT_VIRTUAL_CAMERA = 9701
+CREDENTIALS_PATH = (
+    _bootstrap.EXTENSION_ROOT / "tmrobot" / "digital_robot" / "services" / "credentials"
+)
+# Host name in the server certificate
+TARGET_NAME = "localhost"
+
+
+class FakeTMflowClient:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = PORT_VIRTUAL_CAMERA,
+        timeout: float = 10.0,
+    ):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._channel: grpc.Channel = None
+        self._stub: VirtualCameraAPI_pb2_grpc.VirtualCameraApiStub = None
+
+    def connect(self):
+        root_certificate = (CREDENTIALS_PATH / "digital-robot.crt").read_bytes()
+        self._channel = grpc.secure_channel(
+            f"{self.host}:{self.port}",
+            grpc.ssl_channel_credentials(root_certificate),
+            options=[("grpc.ssl_target_name_override", TARGET_NAME)],
+        )
+        grpc.channel_ready_future(self._channel).result(self.timeout)
+        self._stub = VirtualCameraAPI_pb2_grpc.VirtualCameraApiStub(self._channel)
+
+    def close(self):
+        if self._channel is not None:
+            self._channel.close()
+            self._channel = None
+
+    def load_camera_list(self):
+        response = self._stub.loadCameraList(empty_pb2.Empty(), timeout=self.timeout)
+        return list(response.CameraIDList.Devices)
+
+    def connect_camera(self, serial_number: str) -> grpc.StatusCode:
+        # The virtual cameras are always connected, the server may answer UNIMPLEMENTED
+        try:
+            self._stub.connectCamera(
+                VirtualCameraAPI_pb2.CameraSerialNumberRequest(
+                    SerialNumber=serial_number
+                ),
+                timeout=self.timeout,
+            )
+        except grpc.RpcError as e:
+            return e.code()
+        return grpc.StatusCode.OK
+
+    def grab(self, serial_number: str):
+        return self._stub.getGrabImageData(
+            VirtualCameraAPI_pb2.CameraSerialNumberRequest(SerialNumber=serial_number),
+            timeout=self.timeout,
+        )
+
+
+def main(args):
+    client = FakeTMflowClient(args.host, args.port)
+    client.connect()
+    try:
+        print(f"{len(client.load_camera_list())} cameras")
+        for serial_number in args.serial_numbers:
+            status = client.connect_camera(serial_number)
+            print(f"connectCamera {serial_number}: {status.name}")
+            for _ in range(args.grabs):
+                start = time.perf_counter()
+                response = client.grab(serial_number)
+                print(
+                    f"getGrabImageData {serial_number}: {response.ImageType}"
+                    f" {len(response.EncodeString) / 1024:.0f} KiB"
+                    f" in {(time.perf_counter() - start) * 1000:.1f} ms"
+                )
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake TMflow vision client")
+    parser.add_argument("serial_numbers", nargs="+")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PORT_VIRTUAL_CAMERA)
+    parser.add_argument("--grabs", type=int, default=10)
+    main(parser.parse_args())
@@ -0,0 +1,135 @@
+"""Local stand-in for the TMflow Ethernet slave.
+
+    python benchmarks/fake_tmsvr_slave.py --port 5891 --rate 125 [--cells 4]
+
+Streams joint/IO frames to every connected master, answers `Robot_Model` reads and
+acknowledges DI writes, so the extension and the benchmarks can run without TMflow.
+With --cells N one slave listens on each of N consecutive addresses from --host, e.g.
+127.0.0.2 to 127.0.0.5 for the cells of the batch mode (loopback aliases need Linux).
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import time
+
+import _bootstrap
+
+_bootstrap.install_package_paths()
+
+# isort: off
+from tmrobot.digital_robot.services.tmsvr import MODE_READ_STRING  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr import MODE_RESPONSE  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr import MODE_STRING  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr import TMSVRStreamParser  # noqa: E402
+from tmrobot.digital_robot.services.tmsvr import build_packet  # noqa: E402
+from tmsvr_stream import frame_content  # noqa: E402
+
+# isort: on
+
+
+class FakeTMSVRSlave:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        rate: float = 125.0,
+        robot_model: str = "TM12S",
+        packets: list[bytes] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.robot_model = robot_model
+        self.sent_count = 0
+        self.writes: list[str] = []
+        self._packets = packets
+        self._server: asyncio.AbstractServer = None
+        self._streams: set[asyncio.Task] = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._on_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        for task in list(self._streams):
+            task.cancel()
+        await asyncio.gather(*self._streams, return_exceptions=True)
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _on_client(self, reader, writer):
+        stream = asyncio.create_task(self._stream(writer))
+        self._streams.add(stream)
+        parser = TMSVRStreamParser("fake-slave")
+        try:
+            while data := await reader.read(4096):
+                parser.feed(data)
+                for _ in parser.frames():
+                    pass
+                while parser.responses:
+                    writer.write(self._reply(parser.responses.popleft()))
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            stream.cancel()
+            self._streams.discard(stream)
+            writer.close()
+
+    def _reply(self, request) -> bytes:
+        if request.mode == MODE_READ_STRING:
+            content = f"{request.content}={self.robot_model}"
+            return build_packet(request.transaction_id, MODE_READ_STRING, content)
+
+        self.writes.append(request.content)
+        return build_packet(request.transaction_id, MODE_RESPONSE, "00")
+
+    async def _stream(self, writer):
+        # Send frames on an absolute schedule so the rate does not drift
+        interval = 1.0 / self.rate
+        next_time = time.monotonic()
+        index = 0
+        try:
+            while True:
+                if self._packets:
+                    packet = self._packets[index % len(self._packets)]
+                else:
+                    packet = build_packet(
+                        "digital_robot_motion", MODE_STRING, frame_content(index)
+                    )
+                writer.write(packet)
+                self.sent_count += 1
+                index += 1
+
+                next_time += interval
+                await asyncio.sleep(max(0.0, next_time - time.monotonic()))
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+
+async def _main(args):
+    slaves = []
+    for index in range(args.cells):
+        host = str(ipaddress.ip_address(args.host) + index)
+        slave = FakeTMSVRSlave(host, args.port, args.rate, args.robot_model)
+        await slave.start()
+        slaves.append(slave)
+        print(f"Fake TMSVR slave listening on {host}:{slave.port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for slave in slaves:
+            await slave.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake TMflow Ethernet slave")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5891)
+    parser.add_argument("--rate", type=float, default=125.0)
+    parser.add_argument("--robot-model", default="TM12S")
+    parser.add_argument("--cells", type=int, default=1)
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,187 @@
+"""Stand-ins for the Kit, USD and Isaac Sim modules so the services load on plain Linux.
+
+`install()` makes every `omni.*`, `pxr.*` and `carb.*` import succeed with permissive stub
+objects; attribute access and calls on them return more stubs. The few functions whose
+results the compiled modules actually use get real return values. `FakeAnnotatorCamera`
+replaces the Isaac `Camera` behind a `DigitalCamera` and returns a fixed frame;
+`FakeArticulationView` records the joint targets written to an `ArticulationView`.
+"""
+
+import importlib.abc
+import importlib.machinery
+import sys
+import time
+import types
+
+import numpy as np
+
+STUBBED_PACKAGES = ("omni", "pxr", "carb")
+
+
+class _StubType(type):
+    def __getattr__(cls, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _make_stub(name)
+
+
+class Stub(metaclass=_StubType):
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _make_stub(name)()
+
+    def __call__(self, *args, **kwargs):
+        return _make_stub("result")()
+
+    def __iter__(self):
+        return iter(())
+
+    def __bool__(self):
+        return False
+
+
+def _make_stub(name: str) -> type:
+    return _StubType(name, (Stub,), {})
+
+
+class _Quaternion:
+    def GetReal(self) -> float:
+        return 1.0
+
+    def GetImaginary(self) -> list[float]:
+        return [0.0, 0.0, 0.0]
+
+
+def get_prim_attribute_value(prim_path: str, attribute_name: str, *args, **kwargs):
+    # DigitalCamera.get_handeye_parameters reads the camera pose of loadCameraList
+    if attribute_name.endswith("orient"):
+        return _Quaternion()
+    return [0.0, 0.0, 0.0]
+
+
+class _Viewport:
+    fps = 60.0
+
+
+def get_active_viewport(*args, **kwargs):
+    return _Viewport()
+
+
+# Real return values for functions the compiled modules compute with
+OVERRIDES = {
+    "omni.isaac.core.utils.prims": {
+        "get_prim_attribute_value": get_prim_attribute_value
+    },
+    "omni.kit.viewport.utility": {"get_active_viewport": get_active_viewport},
+}
+
+
+class _StubLoader(importlib.abc.Loader):
+    def create_module(self, spec):
+        module = types.ModuleType(spec.name)
+        module.__path__ = []
+
+        def __getattr__(name):
+            if name.startswith("__"):
+                raise AttributeError(name)
+            return _make_stub(name)
+
+        module.__getattr__ = __getattr__
+        module.__dict__.update(OVERRIDES.get(spec.name, {}))
+        return module
+
+    def exec_module(self, module):
+        pass
+
+
+class _StubFinder(importlib.abc.MetaPathFinder):
+    def find_spec(self, fullname, path, target=None):
+        if fullname.split(".")[0] in STUBBED_PACKAGES:
+            return importlib.machinery.ModuleSpec(
+                fullname, _StubLoader(), is_package=True
+            )
+        return None
+
+
+def install():
+    if not any(isinstance(finder, _StubFinder) for finder in sys.meta_path):
+        sys.meta_path.insert(0, _StubFinder())
+
+
+class FakeAnnotatorCamera:
+    """The parts of the Isaac `Camera` that `DigitalCamera` reads."""
+
+    def __init__(self, prim_path: str, resolution: tuple[int, int], seed: int = 0):
+        self.prim_path = prim_path
+        self._resolution = resolution
+        width, height = resolution
+        # Smooth gradients with some sensor noise, encodes like a rendered scene
+        y, x = np.mgrid[0:height, 0:width]
+        rng = np.random.default_rng(seed)
+        self.frame = np.empty((height, width, 3), dtype=np.uint8)
+        self.frame[:, :, 0] = (x * 255 // width).astype(np.uint8)
+        self.frame[:, :, 1] = (y * 255 // height).astype(np.uint8)
+        self.frame[:, :, 2] = ((x + y) % 256).astype(np.uint8)
+        self.frame += rng.integers(0, 8, (height, width, 3), dtype=np.uint8)
+
+    def get_resolution(self) -> tuple[int, int]:
+        return self._resolution
+
+    def get_rgb(self) -> np.ndarray:
+        return self.frame
+
+    def render(self):
+        # A new frame of a changing scene: shift the image by one row
+        self.frame = np.roll(self.frame, 1, axis=0)
+
+
+class FakePrim:
+    def __init__(self, prim_path: str):
+        self._path = prim_path
+
+    def GetPath(self) -> str:
+        return self._path
+
+    def IsValid(self) -> bool:
+        return True
+
+
+class FakeArticulationView:
+    """The joint target write of the Isaac `ArticulationView`, into a NumPy array.
+
+    `call_cost` busy-waits on every call, standing in for the fixed cost of one tensor API
+    write of the physics backend.
+    """
+
+    def __init__(
+        self,
+        prim_paths: list[str],
+        name: str,
+        dof_count: int = 6,
+        call_cost: float = 0.0,
+    ):
+        self.prim_paths = prim_paths
+        self.name = name
+        self.count = len(prim_paths)
+        self.call_cost = call_cost
+        self.call_count = 0
+        self.targets = np.zeros((self.count, dof_count), dtype=np.float32)
+
+    def set_joint_position_targets(self, positions, indices=None, joint_indices=None):
+        indices = np.arange(self.count) if indices is None else np.asarray(indices)
+        if joint_indices is None:
+            joint_indices = np.arange(self.targets.shape[1])
+        positions = np.asarray(positions, dtype=np.float32)
+        if positions.shape != (len(indices), len(joint_indices)):
+            raise ValueError(f"positions of shape {positions.shape}")
+        self.targets[np.ix_(indices, joint_indices)] = positions
+        self.call_count += 1
+
+        if self.call_cost:
+            deadline = time.perf_counter() + self.call_cost
+            while time.perf_counter() < deadline:
+                pass
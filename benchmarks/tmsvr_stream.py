@@ -0,0 +1,71 @@
+import argparse
+import math
+import socket
+import time
+
+import _bootstrap
+
+_bootstrap.install_package_paths()
+
+from tmrobot.digital_robot.services.tmsvr import MODE_STRING, build_packet  # noqa: E402
+
+
+def frame_content(index: int, rate: float = 100.0) -> str:
+    t = index / rate
+    joints = [30.0 * math.sin(t + axis) for axis in range(6)]
+    ctrl_di = [0] * 16
+    ctrl_do = [(index // 50 + bit) % 2 for bit in range(16)]
+    end_di = [0] * 4
+    end_do = [(index // 100) % 2, 0, 0, 0]
+
+    def item(name, values, fmt="{}"):
+        return f"{name}={{{','.join(fmt.format(v) for v in values)}}}"
+
+    # Every item on its own line, the layout EthernetMaster.receive_data splits on
+    return "\r\n".join(
+        [
+            "",
+            item("Joint_Angle", joints, "{:.3f}"),
+            item("Ctrl_DI", ctrl_di),
+            item("Ctrl_DO", ctrl_do),
+            item("End_DI", end_di),
+            item("End_DO", end_do),
+            "",
+        ]
+    )
+
+
+def synthesize_stream(frames: int) -> list[bytes]:
+    # One packet per element, the way the Ethernet slave sends them
+    return [
+        build_packet("digital_robot_motion", MODE_STRING, frame_content(index))
+        for index in range(frames)
+    ]
+
+
+def load_recording(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def record_stream(ip: str, port: int, seconds: float, path: str):
+    # Capture the raw TMSVR byte stream of a running TMflow Ethernet slave
+    deadline = time.monotonic() + seconds
+    with socket.create_connection((ip, port), timeout=3) as sock, open(
+        path, "wb"
+    ) as file:
+        while time.monotonic() < deadline:
+            data = sock.recv(65536)
+            if not data:
+                break
+            file.write(data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record a TMSVR byte stream")
+    parser.add_argument("ip")
+    parser.add_argument("output")
+    parser.add_argument("--port", type=int, default=5891)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+    record_stream(args.ip, args.port, args.seconds, args.output)
@@ -1,52 +1,85 @@
 import asyncio
 import gc
 import logging
+import os
 import queue
 import random
-import socket
+import sys
 import threading
+import time
 import traceback
 from datetime import datetime, timezone
-from typing import List
+from typing import TYPE_CHECKING, List
 
+import carb.settings
 import numpy as np  # noqa
+import omni.kit.app
 import omni.kit.commands
-import omni.kit.viewport.utility as vp_utils  # noqa
 import omni.usd
-import omni.usd.audio
-from omni.isaac.core.utils.prims import get_prim_at_path
-from omni.isaac.core.utils.stage import (
-    add_reference_to_stage,
-    clear_stage,
-    close_stage,
-    create_new_stage,
-    is_stage_loading,
-    update_stage_async,
-)
-from omni.isaac.core.utils.types import ArticulationAction
-from omni.isaac.core.world.world import World
-from omni.isaac.surface_gripper._surface_gripper import (  # noqa
-    Surface_Gripper,
-    Surface_Gripper_Properties,
-)
-from pxr import Gf, Sdf, Usd, UsdGeom
+from pxr import Gf, Sdf
 
+# Only what the UI needs is imported with the extension. Isaac Sim (World, stage utilities),
+# gRPC, the Ethernet masters and the other services are imported when the services start.
 # isort: off
-from tmrobot.digital_robot.models.digital_camera import DigitalCamera  # type: ignore
-from tmrobot.digital_robot.models.digital_robot import DigitalRobot  # type: ignore
 from tmrobot.digital_robot.models.setting import ExtensionSetting  # type: ignore
 from tmrobot.digital_robot.models.setting import RobotSetting  # type: ignore
-from tmrobot.digital_robot.services.echo_client import EchoClient  # type: ignore
-from tmrobot.digital_robot.services.ethernet_master import EthernetData  # type: ignore
-from tmrobot.digital_robot.services.ethernet_master import EthernetMaster  # type: ignore
-from tmrobot.digital_robot.services.virtual_camera_server_secure import VirtualCameraServerSecure  # type: ignore
+from tmrobot.digital_robot.models.setting_store import ExtensionSettingStore
+from tmrobot.digital_robot.services import metrics
+from tmrobot.digital_robot.services.layer_prefetch import LayerPrefetcher
+from tmrobot.digital_robot.services.log_pipeline import CONSOLE, LogPipeline
 from tmrobot.digital_robot.ui import constants as const  # type: ignore
 from tmrobot.digital_robot.ui.extension_ui import ExtensionUI  # type: ignore
 
 # isort: on
 
+if TYPE_CHECKING:
+    from omni.isaac.core.world.world import World
+    from tmrobot.digital_robot.models.digital_camera import DigitalCamera
+    from tmrobot.digital_robot.models.digital_robot import DigitalRobot
+    from tmrobot.digital_robot.models.workpiece_pool import WorkpiecePool
+    from tmrobot.digital_robot.services.articulation_batch import BatchedJointTargets
+    from tmrobot.digital_robot.services.camera_properties import CameraPropertyCache
+    from tmrobot.digital_robot.services.cell_batch import CellBatch
+    from tmrobot.digital_robot.services.flow_control import FlowController, FlowStats
+    from tmrobot.digital_robot.services.frame_publisher import FramePublisher
+    from tmrobot.digital_robot.services.motion_log import (
+        MotionLogRecorder,
+        MotionReplay,
+    )
+    from tmrobot.digital_robot.services.motion_mailbox import MotionMailbox
+    from tmrobot.digital_robot.services.prim_bounds import PrimBounds
+    from tmrobot.digital_robot.services.prim_tweens import PrimTweens
+    from tmrobot.digital_robot.services.service_probe import ProbeResult
+    from tmrobot.digital_robot.services.tmsvr import EthernetFrame
+    from tmrobot.digital_robot.services.tmsvr_master import (
+        TMSVRMaster,
+        TMSVRMasterLoop,
+    )
+    from tmrobot.digital_robot.services.trajectory_buffer import (
+        JointTrajectoryBuffer,
+        TrajectorySample,
+    )
+    from tmrobot.digital_robot.services.virtual_camera_server import (
+        VirtualCameraServer,
+    )
+
 logger = logging.getLogger(__name__)
 
+SETTING_TRAJECTORY = "/exts/tmrobot.digital_robot/trajectory"
+SETTING_CAMERA = "/exts/tmrobot.digital_robot/camera"
+SETTING_METRICS = "/exts/tmrobot.digital_robot/metrics"
+SETTING_ROBOTS = "/exts/tmrobot.digital_robot/robots"
+SETTING_PROBE = "/exts/tmrobot.digital_robot/probe"
+SETTING_LOGGING = "/exts/tmrobot.digital_robot/logging"
+SETTING_WORKPIECES = "/exts/tmrobot.digital_robot/workpieces"
+SETTING_RECORDING = "/exts/tmrobot.digital_robot/recording"
+SETTING_IO = "/exts/tmrobot.digital_robot/io"
+SETTING_STARTUP = "/exts/tmrobot.digital_robot/startup"
+SETTING_FRAMES = "/exts/tmrobot.digital_robot/frames"
+SETTING_FLOW = "/exts/tmrobot.digital_robot/flow"
+SETTING_CELLS = "/exts/tmrobot.digital_robot/cells"
+SETTING_REPLAY = "/exts/tmrobot.digital_robot/replay"
+
 
 class TMDigitalRobotExtension(omni.ext.IExt):
     def _initialize(self):
@@ -54,24 +87,42 @@ class TMDigitalRobotExtension(omni.ext.IExt):
         self._extension_setting = ExtensionSetting()
         self._models = {}
         self._virtual_camera_thread: threading.Thread = None
-        self._virtual_camera_server: VirtualCameraServerSecure = None
+        self._virtual_camera_server: VirtualCameraServer = None
         self._dg_robots: dict[str, DigitalRobot] = {}
         self._dg_cameras: dict[str, dict[str, DigitalCamera]] = {}  # [tmflow ip][camera name]
-        self._ethernet_masters: dict[str, EthernetMaster] = {}  # [robot name]
-        self._ethernet_master_threads: dict[str, threading.Thread] = {}  # [robot name]
-        self._motion_queue: queue.Queue = None
+        self._camera_properties: CameraPropertyCache = None
+        self._ethernet_masters: dict[str, TMSVRMaster] = {}  # [robot name]
+        self._ethernet_master_loop: TMSVRMasterLoop = None
+        self._motion_mailbox: MotionMailbox = None
+        self._trajectory_buffer: JointTrajectoryBuffer = None
+        self._flow_controller: FlowController = None
+        self._motion_recorder: MotionLogRecorder = None
+        self._motion_replay: MotionReplay = None
+        self._replay_lockstep = False
+        self._replay_task: asyncio.Task = None
+        self._frame_publisher: FramePublisher = None
+        self._frame_subscription = None
         self._robot_settings: List[RobotSetting] = []
+        self._cells: CellBatch = None
         self._set_queue = queue.Queue()
         self._simulation_count = 0
+        self._joint_targets: BatchedJointTargets = None
         self._surface_gripper_state = 0
         self._surface_gripper = None
-        self._workpiece_id = 0
-        self._world: World = World()
+        self._workpiece_pool: WorkpiecePool = None
         self._default_workpiece_position = Gf.Vec3d(0, 0.25, 0.5155)
         self._default_workpieces_prim_path = "/World/Accessories/Workpieces"
         # fmt: on
+        self._physics_step_seconds = metrics.registry.histogram(
+            "digital_robot_physics_step_seconds",
+            "Time spent in the physics step callback",
+        )
+        self._apply_action_seconds: dict[str, metrics.Histogram] = {}  # [robot name]
 
     def on_startup(self, ext_id):
+        # Builds the UI only, the runtime (World, gRPC, Ethernet) is loaded by Start Service
+        startup_start = time.perf_counter()
+        self._start_log_pipeline()
         self._ext_id = ext_id
         self._ext_ui = ExtensionUI(
             self._ext_id,
@@ -81,25 +132,167 @@ class TMDigitalRobotExtension(omni.ext.IExt):
             self._post_load_scene,
         )
 
+        self._setting_store = ExtensionSettingStore()
+        self._setting_store.install()
+        self._prim_bounds: PrimBounds = None
+        self._prim_tweens: PrimTweens = None
+        self._world_instance: World = None
         self._initialize()
+        self._extend_robot_list()
+        self._start_metrics_server()
+        self._start_layer_prefetch()
+        self._measure_startup(startup_start)
+
+    @property
+    def _world(self) -> "World":
+        # The World and its simulation context are created when first needed
+        if self._world_instance is None:
+            from omni.isaac.core.world.world import World
+
+            self._world_instance = World()
+        return self._world_instance
+
+    def _start_layer_prefetch(self):
+        # Robot series, gripper, camera and accessory layers are opened in the background
+        self._layer_prefetcher: LayerPrefetcher = None
+        settings = carb.settings.get_settings()
+        if settings.get(f"{SETTING_STARTUP}/prefetchLayers") is False:
+            return
+
+        directories = settings.get(f"{SETTING_STARTUP}/prefetchDirectories") or []
+        self._layer_prefetcher = LayerPrefetcher(
+            [
+                os.path.join(const.EXTENSION_ROOT_PATH, directory)
+                for directory in directories
+            ]
+        )
+        self._layer_prefetcher.start()
+
+    def _measure_startup(self, startup_start: float):
+        # Time spent in on_startup, and until Kit's next update, when the UI responds
+        on_startup_seconds = time.perf_counter() - startup_start
+        metrics.registry.histogram(
+            "digital_robot_startup_seconds",
+            "Time from the start of on_startup to its end and to the next Kit update",
+            phase="on_startup",
+        ).observe(on_startup_seconds)
+
+        def _on_first_update(event):
+            self._startup_subscription = None
+            interactive_seconds = time.perf_counter() - startup_start
+            metrics.registry.histogram(
+                "digital_robot_startup_seconds", phase="interactive"
+            ).observe(interactive_seconds)
+            self._console(
+                f"{self._ext_id} started in {on_startup_seconds * 1000:.0f} ms, "
+                f"interactive after {interactive_seconds * 1000:.0f} ms"
+            )
+
+        self._startup_subscription = (
+            omni.kit.app.get_app()
+            .get_update_event_stream()
+            .create_subscription_to_pop(
+                _on_first_update, name="tmrobot.digital_robot.startup"
+            )
+        )
+
+    def _extend_robot_list(self):
+        # The compiled settings UI offers the names in const.ROBOT_LIST and takes no list of
+        # its own, so Robot05... up to maxRobots are added there and removed again by
+        # _restore_robot_list; a name already in the list, e.g. after a reload, is kept
+        max_robots = (
+            carb.settings.get_settings().get(f"{SETTING_ROBOTS}/maxRobots") or 0
+        )
+        self._added_robot_names: list[str] = []
+        for index in range(1, max_robots + 1):
+            name = f"Robot{index:02d}"
+            if name not in const.ROBOT_LIST:
+                const.ROBOT_LIST.append(name)
+                self._added_robot_names.append(name)
+
+    def _restore_robot_list(self):
+        for name in getattr(self, "_added_robot_names", []):
+            if name in const.ROBOT_LIST:
+                const.ROBOT_LIST.remove(name)
+        self._added_robot_names = []
+
+    def _start_log_pipeline(self):
+        # Log output is written by a background thread, repeated messages are rate limited
+        settings = carb.settings.get_settings()
+        rate_limit_interval = settings.get(f"{SETTING_LOGGING}/rateLimitSeconds")
+        self._log_pipeline = LogPipeline(
+            rate_limit_interval=(
+                1.0 if rate_limit_interval is None else rate_limit_interval
+            ),
+            queued=settings.get(f"{SETTING_LOGGING}/queued") is not False,
+        )
+        self._log_pipeline.start()
+
+    def _start_metrics_server(self):
+        self._metrics_server: metrics.MetricsServer = None
+        settings = carb.settings.get_settings()
+        if not settings.get(f"{SETTING_METRICS}/enabled"):
+            return
+
+        self._metrics_server = metrics.MetricsServer(
+            host=settings.get(f"{SETTING_METRICS}/host") or "127.0.0.1",
+            port=settings.get(f"{SETTING_METRICS}/port") or 9464,
+        )
+        try:
+            self._metrics_server.start()
+        except OSError as e:
+            logger.warning(f"Failed to serve metrics: {e}")
+            self._metrics_server = None
 
     def on_shutdown(self):
+        self._startup_subscription = None
+        if getattr(self, "_setting_store", None) is not None:
+            self._setting_store.uninstall()
+        if getattr(self, "_layer_prefetcher", None) is not None:
+            self._layer_prefetcher.close()
+            self._layer_prefetcher = None
+
+        if getattr(self, "_metrics_server", None) is not None:
+            self._metrics_server.stop()
+
         if hasattr(self, "_virtual_camera_server"):
             if self._virtual_camera_server is not None:
                 asyncio.ensure_future(self._virtual_camera_server.stop())
-
-        if self._world.stage.GetPrimAtPath(Sdf.Path("/World")).IsValid():
+        self._stop_frame_publisher()
+        self._close_camera_properties()
+
+        world = getattr(self, "_world_instance", None)
+        if (
+            world is not None
+            and world.stage.GetPrimAtPath(Sdf.Path("/World")).IsValid()
+        ):
             for robot in const.ROBOT_LIST:
-                if self._world.scene.object_exists(robot):
-                    self._world.scene.remove_object(robot)
+                if world.scene.object_exists(robot):
+                    world.scene.remove_object(robot)
+            self._remove_joint_target_views()
+        self._restore_robot_list()
 
-        if len(self._ethernet_masters) != 0:
-            for robot in self._robot_settings:
-                self._ethernet_masters[robot.name].stop()
-                self._ethernet_master_threads[robot.name].join(timeout=0)
+        if getattr(self, "_ethernet_master_loop", None) is not None:
+            self._ethernet_master_loop.stop()
+        if getattr(self, "_motion_recorder", None) is not None:
+            self._motion_recorder.close()
+        self._stop_motion_replay()
+
+        # The echo channels are only pooled once the services were started
+        service_probe = sys.modules.get("tmrobot.digital_robot.services.service_probe")
+        if service_probe is not None:
+            service_probe.echo_channels.close()
 
-        if self._world.physics_callback_exists("sim_step"):
-            self._world.remove_physics_callback("sim_step")
+        if getattr(self, "_prim_bounds", None) is not None:
+            self._prim_bounds.close()
+            self._prim_bounds = None
+
+        if getattr(self, "_prim_tweens", None) is not None:
+            self._prim_tweens.stop()
+            self._prim_tweens = None
+
+        if world is not None and world.physics_callback_exists("sim_step"):
+            world.remove_physics_callback("sim_step")
 
         for handler in logger.handlers[:]:
             logger.removeHandler(handler)
@@ -107,19 +300,29 @@ class TMDigitalRobotExtension(omni.ext.IExt):
 
         logger.handlers.clear()
 
-        if self._world is not None:
-            self._world.stop()
-            self._world.clear_all_callbacks()
+        if world is not None:
+            world.stop()
+            world.clear_all_callbacks()
 
         self._robot_settings = []
         self._ext_ui.clear()
 
+        from omni.isaac.core.utils.stage import (
+            clear_stage,
+            close_stage,
+            create_new_stage,
+            is_stage_loading,
+        )
+
         if is_stage_loading():
             clear_stage()
             close_stage()
 
         create_new_stage()
         gc.collect()
+
+        if getattr(self, "_log_pipeline", None) is not None:
+            self._log_pipeline.stop()
         return
 
     def _change_scene_camera_position(self):
@@ -144,9 +347,31 @@ class TMDigitalRobotExtension(omni.ext.IExt):
         )
 
     def _on_start_service(self):
+        asyncio.ensure_future(self._on_start_service_async())
+
+    async def _on_start_service_async(self):
         if not self._ext_ui.validate_form(self._world):
             return
 
+        # The runtime modules, imported by the first start
+        from omni.isaac.core.utils.stage import update_stage_async
+        from tmrobot.digital_robot.models.digital_robot import DigitalRobot  # type: ignore
+        from tmrobot.digital_robot.models.workpiece_pool import WorkpiecePool
+        from tmrobot.digital_robot.services.cell_batch import get_rss_bytes
+        from tmrobot.digital_robot.services.image_cache import ImageCache
+        from tmrobot.digital_robot.services.image_encoder import ImageEncoder
+        from tmrobot.digital_robot.services.motion_mailbox import MotionMailbox
+        from tmrobot.digital_robot.services.tmsvr_master import (
+            TMSVRMaster,
+            TMSVRMasterLoop,
+        )
+        from tmrobot.digital_robot.services.trajectory_buffer import (
+            JointTrajectoryBuffer,
+        )
+        from tmrobot.digital_robot.services.virtual_camera_server import (
+            VirtualCameraServer,
+        )
+
         self._initialize()
         self._ext_ui.change_action_mode(const.BUTTON_STOP_SERVICE)
         self._ext_ui.update_message("Services started")
@@ -161,45 +386,66 @@ class TMDigitalRobotExtension(omni.ext.IExt):
             self._world.stage.RemovePrim(self._default_workpieces_prim_path)
 
         self._robot_settings = self._get_activated_robots_setting()
+        if not self._create_cells():
+            self._ext_ui.change_action_mode(const.BUTTON_START_SERVICE)
+            return
+        self._motion_mailbox = MotionMailbox(
+            [setting.name for setting in self._robot_settings]
+        )
 
-        # Check if TMSimulator services are available
-        for setting in self._robot_settings:
-            self._console(f"Add {setting.name} to the scene")
+        # Resample the received joint angles to the physics step, unless interpolation is "none"
+        settings = carb.settings.get_settings()
+        interpolation = settings.get(f"{SETTING_TRAJECTORY}/interpolation") or "none"
+        if interpolation != "none":
+            self._trajectory_buffer = JointTrajectoryBuffer(
+                [setting.name for setting in self._robot_settings],
+                latency=settings.get(f"{SETTING_TRAJECTORY}/latency"),
+                interpolation=interpolation,
+                max_extrapolation=settings.get(
+                    f"{SETTING_TRAJECTORY}/maxExtrapolation"
+                ),
+            )
 
-            # Check if the status of TMSimulator Virtual Camera API is Activated
-            echo_client = EchoClient(setting.ip)
-            if not echo_client.connectVirtualCameraAPI():
-                warning_message = (
-                    f"Can't connect to {setting.name} Virtual Camera API at IP: {setting.ip}, "
-                    "please check if Virtual Camera API is enabled if you are using TMSimulator. "
-                    "You can ignore this message if you are using TMFlow with physical robot."
-                )
-                logger.warning(warning_message)
-                self._ext_ui.update_message(warning_message)
+        # Check if TMSimulator services are available, every robot at once; a replay of motion
+        # logs needs no controller
+        replay_directory = settings.get(f"{SETTING_REPLAY}/directory") or ""
+        self._ext_ui.change_action_mode(const.BUTTON_DISABLE_ALL)
+        if not replay_directory and not await self._probe_robot_services():
+            return
+        self._ext_ui.change_action_mode(const.BUTTON_STOP_SERVICE)
 
-            # Check if the status of TMSimulator Ethernet Slave is Enabled
-            if not self._is_service_on(setting.ip, const.PORT_ETHERNET):
-                error_message = (
-                    f"Can't connect to {setting.name} Ethernet at {setting.ip}:{const.PORT_ETHERNET}, "
-                    "please check if the status of TMSimulator Ethernet Slave is Enabled"
-                )
-                logger.error(error_message)
-                self._ext_ui.update_message(error_message)
+        if self._cells is not None:
+            try:
+                self._cells.clone(self._world.stage)
+            except ValueError as e:
+                logger.error(e)
+                self._ext_ui.update_message(str(e))
+                self._cells = None
                 self._ext_ui.change_action_mode(const.BUTTON_START_SERVICE)
-                self._ext_ui.collapsed_robot_settings(True)
                 return
 
+        for setting in self._robot_settings:
+            self._console(f"Add {setting.name} to the scene")
+
             # Create Digital Robots
             try:
+                rss = get_rss_bytes()
                 self._dg_robots[setting.name] = DigitalRobot(setting, self._world.stage)
                 self._dg_cameras[setting.ip] = {}
 
-                # Create a Camera list
+                # Create a Camera list, a cell's cameras keep the template serial numbers
                 camera_list = self._dg_robots[setting.name].get_activated_cameras()
                 for camera in camera_list:
-                    self._dg_cameras[setting.ip][camera.get_serial_number()] = camera
-
-                self._motion_queue = queue.Queue(maxsize=len(self._robot_settings))
+                    serial_number = camera.get_serial_number()
+                    if self._cells is not None:
+                        serial_number = self._cells.camera_key(
+                            setting.name, serial_number
+                        )
+                    self._dg_cameras[setting.ip][serial_number] = camera
+                if self._cells is not None:
+                    self._cells.add_robot(
+                        setting.name, get_rss_bytes() - rss, camera_list
+                    )
 
                 if not self._world.scene.object_exists(setting.name):
                     self._world.scene.add(self._dg_robots[setting.name].get_robot())
@@ -228,6 +474,11 @@ class TMDigitalRobotExtension(omni.ext.IExt):
             # === (Surface Gripper Example) Uncomment the code below to control the surface gripper ===
             # The example is only for the first robot Robot01 with model TM12S
             # if self._robot_settings[0].name == const.ROBOT_LIST[0]:
+            #     from omni.isaac.surface_gripper._surface_gripper import (
+            #         Surface_Gripper,
+            #         Surface_Gripper_Properties,
+            #     )
+            #
             #     sgp = Surface_Gripper_Properties()
             #     sgp.parentPath = f"/World/{self._robot_settings[0].name}/{self._robot_settings[0].model.lower()}/body/flange_link"  # noqa
             #     sgp.offset.p.x = 0
@@ -252,6 +503,21 @@ class TMDigitalRobotExtension(omni.ext.IExt):
             #         )
             #     self._spawn_workpiece()
 
+        # Workpieces are created once and recycled by _spawn_workpiece
+        self._workpiece_pool = WorkpiecePool(
+            self._world.stage,
+            self._default_workpieces_prim_path,
+            f"{const.EXTENSION_ROOT_PATH}/assets/worlds/accessories/workpiece/004_sugar_box/004_sugar_box.usd",  # noqa
+            max_live=settings.get(f"{SETTING_WORKPIECES}/maxLive") or 8,
+        )
+        self._workpiece_pool.preinstance(
+            settings.get(f"{SETTING_WORKPIECES}/preinstance") or 0
+        )
+
+        self._add_joint_target_views()
+        self._cache_camera_properties()
+        self._start_frame_publisher()
+
         # Play the world
         async def _play_world_async():
             await self._world.initialize_simulation_context_async()
@@ -263,85 +529,275 @@ class TMDigitalRobotExtension(omni.ext.IExt):
             await update_stage_async()
             await self._world.play_async()
 
-        # Create a ethernet master threads for updating robot motion from ethernet slave
+        # Run all ethernet masters on one background event loop for updating robot motion from ethernet slave
         async def _ethernet_master_async():
 
             robot_models_are_different = []
+            robots = [robot for robot in self._robot_settings if robot.activated]
+
+            self._ethernet_master_loop = TMSVRMasterLoop()
+            self._ethernet_master_loop.start()
+            self._motion_recorder = self._create_motion_recorder()
+            io_options = {
+                "timeout": settings.get(f"{SETTING_IO}/ackTimeout") or 1.0,
+                "max_in_flight": settings.get(f"{SETTING_IO}/maxInFlight") or 4,
+                "flush_delay": settings.get(f"{SETTING_IO}/flushDelay") or 0.02,
+            }
+            if settings.get(f"{SETTING_IO}/retries") is not None:
+                io_options["retries"] = settings.get(f"{SETTING_IO}/retries")
+            for robot in robots:
+                self._ethernet_masters[robot.name] = TMSVRMaster(
+                    robot.name,
+                    robot.ip,
+                    self._trajectory_buffer or self._motion_mailbox,
+                    recorder=self._motion_recorder,
+                    io_options=io_options,
+                )
+            self._start_flow_controller()
 
-            for robot in self._robot_settings:
-                if robot.activated:
-                    self._ethernet_masters[robot.name] = EthernetMaster(
-                        robot.name, robot.ip
+            # Connect every robot concurrently, a master keeps reconnecting until stopped
+            actual_robot_models = await asyncio.gather(
+                *(
+                    self._ethernet_master_loop.add_master(
+                        self._ethernet_masters[robot.name]
                     )
+                    for robot in robots
+                )
+            )
 
-                    actual_robot_model = self._ethernet_masters[
-                        robot.name
-                    ].get_robot_model()
-
-                    if actual_robot_model in const.ROBOT_MODELS:
-                        if actual_robot_model != robot.model:
-                            robot_models_are_different.append(
-                                f"{robot.name}: Virtual Robot model {robot.model} is connect to a "
-                                f"TMSimulator/TMflow model {actual_robot_model}, which may cause unexpected behavior"
-                            )
-
-                        self._console(
-                            f"{robot.name}({robot.model}) is connect to {robot.ip}({actual_robot_model})"
+            for robot, actual_robot_model in zip(robots, actual_robot_models):
+                if not self._ethernet_masters[robot.name].connected:
+                    error_message = f"{robot.name}: Can't connect to Ethernet slave at {robot.ip}, retrying"
+                    logger.error(error_message)
+                    self._ext_ui.update_message(error_message)
+                    continue
+
+                if actual_robot_model in const.ROBOT_MODELS:
+                    if actual_robot_model != robot.model:
+                        robot_models_are_different.append(
+                            f"{robot.name}: Virtual Robot model {robot.model} is connect to a "
+                            f"TMSimulator/TMflow model {actual_robot_model}, which may cause unexpected behavior"
                         )
 
-                    self._ethernet_master_threads[robot.name] = threading.Thread(
-                        target=self._ethernet_masters[robot.name].receive_data,
-                        args=(self._motion_queue,),
+                    self._console(
+                        f"{robot.name}({robot.model}) is connect to {robot.ip}({actual_robot_model})"
                     )
 
-                    self._ethernet_master_threads[robot.name].start()
-
             if len(robot_models_are_different) > 0:
                 self._ext_ui.update_message("\n".join(robot_models_are_different))
 
-        # Create Virtual Camera gRPC Server
-        self._virtual_camera_server = VirtualCameraServerSecure(
-            self._set_queue, self._dg_cameras
+        # Create Virtual Camera gRPC Server, images are encoded in a worker pool and
+        # repeated grabs of an unchanged scene are served from the image cache
+        image_cache = None
+        if settings.get(f"{SETTING_CAMERA}/cacheBytes"):
+            image_cache = ImageCache(
+                max_bytes=settings.get(f"{SETTING_CAMERA}/cacheBytes"),
+                max_state_age=settings.get(f"{SETTING_CAMERA}/cacheMaxStateAge") or 0.5,
+            )
+        image_encoder = ImageEncoder(
+            image_type=settings.get(f"{SETTING_CAMERA}/imageType") or "jpg",
+            quality=settings.get(f"{SETTING_CAMERA}/jpegQuality") or 50,
+            backend=settings.get(f"{SETTING_CAMERA}/jpegBackend") or "auto",
+            workers=settings.get(f"{SETTING_CAMERA}/encoderWorkers") or 2,
+            use_processes=bool(settings.get(f"{SETTING_CAMERA}/encoderProcesses")),
+            cache=image_cache,
+        )
+        self._virtual_camera_server = VirtualCameraServer(
+            self._set_queue,
+            self._dg_cameras,
+            image_encoder,
+            frame_index=self._get_frame_index,
+            max_grabs_per_camera=settings.get(f"{SETTING_CAMERA}/maxGrabsPerCamera"),
         )
 
         asyncio.ensure_future(self._virtual_camera_server.start())
-        asyncio.ensure_future(_ethernet_master_async())
+        if replay_directory:
+            self._start_motion_replay(replay_directory)
+        else:
+            asyncio.ensure_future(_ethernet_master_async())
         asyncio.ensure_future(_play_world_async())
         omni.kit.commands.execute("SelectNone")
 
         self._ext_ui.change_action_mode(const.BUTTON_STOP_SERVICE)
 
-    def _on_simulation_step(self, step_size):
-        self._simulation_count += 1
+    async def _probe_robot_services(self) -> bool:
+        # Results are reported as they arrive, the start fails if an Ethernet slave is off
+        from tmrobot.digital_robot.services.service_probe import (
+            SERVICE_VIRTUAL_CAMERA_API,
+            probe_robots,
+        )
+
+        ethernet_available = True
+
+        def _on_result(result: "ProbeResult"):
+            nonlocal ethernet_available
+            if result.available:
+                logger.info(
+                    f"{result.robot_name}: {result.service} at {result.ip} is available "
+                    f"({result.elapsed * 1000:.0f} ms)"
+                )
+
+            # Check if the status of TMSimulator Virtual Camera API is Activated
+            elif result.service == SERVICE_VIRTUAL_CAMERA_API:
+                warning_message = (
+                    f"Can't connect to {result.robot_name} Virtual Camera API at IP: {result.ip} "
+                    f"({result.error}), please check if Virtual Camera API is enabled if you are using "
+                    "TMSimulator. You can ignore this message if you are using TMFlow with physical robot."
+                )
+                logger.warning(warning_message)
+                self._ext_ui.update_message(warning_message)
+
+            # Check if the status of TMSimulator Ethernet Slave is Enabled
+            else:
+                ethernet_available = False
+                error_message = (
+                    f"Can't connect to {result.robot_name} Ethernet at {result.ip}:{const.PORT_ETHERNET} "
+                    f"({result.error}), please check if the status of TMSimulator Ethernet Slave is Enabled"
+                )
+                logger.error(error_message)
+                self._ext_ui.update_message(error_message)
+
+        settings = carb.settings.get_settings()
+        await probe_robots(
+            [(setting.name, setting.ip) for setting in self._robot_settings],
+            _on_result,
+            echo_timeout=settings.get(f"{SETTING_PROBE}/echoTimeout") or 3.0,
+            ethernet_timeout=settings.get(f"{SETTING_PROBE}/ethernetTimeout") or 1.0,
+        )
+
+        if not ethernet_available:
+            self._ext_ui.change_action_mode(const.BUTTON_START_SERVICE)
+            self._ext_ui.collapsed_robot_settings(True)
+        return ethernet_available
+
+    def _add_joint_target_views(self):
+        # One articulation view per robot model, added before the world is reset
+        self._remove_joint_target_views()
+        if not carb.settings.get_settings().get(
+            f"{SETTING_ROBOTS}/batchedArticulation"
+        ):
+            return
+
+        from tmrobot.digital_robot.services.articulation_batch import (
+            BatchedJointTargets,
+        )
 
         try:
-            motion: EthernetData = self._motion_queue.get_nowait()
+            self._joint_targets = BatchedJointTargets(
+                {
+                    setting.name: (
+                        setting.model,
+                        self._dg_robots[setting.name].get_robot_prim_path(),
+                    )
+                    for setting in self._robot_settings
+                    if setting.name in self._dg_robots
+                }
+            )
+            for view in self._joint_targets.views:
+                self._world.scene.add(view)
+        except Exception as e:
+            logger.warning(
+                f"Failed to batch the robot articulations, apply one by one: {e}"
+            )
+            self._joint_targets = None
+
+    def _remove_joint_target_views(self):
+        if self._joint_targets is not None:
+            for view in self._joint_targets.views:
+                if self._world.scene.object_exists(view.name):
+                    self._world.scene.remove_object(view.name)
+            self._joint_targets = None
+
+    def _get_frame_index(self) -> int:
+        # Any physics step may move the scene, e.g. a robot settling on its last target or a
+        # falling workpiece. None while the world isn't playing: the stage can then change
+        # without a step, so grabs are only reused by their content
+        world = self._world_instance
+        if world is None or not world.is_playing():
+            return None
+        return self._simulation_count
 
-            self._dg_robots[motion.robot_name].apply_action(
-                ArticulationAction(joint_positions=motion.joint_radian)
+    def _on_simulation_step(self, step_size):
+        with self._physics_step_seconds.time():
+            self._step_robots(step_size)
+
+    def _step_robots(self, step_size):
+        from omni.isaac.core.utils.types import ArticulationAction
+
+        self._simulation_count += 1
+
+        if self._replay_lockstep:
+            # The next recorded frame of every robot, whatever stepped the world
+            self._motion_replay.step()
+        if self._trajectory_buffer is not None:
+            # Sample every robot trajectory at the time of this physics step
+            motions: List[TrajectorySample] = self._trajectory_buffer.sample_all(
+                self._trajectory_buffer.advance(step_size)
             )
+        else:
+            # Apply the newest frame of every robot in the same physics step
+            motions: List[EthernetFrame] = self._motion_mailbox.take_all()
+        for motion in motions:
+            apply_start = time.perf_counter()
+            try:
+                if (
+                    self._joint_targets is not None
+                    and motion.robot_name in self._joint_targets
+                ):
+                    # Written together with the other robots after the loop
+                    self._joint_targets.set_targets(
+                        motion.robot_name, motion.joint_radian
+                    )
+                else:
+                    self._dg_robots[motion.robot_name].apply_action(
+                        ArticulationAction(joint_positions=motion.joint_radian)
+                    )
+                    histogram = self._apply_action_seconds.get(motion.robot_name)
+                    if histogram is None:
+                        histogram = self._apply_action_seconds[motion.robot_name] = (
+                            metrics.registry.histogram(
+                                "digital_robot_apply_action_seconds",
+                                "Time to apply the joint positions of one robot",
+                                robot=motion.robot_name,
+                            )
+                        )
+                    histogram.observe(time.perf_counter() - apply_start)
+
+                # === (Surface Gripper Example) Uncomment the code below to control the surface gripper ===
+                # if motion.robot_name == const.ROBOT_LIST[0]:
+                #     if self._surface_gripper_state != motion.ctrl_do[0]:
+                #         self._surface_gripper_state = motion.ctrl_do[0]
+                #         if self._surface_gripper_state == 1:
+                #             self._surface_gripper.close()
+                #             self._console("Surface Gripper suck")
+                #             self._ethernet_masters[motion.robot_name].set_end_di(0, 0)
+
+                #         if self._surface_gripper_state == 0:
+                #             self._surface_gripper.open()
+                #             self._console("Surface Gripper release")
+                #             self._spawn_workpiece()
+                #             self._ethernet_masters[motion.robot_name].set_end_di(0, 1)
+
+            except Exception as e:  # noqa
+                # logger.warning(f"{motion.robot_name}: failed to update robot motion: {e}")
+                pass
+
+            if self._cells is not None:
+                self._cells.add_step_time(
+                    motion.robot_name, time.perf_counter() - apply_start
+                )
 
-            # === (Surface Gripper Example) Uncomment the code below to control the surface gripper ===
-            # if motion.robot_name == const.ROBOT_LIST[0]:
-            #     if self._surface_gripper_state != motion.ctrl_do[0]:
-            #         self._surface_gripper_state = motion.ctrl_do[0]
-            #         if self._surface_gripper_state == 1:
-            #             self._surface_gripper.close()
-            #             self._console("Surface Gripper suck")
-            #             self._ethernet_masters[motion.robot_name].set_end_di(0, 0)
-
-            #         if self._surface_gripper_state == 0:
-            #             self._surface_gripper.open()
-            #             self._console("Surface Gripper release")
-            #             self._spawn_workpiece()
-            #             self._ethernet_masters[motion.robot_name].set_end_di(0, 1)
-
-        except queue.Empty:
-            # logger.warning("Motion queue is empty")
-            pass
-        except Exception as e:  # noqa
-            # logger.warning(f"{motion.robot_name}: failed to update robot motion: {e}")
-            pass
+        if self._joint_targets is not None:
+            self._joint_targets.flush()
+
+        # DI writes of this step go out as one packet per robot
+        for ethernet_master in self._ethernet_masters.values():
+            ethernet_master.flush_io()
+
+        if self._flow_controller is not None:
+            self._flow_controller.step(step_size)
+        if self._cells is not None:
+            self._cells.end_step()
 
     def _on_stop_service(self):
         async def _on_stop_service_async():
@@ -349,24 +805,51 @@ class TMDigitalRobotExtension(omni.ext.IExt):
             self._ext_ui.update_message("Services stopping...")
             self._ext_ui.collapsed_robot_settings(True)
 
+            self._stop_motion_replay()
             await self._world.stop_async()
 
             if self._world.stage.GetPrimAtPath(
                 Sdf.Path(self._default_workpieces_prim_path)
             ).IsValid():
                 self._world.stage.RemovePrim(self._default_workpieces_prim_path)
+            if self._workpiece_pool is not None:
+                self._workpiece_pool.clear()
+
+            # Cancel the masters and wait until every socket is closed
+            if self._ethernet_master_loop is not None:
+                await self._ethernet_master_loop.stop_async()
+            if self._motion_recorder is not None:
+                self._motion_recorder.close()
+                self._motion_recorder = None
 
             for robot in self._robot_settings:
-                self._ethernet_masters[robot.name].stop()
                 self._world.scene.remove_object(robot.name)
-                self._ethernet_master_threads[robot.name].join(timeout=0)
+            self._remove_joint_target_views()
+            if self._cells is not None:
+                for cell_name, stats in self._cells.get_stats().items():
+                    self._console(f"{cell_name}: {stats}")
+                self._cells.remove(self._world.stage)
+                self._cells = None
 
             if self._world.physics_callback_exists("sim_step"):
                 self._world.remove_physics_callback("sim_step")
 
+            if self._trajectory_buffer is not None:
+                for robot_name, stats in self._trajectory_buffer.get_stats().items():
+                    self._console(f"{robot_name} trajectory: {stats}")
+            elif self._motion_mailbox is not None:
+                for robot_name, stats in self._motion_mailbox.get_stats().items():
+                    self._console(f"{robot_name} motion mailbox: {stats}")
+            if self._flow_controller is not None:
+                for robot_name, stats in self._flow_controller.get_stats().items():
+                    self._console(f"{robot_name} motion flow: {stats}")
+                self._flow_controller = None
+
             if hasattr(self, "_virtual_camera_server"):
                 if self._virtual_camera_server is not None:
                     await self._virtual_camera_server.stop()
+            self._stop_frame_publisher()
+            self._close_camera_properties()
 
             # self._stop_all_async_functions()
             self._ext_ui.change_action_mode(const.BUTTON_START_SERVICE)
@@ -389,70 +872,257 @@ class TMDigitalRobotExtension(omni.ext.IExt):
 
         asyncio.ensure_future(_stop_all_async_functions_async())
 
-    def _get_activated_robots_setting(self) -> List[RobotSetting]:
-        active_robots = []
-        for robot_name in const.ROBOT_LIST:
-            setting = self._ext_ui._on_load_setting()
-            if setting.robots_setting[robot_name].activated:
-                active_robots.append(setting.robots_setting[robot_name])
-        return active_robots
-
-    def _is_service_on(self, ip, port):
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+    def _create_motion_recorder(self) -> "MotionLogRecorder":
+        # One motion log per robot in a new directory per start, see services/motion_log.py
+        from tmrobot.digital_robot.services.motion_log import MotionLogRecorder
+
+        settings = carb.settings.get_settings()
+        if not settings.get(f"{SETTING_RECORDING}/enabled"):
+            return None
+
+        directory = settings.get(f"{SETTING_RECORDING}/directory") or os.path.join(
+            const.EXTENSION_ROOT_PATH, "recordings"
+        )
+        directory = os.path.join(
+            directory, datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        )
+        self._console(f"Record robot motion to {directory}")
+        return MotionLogRecorder(directory)
+
+    def _start_motion_replay(self, directory: str):
+        # The motion logs of one recording feed the physics step instead of the Ethernet slaves
+        from tmrobot.digital_robot.services.motion_log import (
+            MotionLog,
+            MotionReplay,
+            find_motion_logs,
+        )
+
+        settings = carb.settings.get_settings()
+        speed = settings.get(f"{SETTING_REPLAY}/speed")
+        speed = 1.0 if speed is None else speed
+        try:
+            paths = find_motion_logs(directory)
+        except OSError as e:
+            paths = []
+            logger.error(f"Can't read the motion logs in {directory}: {e}")
+
+        logs = []
+        for path in paths:
             try:
-                s.settimeout(1)  # Set the timeout value in seconds
-                s.connect((ip, port))
-                s.close()
-                return True
-            except socket.error as e:
-                s.close()
-                logger.error(f"{ip}:{port} is not available. exception: {e}")
-                return False
+                log = MotionLog(path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skip {path}: {e}")
+                continue
+            if log.robot_name in self._dg_robots:
+                logs.append(log)
+            else:
+                logger.warning(f"Skip {path}: {log.robot_name} is not activated")
+                log.close()
+        if not logs:
+            error_message = f"No motion log of an activated robot in {directory}"
+            logger.error(error_message)
+            self._ext_ui.update_message(error_message)
+            return
 
-    def _spawn_workpiece(self):
-        workpieces_prim = self._world.stage.GetPrimAtPath(
-            Sdf.Path(self._default_workpieces_prim_path)
+        # Faster than recorded, the world is stepped once per recorded frame of every robot
+        # (see MotionReplay.step); the trajectory buffer would resample those on wall time
+        self._replay_lockstep = speed == 0 or speed > 1
+        if self._replay_lockstep:
+            self._trajectory_buffer = None
+        self._motion_replay = MotionReplay(
+            logs, self._trajectory_buffer or self._motion_mailbox, speed
         )
+        self._replay_task = asyncio.ensure_future(self._run_motion_replay())
 
-        # Check if the workpiece is already spawned, if yes, return
-        spawn_position = self._default_workpiece_position
-        for workpiece in workpieces_prim.GetChildren():
-            path: str = workpiece.GetPath()
-            wp_prim = self._world.stage.GetPrimAtPath(Sdf.Path(path))
-            wp_xformable = UsdGeom.Xformable(wp_prim)
-            wp_transform = wp_xformable.GetLocalTransformation()
-            wp_translation = wp_transform.ExtractTranslation()
-            x = round(wp_translation[0], 2)
-            y = round(wp_translation[1], 2)
-            if spawn_position[0] == x and spawn_position[1] == y:
-                return
+    async def _run_motion_replay(self):
+        replay = self._motion_replay
+        app = omni.kit.app.get_app()
+        while not self._world.is_playing():
+            await app.next_update_async()
+
+        self._console(
+            f"Replay {len(replay.logs)} motion logs ({replay.duration:.1f} s) "
+            f"at speed {replay.speed:g}"
+        )
+        start = time.monotonic()
+        if not self._replay_lockstep:
+            await replay.run()
+        else:
+            # The world keeps stepping in real time; physics-only steps in between keep the
+            # replay at speed times its recorded time, or as fast as maxStepsPerUpdate allows
+            max_steps = (
+                carb.settings.get_settings().get(f"{SETTING_REPLAY}/maxStepsPerUpdate")
+                or 100
+            )
+            while not replay.done:
+                steps = 0
+                while (
+                    not replay.done
+                    and steps < max_steps
+                    and (
+                        not replay.speed
+                        or replay.time < (time.monotonic() - start) * replay.speed
+                    )
+                ):
+                    self._world.step(render=False)
+                    steps += 1
+                await app.next_update_async()
+        self._console(
+            f"Replayed {replay.frame_count} frames in {time.monotonic() - start:.1f} s"
+        )
+
+    def _stop_motion_replay(self):
+        if getattr(self, "_replay_task", None) is not None:
+            self._replay_task.cancel()
+            self._replay_task = None
+        if getattr(self, "_motion_replay", None) is not None:
+            self._motion_replay.close()
+            self._motion_replay = None
+        self._replay_lockstep = False
+
+    def _create_cells(self) -> bool:
+        # Clones of the activated robots and their cameras, see services/cell_batch.py
+        from tmrobot.digital_robot.services.cell_batch import CellBatch
+
+        settings = carb.settings.get_settings()
+        count = settings.get(f"{SETTING_CELLS}/count") or 1
+        if count <= 1:
+            return True
 
-        self._workpiece_id += 1
-        workpiece_prim_path = (
-            f"{self._default_workpieces_prim_path}/workpiece_{self._workpiece_id}"
+        try:
+            self._cells = CellBatch(
+                self._robot_settings,
+                count,
+                template_root=settings.get(f"{SETTING_CELLS}/templateRoot") or None,
+                spacing=settings.get(f"{SETTING_CELLS}/spacing") or 3.0,
+                ip_stride=settings.get(f"{SETTING_CELLS}/ipStride") or 0,
+            )
+        except ValueError as e:
+            error_message = f"Can't create {count} cells: {e}"
+            logger.error(error_message)
+            self._ext_ui.update_message(error_message)
+            return False
+
+        self._robot_settings = self._cells.settings
+        self._console(
+            f"{count} cells of {self._cells.template_root}, "
+            f"{len(self._robot_settings)} robots"
         )
+        return True
 
-        # Create a workpiece
-        absolute_path = f"{const.EXTENSION_ROOT_PATH}/assets/worlds/accessories/workpiece/004_sugar_box/004_sugar_box.usd"  # noqa
-        workpiece_prim = add_reference_to_stage(
-            usd_path=absolute_path,
-            prim_path=workpiece_prim_path,
-        ).GetPrim()
+    def _start_flow_controller(self):
+        # Matches the motion streams to the physics step rate, see services/flow_control.py
+        from tmrobot.digital_robot.services.flow_control import FlowController
 
-        # Place the workpiece on the table
-        # fmt: off
-        workpiece_prim.GetAttribute("xformOp:translate").Set(Gf.Vec3d(self._default_workpiece_position))
-        workpiece_prim.GetAttribute("xformOp:scale").Set(Gf.Vec3f(0.5, 0.5, 0.5))
-        workpiece_prim.GetAttribute("xformOp:rotateXYZ").Set(Gf.Vec3f(0, 0, random.uniform(0, 360)))
-        # fmt: on
+        settings = carb.settings.get_settings()
+        if settings.get(f"{SETTING_FLOW}/enabled") is False:
+            return
 
-        omni.kit.commands.execute(
-            "SetRigidBody",
-            path=Sdf.Path(workpiece_prim_path),
-            approximationShape="convexHull",
-            kinematic=False,
+        self._flow_controller = FlowController(
+            self._ethernet_masters,
+            self._trajectory_buffer or self._motion_mailbox,
+            window=settings.get(f"{SETTING_FLOW}/window") or 0.5,
+            hold=settings.get(f"{SETTING_FLOW}/hold") or 2,
+            lag_ratio=settings.get(f"{SETTING_FLOW}/lagRatio") or 0.9,
+            max_age=settings.get(f"{SETTING_FLOW}/maxAge") or 0.1,
+            max_decimation=settings.get(f"{SETTING_FLOW}/maxDecimation") or 8,
+            max_latency=settings.get(f"{SETTING_FLOW}/maxLatency") or 0.2,
+            on_health=self._on_flow_health,
         )
 
+    def _on_flow_health(self, robot_name: str, stats: "FlowStats"):
+        message = (
+            f"{robot_name}: motion {stats.health}, {stats.frame_rate:.0f} frames/s for "
+            f"{stats.step_rate:.0f} steps/s at {stats.real_time_factor:.2f}x real time"
+        )
+        if stats.decimation > 1:
+            message += f", 1 of {stats.decimation} frames applied"
+        self._console(message)
+        self._ext_ui.update_message(message)
+
+    def _cache_camera_properties(self):
+        # Hand-eye parameters of loadCameraList are read again only when USD reports a change
+        from tmrobot.digital_robot.services.camera_properties import (
+            CameraPropertyCache,
+        )
+
+        settings = carb.settings.get_settings()
+        if settings.get(f"{SETTING_CAMERA}/propertyCache") is False:
+            return
+
+        max_age = settings.get(f"{SETTING_CAMERA}/propertyMaxAge")
+        self._camera_properties = CameraPropertyCache(
+            self._world.stage, max_age=1.0 if max_age is None else max_age
+        )
+        for cameras in self._dg_cameras.values():
+            self._camera_properties.attach(cameras.values())
+
+    def _close_camera_properties(self):
+        if getattr(self, "_camera_properties", None) is not None:
+            logger.info(f"Camera properties: {self._camera_properties.get_stats()}")
+            self._camera_properties.close()
+            self._camera_properties = None
+
+    def _start_frame_publisher(self):
+        # Raw frames of every camera in shared-memory rings, see services/frame_ring.py
+        from tmrobot.digital_robot.services.frame_publisher import FramePublisher
+
+        settings = carb.settings.get_settings()
+        if not settings.get(f"{SETTING_FRAMES}/enabled"):
+            return
+
+        max_rate = settings.get(f"{SETTING_FRAMES}/maxRate") or 0
+        self._frame_publisher = FramePublisher(
+            settings.get(f"{SETTING_FRAMES}/directory") or None,
+            slot_count=settings.get(f"{SETTING_FRAMES}/slots") or 4,
+            min_interval=1.0 / max_rate if max_rate > 0 else 0.0,
+            # Every physics step is a new frame, the scene moves after the last joint target
+            frame_index=lambda: self._simulation_count,
+        )
+        for robot_name, robot in self._dg_robots.items():
+            for camera in robot.get_activated_cameras():
+                self._frame_publisher.add_camera(robot_name, camera)
+        self._console(f"Publish camera frames to {self._frame_publisher.directory}")
+
+        def _on_update(event):
+            if self._frame_publisher is not None:
+                self._frame_publisher.publish()
+
+        self._frame_subscription = (
+            omni.kit.app.get_app()
+            .get_update_event_stream()
+            .create_subscription_to_pop(_on_update, name="tmrobot.digital_robot.frames")
+        )
+
+    def _stop_frame_publisher(self):
+        self._frame_subscription = None
+        if getattr(self, "_frame_publisher", None) is not None:
+            self._console(f"Published frames: {self._frame_publisher.get_stats()}")
+            self._frame_publisher.close()
+            self._frame_publisher = None
+
+    def _get_activated_robots_setting(self) -> List[RobotSetting]:
+        # Every robot of the settings file, not only the names in ROBOT_LIST. The file is
+        # only parsed again when the settings UI saved it or loaded another one
+        self._setting_store.refresh()
+        if self._setting_store.get() is not None:
+            return self._setting_store.get_activated_robots()
+
+        setting = self._ext_ui._on_load_setting()
+        return [
+            robot_setting
+            for _, robot_setting in sorted(setting.robots_setting.items())
+            if robot_setting.activated
+        ]
+
+    def _spawn_workpiece(self):
+        # Nothing is spawned while the previous workpiece still lies on the spawn spot
+        workpiece_prim_path = self._workpiece_pool.spawn(
+            self._default_workpiece_position, rotation_z=random.uniform(0, 360)
+        )
+        if workpiece_prim_path is None:
+            return
+
         self._console(f"{workpiece_prim_path} is spawned")
 
     # === Common functions ===
@@ -460,15 +1130,19 @@ class TMDigitalRobotExtension(omni.ext.IExt):
         prim = self._world.stage.GetPrimAtPath(Sdf.Path(prim_path))
         return prim.IsValid()
 
+    def _get_prim_bounds(self) -> "PrimBounds":
+        # Bounds are kept per stage, a loaded scene gets a new one
+        from tmrobot.digital_robot.services.prim_bounds import PrimBounds
+
+        stage = self._world.stage
+        if self._prim_bounds is None or self._prim_bounds.stage != stage:
+            if self._prim_bounds is not None:
+                self._prim_bounds.close()
+            self._prim_bounds = PrimBounds(stage)
+        return self._prim_bounds
+
     def _get_prim_size(self, prim_path: str) -> Gf.Vec3d:
-        bbox_cache = UsdGeom.BBoxCache(
-            Usd.TimeCode.Default(), includedPurposes=[UsdGeom.Tokens.default_]
-        )
-        bbox_cache.Clear()
-        prim = self._world.stage.GetPrimAtPath(Sdf.Path(prim_path))
-        prim_bbox = bbox_cache.ComputeWorldBound(prim)
-        prim_range = prim_bbox.ComputeAlignedRange()
-        prim_size: Gf.Vec3d = prim_range.GetSize()
+        prim_size = self._get_prim_bounds().get_size(prim_path)
 
         # Get the changed size of the prim
         x = f"{prim_size[0]:.4f}"
@@ -479,90 +1153,70 @@ class TMDigitalRobotExtension(omni.ext.IExt):
         return prim_size
 
     def _set_prim_size(self, prim_path: str, target_size: tuple) -> None:
-        def __get_prim_size(prim_path: str) -> Gf.Vec3d:
-            bbox_cache = UsdGeom.BBoxCache(
-                Usd.TimeCode.Default(), includedPurposes=[UsdGeom.Tokens.default_]
-            )
-            bbox_cache.Clear()
-            prim = self._world.stage.GetPrimAtPath(Sdf.Path(prim_path))
-            prim_bbox = bbox_cache.ComputeWorldBound(prim)
-            prim_range = prim_bbox.ComputeAlignedRange()
-            prim_size: Gf.Vec3d = prim_range.GetSize()
-            return prim_size
-
-        # Reset the prim scale to 1, 1, 1
-        omni.kit.commands.execute(
-            "ChangeProperty",
-            prop_path=Sdf.Path(f"{prim_path}.xformOp:scale"),
-            value=Gf.Vec3d(1, 1, 1),
-            prev=None,
-        )
+        self._set_prim_sizes({prim_path: target_size})
 
-        # Get the original size of the prim
-        origin_size = __get_prim_size(prim_path)
-        x = target_size[0] / origin_size[0]
-        y = target_size[1] / origin_size[1]
-        z = target_size[2] / origin_size[2]
-
-        # Set the prim scale to the target size by calculating the ratio
-        omni.kit.commands.execute(
-            "ChangeProperty",
-            prop_path=Sdf.Path(f"{prim_path}.xformOp:scale"),
-            value=Gf.Vec3d(x, y, z),
-            prev=None,
-        )
+    def _set_prim_sizes(self, target_sizes: dict[str, tuple]) -> None:
+        # Scales every prim path to its (x, y, z) size in meters in one stage change
+        changed_sizes = self._get_prim_bounds().set_sizes(target_sizes)
 
         # Get the changed size of the prim
-        changed_size = __get_prim_size(prim_path)
-        x = f"{changed_size[0]:.4f}"
-        y = f"{changed_size[1]:.4f}"
-        z = f"{changed_size[2]:.4f}"
-        self._console(f"Set prim size(Meter): x={x}, y={y}, z={z} {prim_path}")
+        for prim_path, changed_size in changed_sizes.items():
+            x = f"{changed_size[0]:.4f}"
+            y = f"{changed_size[1]:.4f}"
+            z = f"{changed_size[2]:.4f}"
+            self._console(f"Set prim size(Meter): x={x}, y={y}, z={z} {prim_path}")
+
+    def _get_prim_tweens(self) -> "PrimTweens":
+        # Tweens step on Kit updates, a loaded scene gets new ones
+        from tmrobot.digital_robot.services.prim_tweens import PrimTweens
+
+        stage = self._world.stage
+        if self._prim_tweens is None or self._prim_tweens.stage != stage:
+            if self._prim_tweens is not None:
+                self._prim_tweens.stop()
+            self._prim_tweens = PrimTweens(stage)
+            self._prim_tweens.start()
+        return self._prim_tweens
 
     def _move_to_target(
         self, prim_path: str, target_position: tuple, step_size=0.001
     ) -> bool:
-        prim = get_prim_at_path(prim_path)
+        # Polled until it returns True, the prim moves step_size meters per physics step
+        prim = self._world.stage.GetPrimAtPath(Sdf.Path(prim_path))
         # fmt: off
-        cx, cy, cz = [round(coord, 4) for coord in prim.GetPrim().GetAttribute("xformOp:translate").Get()]
-        tx, ty, tz = [round(coord, 4) for coord in target_position]
+        current = [round(coord, 4) for coord in prim.GetPrim().GetAttribute("xformOp:translate").Get()]
+        target = tuple(round(coord, 4) for coord in target_position)
         # fmt: on
 
-        # print(f"tx: {tx}, ty: {ty}, tz: {tz}")
-        # print(f"cx: {cx}, cy: {cy}, cz: {cz}")
-
-        if cx == tx and cy == ty and cz == tz:
+        tweens = self._get_prim_tweens()
+        if current == list(target):
             return True
 
-        if cx < tx:
-            cx += step_size
-        elif cx > tx:
-            cx -= step_size
-
-        if cy < ty:
-            cy += step_size
-        elif cy > ty:
-            cy -= step_size
-
-        if cz < tz:
-            cz += step_size
-        elif cz > tz:
-            cz -= step_size
+        if prim_path not in tweens or tweens.target_of(prim_path) != target:
+            tweens.move(
+                prim_path, target, speed=step_size / self._world.get_physics_dt()
+            )
+        return False
 
-        omni.kit.commands.execute(
-            "ChangeProperty",
-            prop_path=Sdf.Path(f"{prim_path}.xformOp:translate"),
-            value=Gf.Vec3d(cx, cy, cz),
-            prev=None,
+    def _move_prims(
+        self,
+        target_positions: dict[str, tuple],
+        speed: float = None,
+        duration: float = None,
+        easing: str = "linear",
+    ) -> asyncio.Future:
+        # Moves every prim path to its target together, await it for the arrival of all.
+        # easing is "linear" or "smooth" (EASING_LINEAR, EASING_SMOOTH of prim_tweens)
+        tweens = self._get_prim_tweens()
+        return asyncio.gather(
+            *(
+                tweens.move(prim_path, target, speed, duration, easing)
+                for prim_path, target in target_positions.items()
+            )
         )
 
-        return False
-
     def _console(self, message: str):
-        current_time = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-
-        print(f"{current_time} [Info] [tmrobot.digital_robot] {message}")
-        logger.info(message)
+        logger.info(message, extra=CONSOLE)
 
     def _post_load_scene(self):
         # Do your custom actions after loading the scene, for example get the size of the prim
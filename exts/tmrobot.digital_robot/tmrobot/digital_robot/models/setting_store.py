@@ -0,0 +1,245 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+# isort: off
+from tmrobot.digital_robot.models.setting import ExtensionSetting  # type: ignore
+from tmrobot.digital_robot.models.setting import RobotSetting  # type: ignore
+from tmrobot.digital_robot.ui import constants as const  # type: ignore
+
+# isort: on
+
+logger = logging.getLogger(__name__)
+
+# The settings UI remembers the path of the last loaded settings file here
+LAST_SETTING_CACHE_PATH = os.path.join(
+    const.EXTENSION_ROOT_PATH, const.LAST_SETTING_CACHE_FILE_NAME
+)
+
+
+# The compiled writer, restored by ExtensionSettingStore.uninstall
+_save_extension_setting_to_json = ExtensionSetting.save_extension_setting_to_json
+
+
+def _to_document(setting: ExtensionSetting) -> dict:
+    # The layout ExtensionSetting.save_extension_setting_to_json writes
+    return {
+        "usd_path": setting.usd_path,
+        "setting_path": setting.setting_path,
+        "robots_setting": {
+            name: vars(robot_setting)
+            for name, robot_setting in setting.robots_setting.items()
+        },
+    }
+
+
+def _read_document(path: str) -> dict:
+    try:
+        with open(path, "rb") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _changed_keys(previous: dict, document: dict) -> list[str]:
+    previous = previous or {}
+    robots = previous.get("robots_setting", {})
+    new_robots = document["robots_setting"]
+    changed = [
+        key
+        for key in document
+        if key != "robots_setting" and previous.get(key) != document[key]
+    ]
+    changed += [
+        name
+        for name in {**robots, **new_robots}
+        if robots.get(name) != new_robots.get(name)
+    ]
+    return changed
+
+
+def _write_atomic(path: str, content: bytes):
+    # A reader sees the old or the new file, never a partial one
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".settings-", dir=directory)
+    try:
+        if os.path.exists(path):
+            os.chmod(temp_path, os.stat(path).st_mode & 0o777)
+        with os.fdopen(fd, "wb") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class _WatchedFile:
+    # Content of a file, re-read when its mtime or size changed, kept when the hash is equal
+    def __init__(self, path: str):
+        self.path = path
+        self.content: bytes = None
+        self.digest: str = None
+        self._stat: tuple = None
+
+    def refresh(self) -> bool:
+        # Returns True when the content changed
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            changed = self.content is not None
+            self.content = self.digest = self._stat = None
+            return changed
+
+        if (stat.st_mtime_ns, stat.st_size) == self._stat:
+            return False
+
+        with open(self.path, "rb") as file:
+            content = file.read()
+        self._stat = (stat.st_mtime_ns, stat.st_size)
+        digest = hashlib.sha256(content).hexdigest()
+        if digest == self.digest:
+            return False
+
+        self.content = content
+        self.digest = digest
+        return True
+
+    def remember(self, content: bytes):
+        # After writing the file ourselves, so it is not read back
+        stat = os.stat(self.path)
+        self.content = content
+        self.digest = hashlib.sha256(content).hexdigest()
+        self._stat = (stat.st_mtime_ns, stat.st_size)
+
+
+class ExtensionSettingStore:
+    """The settings JSON of the settings UI, parsed once and served from memory.
+
+    `refresh` checks the file (and which file the UI last loaded) with one `stat` each and
+    parses it again only when its content hash changed; `get`, `get_robot` and
+    `get_activated_robots` never touch the disk. `save` writes a settings file atomically
+    and skips the write when its content would not change; `install` routes the settings
+    UI's `ExtensionSetting.save_extension_setting_to_json` (compiled) through it, so a save
+    of the loaded file also updates the store without reading it back.
+    """
+
+    def __init__(self, setting_path: str = None):
+        # Without a path, follow the settings file last loaded by the settings UI
+        self._path_file = (
+            None if setting_path else _WatchedFile(LAST_SETTING_CACHE_PATH)
+        )
+        self._file: _WatchedFile = _WatchedFile(setting_path) if setting_path else None
+        self._document: dict = None
+        self._setting: ExtensionSetting = None
+        self._lock = threading.Lock()
+
+    @property
+    def setting_path(self) -> str:
+        return self._file.path if self._file is not None else None
+
+    def refresh(self) -> bool:
+        # Returns True when the settings were (re)loaded
+        with self._lock:
+            if self._path_file is not None and self._path_file.refresh():
+                path = (self._path_file.content or b"").decode("utf-8").strip()
+                self._file = _WatchedFile(path) if path else None
+                self._document = self._setting = None
+
+            if self._file is None:
+                return False
+            if not self._file.refresh() and self._setting is not None:
+                return False
+            if self._file.content is None:
+                self._document = self._setting = None
+                return False
+
+            self._document = json.loads(self._file.content)
+            self._setting = self._parse(self._document)
+            logger.info(f"Loaded settings from {self._file.path}")
+            return True
+
+    def get(self) -> ExtensionSetting:
+        return self._setting
+
+    def get_robot(self, robot_name: str) -> RobotSetting:
+        if self._setting is None:
+            return None
+        return self._setting.robots_setting.get(robot_name)
+
+    def get_activated_robots(self) -> list[RobotSetting]:
+        if self._setting is None:
+            return []
+        return [
+            robot_setting
+            for _, robot_setting in sorted(self._setting.robots_setting.items())
+            if robot_setting.activated
+        ]
+
+    def install(self):
+        # Until uninstall, the settings UI saves through this store
+        store = self
+
+        def save_extension_setting_to_json(setting, file_path):
+            store.save(setting, file_path)
+
+        ExtensionSetting.save_extension_setting_to_json = save_extension_setting_to_json
+
+    def uninstall(self):
+        ExtensionSetting.save_extension_setting_to_json = (
+            _save_extension_setting_to_json
+        )
+
+    def save(
+        self, setting: ExtensionSetting = None, file_path: str = None
+    ) -> list[str]:
+        # Writes the setting (default: the loaded one) to file_path (default: the loaded file),
+        # returns the names of the changed robot entries and top-level keys
+        with self._lock:
+            if setting is None:
+                setting = self._setting
+            if file_path is None and self._file is not None:
+                file_path = self._file.path
+            if setting is None or not file_path:
+                raise FileNotFoundError("No settings file loaded")
+
+            loaded = self._file is not None and os.path.abspath(
+                file_path
+            ) == os.path.abspath(self._file.path)
+            if loaded and self._file.refresh() and self._file.content is not None:
+                # Changed by someone else since the last refresh
+                self._document = json.loads(self._file.content)
+                self._setting = self._parse(self._document)
+            if loaded and self._document is not None and self._file.content is not None:
+                previous = self._document
+            else:
+                previous = _read_document(file_path)
+
+            # Through JSON so tuples compare equal to the lists read from the file
+            document = json.loads(json.dumps(_to_document(setting)))
+            changed = _changed_keys(previous, document)
+            if previous is not None and not changed:
+                return []
+
+            content = json.dumps(document, indent=4).encode("utf-8")
+            _write_atomic(file_path, content)
+            if loaded:
+                self._file.remember(content)
+                self._document = document
+                self._setting = self._parse(document)
+            return changed
+
+    def _parse(self, document: dict) -> ExtensionSetting:
+        setting = ExtensionSetting()
+        setting.usd_path = document.get("usd_path", "")
+        setting.setting_path = document.get("setting_path", "")
+        setting.robots_setting = {
+            name: RobotSetting(**entry)
+            for name, entry in document.get("robots_setting", {}).items()
+        }
+        return setting
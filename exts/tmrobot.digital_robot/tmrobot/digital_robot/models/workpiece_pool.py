@@ -0,0 +1,150 @@
+import logging
+from collections import deque
+
+import omni.kit.commands
+from omni.isaac.core.utils.stage import add_reference_to_stage
+from pxr import Gf, Sdf, Usd, UsdGeom, UsdPhysics
+
+logger = logging.getLogger(__name__)
+
+# Spawn spots are compared at centimeter resolution, like the former position check
+SLOT_DECIMALS = 2
+
+
+def _slot_of(position) -> tuple:
+    return (round(position[0], SLOT_DECIMALS), round(position[1], SLOT_DECIMALS))
+
+
+class _Workpiece:
+    __slots__ = ("path", "prim", "translate", "rotate", "slot")
+
+    def __init__(self, path: str, prim: Usd.Prim):
+        self.path = path
+        self.prim = prim
+        self.translate = prim.GetAttribute("xformOp:translate")
+        self.rotate = prim.GetAttribute("xformOp:rotateXYZ")
+        self.slot: tuple = None
+
+
+class WorkpiecePool:
+    """Rigid-body workpieces created once under `root_path` and recycled for every spawn.
+
+    A workpiece is referenced and made a rigid body the first time it is needed (or up front
+    with `preinstance`), then kept: a free workpiece is deactivated, so physics ignores it,
+    and spawning activates and teleports it. At most `max_live` workpieces are live; beyond
+    that the oldest one is teleported to the new spot. Spawn spots are indexed by their
+    position, so checking whether a spot is taken only reads the workpiece spawned there.
+    """
+
+    def __init__(
+        self,
+        stage: Usd.Stage,
+        root_path: str,
+        usd_path: str,
+        max_live: int = 8,
+        scale: Gf.Vec3f = Gf.Vec3f(0.5, 0.5, 0.5),
+    ):
+        self.stage = stage
+        self.root_path = root_path
+        self.usd_path = usd_path
+        self.max_live = max(1, max_live)
+        self.scale = scale
+        self._workpieces: list[_Workpiece] = []
+        self._free: deque[_Workpiece] = deque()
+        self._live: deque[_Workpiece] = deque()  # oldest first
+        self._slots: dict[tuple, _Workpiece] = {}  # [spawn spot]
+
+    @property
+    def live_count(self) -> int:
+        return len(self._live)
+
+    def preinstance(self, count: int):
+        # Creates the workpieces before the first spawn, e.g. when the services start
+        while len(self._workpieces) < min(count, self.max_live):
+            workpiece = self._create()
+            workpiece.prim.SetActive(False)
+            self._free.append(workpiece)
+
+    def spawn(self, position: Gf.Vec3d, rotation_z: float = 0.0) -> str:
+        # Returns the prim path of the placed workpiece, None if the spot is taken
+        slot = _slot_of(position)
+        occupant = self._slots.get(slot)
+        if occupant is not None:
+            if _slot_of(occupant.translate.Get()) == slot:
+                return None
+            # Moved away (picked) since it was spawned
+            self._vacate(occupant)
+
+        if self._free:
+            workpiece = self._free.popleft()
+            workpiece.prim.SetActive(True)
+        elif len(self._workpieces) < self.max_live:
+            workpiece = self._create()
+        else:
+            workpiece = self._live.popleft()
+            self._vacate(workpiece)
+            logger.debug(
+                f"Recycle {workpiece.path}, {self.max_live} workpieces are live"
+            )
+
+        workpiece.translate.Set(Gf.Vec3d(position))
+        workpiece.rotate.Set(Gf.Vec3f(0, 0, rotation_z))
+        self._reset_velocity(workpiece.prim)
+        workpiece.slot = slot
+        self._slots[slot] = workpiece
+        self._live.append(workpiece)
+        return workpiece.path
+
+    def release(self, prim_path: str):
+        # Deactivates a live workpiece and returns it to the pool
+        workpiece = next(
+            (workpiece for workpiece in self._live if workpiece.path == prim_path), None
+        )
+        if workpiece is None:
+            return
+        self._live.remove(workpiece)
+        self._vacate(workpiece)
+        workpiece.prim.SetActive(False)
+        self._free.append(workpiece)
+
+    def release_all(self):
+        with Sdf.ChangeBlock():
+            for workpiece in list(self._live):
+                self.release(workpiece.path)
+
+    def clear(self):
+        # Forgets every workpiece, for when the root prim is removed from the stage
+        self._workpieces.clear()
+        self._free.clear()
+        self._live.clear()
+        self._slots.clear()
+
+    def _vacate(self, workpiece: _Workpiece):
+        if workpiece.slot is not None and self._slots.get(workpiece.slot) is workpiece:
+            del self._slots[workpiece.slot]
+        workpiece.slot = None
+
+    def _create(self) -> _Workpiece:
+        if not self.stage.GetPrimAtPath(Sdf.Path(self.root_path)).IsValid():
+            UsdGeom.Xform.Define(self.stage, Sdf.Path(self.root_path))
+
+        path = f"{self.root_path}/workpiece_{len(self._workpieces) + 1}"
+        prim = add_reference_to_stage(usd_path=self.usd_path, prim_path=path).GetPrim()
+        prim.GetAttribute("xformOp:scale").Set(self.scale)
+        omni.kit.commands.execute(
+            "SetRigidBody",
+            path=Sdf.Path(path),
+            approximationShape="convexHull",
+            kinematic=False,
+        )
+
+        workpiece = _Workpiece(path, prim)
+        self._workpieces.append(workpiece)
+        return workpiece
+
+    def _reset_velocity(self, prim: Usd.Prim):
+        # A recycled workpiece must not keep the motion it had when it was parked
+        rigid_body = UsdPhysics.RigidBodyAPI(prim)
+        if rigid_body:
+            rigid_body.GetVelocityAttr().Set(Gf.Vec3f(0, 0, 0))
+            rigid_body.GetAngularVelocityAttr().Set(Gf.Vec3f(0, 0, 0))
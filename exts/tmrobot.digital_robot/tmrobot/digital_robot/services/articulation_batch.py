@@ -0,0 +1,111 @@
+import logging
+import time
+from typing import Callable
+
+import numpy as np
+
+# isort: off
+from tmrobot.digital_robot.services import metrics
+
+# isort: on
+
+logger = logging.getLogger(__name__)
+
+# TM arms have six joints, the first six DOFs of every robot articulation
+ARM_JOINT_COUNT = 6
+
+
+def _create_articulation_view(prim_paths: list[str], name: str):
+    from omni.isaac.core.articulations import ArticulationView
+
+    return ArticulationView(prim_paths_expr=prim_paths, name=name)
+
+
+class _RobotGroup:
+    # Robots of one model share an articulation view, the tensor API needs one topology
+    def __init__(self, name: str, robot_names: list[str], view, joint_count: int):
+        self.name = name
+        self.view = view
+        self.rows = {robot_name: row for row, robot_name in enumerate(robot_names)}
+        self.indices = np.arange(len(robot_names))
+        self.targets = np.zeros((len(robot_names), joint_count), dtype=np.float32)
+        self.dirty = np.zeros(len(robot_names), dtype=bool)
+        self.failed = False
+        self.write_seconds = metrics.registry.histogram(
+            "digital_robot_articulation_write_seconds",
+            "Time to write the joint targets of a group of robots",
+            group=name,
+        )
+
+
+class BatchedJointTargets:
+    """Joint position targets of many robots, written with one tensor call per robot model.
+
+    `set_targets` only stores the row of a robot; `flush` pushes every changed row of a
+    group through its shared `ArticulationView` once per physics step. The views must be
+    added to the world scene before it is reset, so they are initialized with the physics
+    simulation view like the robots.
+    """
+
+    def __init__(
+        self,
+        robots: dict[str, tuple[str, str]],
+        joint_count: int = ARM_JOINT_COUNT,
+        view_factory: Callable = _create_articulation_view,
+        name: str = "digital_robots",
+    ):
+        # robots: [robot name] = (model, articulation prim path)
+        self.joint_count = joint_count
+        self._joint_indices = np.arange(joint_count)
+        self._groups: dict[str, _RobotGroup] = {}
+        self._group_of: dict[str, _RobotGroup] = {}
+
+        by_model: dict[str, list[str]] = {}
+        for robot_name, (model, _) in robots.items():
+            by_model.setdefault(model, []).append(robot_name)
+
+        for model, robot_names in by_model.items():
+            group_name = f"{name}_{model.lower()}"
+            view = view_factory([robots[robot][1] for robot in robot_names], group_name)
+            group = _RobotGroup(group_name, robot_names, view, joint_count)
+            self._groups[group_name] = group
+            for robot_name in robot_names:
+                self._group_of[robot_name] = group
+
+    @property
+    def views(self) -> list:
+        return [group.view for group in self._groups.values()]
+
+    def __contains__(self, robot_name: str) -> bool:
+        return robot_name in self._group_of
+
+    def set_targets(self, robot_name: str, joint_positions):
+        group = self._group_of[robot_name]
+        row = group.rows[robot_name]
+        group.targets[row] = joint_positions[: self.joint_count]
+        group.dirty[row] = True
+
+    def flush(self):
+        for group in self._groups.values():
+            if not group.dirty.any():
+                continue
+
+            start = time.perf_counter()
+            if group.dirty.all():
+                indices, targets = group.indices, group.targets
+            else:
+                indices = np.flatnonzero(group.dirty)
+                targets = group.targets[indices]
+            try:
+                group.view.set_joint_position_targets(
+                    targets,
+                    indices=indices,
+                    joint_indices=self._joint_indices,
+                )
+            except Exception as e:  # noqa
+                # Once per group, this runs on every physics step
+                if not group.failed:
+                    logger.warning(f"{group.name}: failed to write joint targets: {e}")
+                group.failed = True
+            group.dirty[:] = False
+            group.write_seconds.observe(time.perf_counter() - start)
@@ -0,0 +1,24 @@
+import numpy as np
+from pxr import Gf, Usd, UsdGeom
+
+# DigitalCamera is compiled and exposes neither the annotator array nor the camera prim:
+# get_rgb returns the frame as bytes and get_handeye_parameters reads the local transform
+# only. These are the only functions that read its private attributes, `_camera` (the
+# Isaac `Camera` it wraps) and `_prim` (the camera prim), so a change of the compiled class
+# needs to be followed here only.
+
+
+def get_annotator_rgb(camera) -> np.ndarray:
+    # The rendered frame as the annotator's (height, width, 3 or 4) uint8 array, not a copy
+    return camera._camera.get_rgb()
+
+
+def get_camera_prim(camera) -> Usd.Prim:
+    return camera._prim
+
+
+def get_world_transform(camera) -> Gf.Matrix4d:
+    # The world pose covers cameras mounted on a moving robot flange
+    return UsdGeom.Xformable(camera._prim).ComputeLocalToWorldTransform(
+        Usd.TimeCode.Default()
+    )
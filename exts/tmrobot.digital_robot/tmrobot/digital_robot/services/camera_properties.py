@@ -0,0 +1,173 @@
+import functools
+import logging
+import math
+import time
+
+import numpy as np
+from omni.isaac.core.utils.prims import get_prim_attribute_value
+from pxr import Tf, Usd
+
+# isort: off
+from tmrobot.digital_robot.services.camera_access import get_camera_prim
+
+# isort: on
+
+logger = logging.getLogger(__name__)
+
+# Fewer poses are converted with math, NumPy's call overhead outweighs the loop below that
+BATCH_MIN = 32
+
+
+def quaternion_to_euler(w: float, x: float, y: float, z: float) -> tuple:
+    # Roll, pitch, yaw in degrees, as DigitalCamera._quaternion_to_euler
+    roll = math.atan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+    pitch = math.asin(max(-1.0, min(1.0, 2 * (w * y - z * x))))
+    yaw = math.atan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+    return math.degrees(roll), math.degrees(pitch), math.degrees(yaw)
+
+
+def quaternions_to_euler(quaternions: np.ndarray) -> np.ndarray:
+    # (n, 4) w, x, y, z to (n, 3) roll, pitch, yaw in degrees, as DigitalCamera._quaternion_to_euler
+    w, x, y, z = np.asarray(quaternions, dtype=np.float64).T
+    roll = np.arctan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+    pitch = np.arcsin(np.clip(2 * (w * y - z * x), -1.0, 1.0))
+    yaw = np.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+    return np.degrees(np.stack((roll, pitch, yaw), axis=1))
+
+
+def _has_prefix(path: str, prefix: str) -> bool:
+    return path == prefix or path.startswith(prefix.rstrip("/") + "/")
+
+
+class CameraPropertyCache:
+    """Hand-eye parameters of `DigitalCamera`s, kept until USD reports a change of the camera.
+
+    `DigitalCamera.get_handeye_parameters` reads the camera's `xformOp:translate` and
+    `xformOp:orient` and converts the quaternion with scalar math for every camera of every
+    loadCameraList. `attach` binds the method of each camera to this cache instead. A
+    `Usd.Notice.ObjectsChanged` listener marks a camera dirty when an attribute of its prim
+    changes or the camera, its robot or another prim above it is resynced; the next lookup
+    reads the pose of every dirty camera and converts them together, with NumPy from
+    `BATCH_MIN` cameras. Changes made
+    only in Fabric send no notice, so an entry is also read again after `max_age` seconds
+    (0 keeps it until a notice). The gain, shutter time, white balance and image size are
+    fields of `DigitalCamera` already and need no cache. Used from the Kit thread only.
+    """
+
+    def __init__(self, stage: Usd.Stage = None, max_age: float = 1.0):
+        self.max_age = max_age
+        self.hit_count = 0
+        self.read_count = 0
+        self.invalidation_count = 0
+        self._cameras: dict[str, object] = {}  # [camera prim path] DigitalCamera
+        self._values: dict[str, tuple] = {}  # [camera prim path]
+        self._read_times: dict[str, float] = {}  # [camera prim path]
+        self._dirty: set[str] = set()
+        self._listener = None
+        if stage is not None:
+            self._listener = Tf.Notice.Register(
+                Usd.Notice.ObjectsChanged, self._on_objects_changed, stage
+            )
+
+    def attach(self, cameras):
+        for camera in cameras:
+            path = str(get_camera_prim(camera).GetPath())
+            self._cameras[path] = camera
+            self._dirty.add(path)
+            camera.get_handeye_parameters = functools.partial(self._get, path)
+
+    def detach(self):
+        # The cameras read the stage again
+        for camera in self._cameras.values():
+            camera.__dict__.pop("get_handeye_parameters", None)
+        self._cameras.clear()
+        self._values.clear()
+        self._read_times.clear()
+        self._dirty.clear()
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.Revoke()
+            self._listener = None
+        self.detach()
+
+    def get_handeye_parameters(self, camera) -> tuple:
+        return self._get(str(get_camera_prim(camera).GetPath()))
+
+    def invalidate(self, paths=None):
+        # Every camera, or the cameras at or below the prim paths
+        for camera_path in self._cameras:
+            if camera_path not in self._dirty and (
+                paths is None
+                or any(_has_prefix(camera_path, str(path)) for path in paths)
+            ):
+                self._dirty.add(camera_path)
+                self.invalidation_count += 1
+
+    def get_stats(self) -> dict:
+        return {
+            "hits": self.hit_count,
+            "reads": self.read_count,
+            "invalidations": self.invalidation_count,
+        }
+
+    def _get(self, path: str) -> tuple:
+        value = self._values.get(path)
+        if value is not None and path not in self._dirty:
+            if not self.max_age or time.monotonic() - self._read_times[path] <= (
+                self.max_age
+            ):
+                self.hit_count += 1
+                return value
+            self._dirty.add(path)
+
+        self._read_dirty()
+        value = self._values.get(path)
+        if value is None:
+            # Not readable, let the camera report its own error
+            camera = self._cameras[path]
+            return type(camera).get_handeye_parameters(camera)
+        return value
+
+    def _read_dirty(self):
+        # The pose of every dirty camera in one conversion
+        paths, translations, quaternions = [], [], []
+        for path in list(self._dirty):
+            try:
+                translate = get_prim_attribute_value(path, "xformOp:translate")
+                orient = get_prim_attribute_value(path, "xformOp:orient", fabric=True)
+                quaternion = (orient.GetReal(), *orient.GetImaginary())
+                translations.append(tuple(translate))
+            except Exception as e:
+                logger.debug(f"Failed to read the pose of {path}: {e}")
+                self._values.pop(path, None)
+                continue
+            paths.append(path)
+            quaternions.append(quaternion)
+        if not paths:
+            return
+
+        now = time.monotonic()
+        if len(quaternions) >= BATCH_MIN:
+            eulers = quaternions_to_euler(quaternions)
+        else:
+            eulers = [quaternion_to_euler(*quaternion) for quaternion in quaternions]
+        for path, translation, euler in zip(paths, translations, eulers):
+            # Rounded as DigitalCamera.get_handeye_parameters does
+            self._values[path] = tuple(
+                round(float(value), 4) for value in (*translation, *euler)
+            )
+            self._read_times[path] = now
+            self._dirty.discard(path)
+        self.read_count += len(paths)
+
+    def _on_objects_changed(self, notice, stage):
+        for path in notice.GetChangedInfoOnlyPaths():
+            prim_path = str(path.GetPrimPath())
+            if prim_path in self._cameras and prim_path not in self._dirty:
+                self._dirty.add(prim_path)
+                self.invalidation_count += 1
+
+        resynced = [str(path.GetPrimPath()) for path in notice.GetResyncedPaths()]
+        if resynced:
+            self.invalidate(resynced)
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CameraRegistry:
+    """Cameras of the extension's `dg_cameras[tmflow ip][serial number]`, indexed.
+
+    `dg_cameras` already finds a camera by (TMflow IP, serial number) in constant time; by
+    serial number alone it is found in an index instead of searching every TMflow IP. The
+    index is rebuilt from `dg_cameras` when a lookup misses, so cameras added after the
+    server started are found too; call `rebuild` after removing cameras. The camera of the
+    first TMflow IP wins, as in `VirtualCameraServerSecure._find_camera_by_sn`.
+    """
+
+    def __init__(self, dg_cameras: dict):
+        self._dg_cameras = dg_cameras
+        self._by_serial: dict[str, object] = {}
+        self.rebuild()
+
+    def __len__(self) -> int:
+        return sum(len(cameras) for cameras in self._dg_cameras.values())
+
+    def rebuild(self):
+        by_serial = {}
+        for cameras in list(self._dg_cameras.values()):
+            for serial_number, camera in list(cameras.items()):
+                by_serial.setdefault(serial_number, camera)
+        self._by_serial = by_serial
+
+    def get(self, client_ip: str, serial_number: str):
+        cameras = self._dg_cameras.get(client_ip)
+        return cameras.get(serial_number) if cameras is not None else None
+
+    def get_by_serial(self, serial_number: str):
+        camera = self._by_serial.get(serial_number)
+        if camera is None:
+            self.rebuild()
+            camera = self._by_serial.get(serial_number)
+        return camera
+
+
+class GrabLimiter:
+    """Single-flight grabs with at most `max_per_camera` captures of a camera at once.
+
+    `run(serial_number, frame, capture)` awaits `capture()`; a grab of the same camera and
+    frame while one is in flight awaits that capture instead of starting its own (a frame
+    of None is never shared). Captures of one camera beyond `max_per_camera` wait for a
+    slot, so one client grabbing without pause cannot occupy every encoder worker. A
+    capture keeps running when the grab that started it is cancelled, the other grabs of
+    that frame still get its image.
+    """
+
+    def __init__(self, max_per_camera: int = 1):
+        self.max_per_camera = max_per_camera
+        self.capture_count = 0
+        self.shared_count = 0
+        self._in_flight: dict[tuple, asyncio.Future] = {}  # [(serial number, frame)]
+        self._slots: dict[str, asyncio.Semaphore] = {}  # [serial number]
+
+    def get_stats(self) -> dict:
+        return {"captures": self.capture_count, "shared": self.shared_count}
+
+    async def run(self, serial_number: str, frame, capture):
+        if frame is None:
+            return await self._capture(serial_number, capture)
+
+        key = (serial_number, frame)
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.shared_count += 1
+            return await asyncio.shield(in_flight)
+
+        task = asyncio.ensure_future(self._capture(serial_number, capture))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda _: self._forget(key, task))
+        return await asyncio.shield(task)
+
+    async def _capture(self, serial_number: str, capture):
+        if not self.max_per_camera:
+            self.capture_count += 1
+            return await capture()
+
+        slot = self._slots.get(serial_number)
+        if slot is None:
+            slot = self._slots[serial_number] = asyncio.Semaphore(self.max_per_camera)
+        async with slot:
+            self.capture_count += 1
+            return await capture()
+
+    def _forget(self, key: tuple, task: asyncio.Future):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Every grab may have been cancelled, don't report the error as never retrieved
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,241 @@
+import ipaddress
+import logging
+import math
+import os
+from dataclasses import dataclass, field
+
+from pxr import Gf, Sdf, Usd, UsdGeom
+
+# isort: off
+from tmrobot.digital_robot.models.setting import RobotSetting  # type: ignore
+from tmrobot.digital_robot.services import metrics
+
+# isort: on
+
+try:
+    import psutil  # type: ignore
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+CELL_NAME = "Cell{:02d}"
+_PRIM_PATH_FIELDS = ("robot_prim_path", "ext01_prim_path", "ext02_prim_path")
+
+
+def get_rss_bytes() -> int:
+    # Resident memory of this process, 0 when it can't be read
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _has_prefix(path: str, prefix: str) -> bool:
+    return path == prefix or path.startswith(prefix.rstrip("/") + "/")
+
+
+def _common_root(paths: list[str]) -> str:
+    parts = [path.strip("/").split("/") for path in paths]
+    common = []
+    for names in zip(*parts):
+        if len(set(names)) > 1:
+            break
+        common.append(names[0])
+    # A robot prim itself is not the root of its cell
+    if any(len(names) == len(common) for names in parts):
+        common = common[:-1]
+    return "/" + "/".join(common)
+
+
+@dataclass
+class Cell:
+    index: int
+    name: str
+    root_path: str
+    offset: tuple
+    # [robot name] robot name in the template cell
+    template_names: dict[str, str] = field(default_factory=dict)
+    # Process memory grown while the cell was cloned and its robots were created
+    rss_bytes: int = 0
+    # One RGB frame of every camera of the cell
+    frame_bytes: int = 0
+    steps: int = 0
+    step_seconds: metrics.Histogram = None
+
+    def to_dict(self) -> dict:
+        return {
+            "root": self.root_path,
+            "robots": list(self.template_names),
+            "rss_mb": self.rss_bytes / 2**20,
+            "frame_mb": self.frame_bytes / 2**20,
+            "steps": self.steps,
+        }
+
+
+class CellBatch:
+    """Clones of a template cell of robots and cameras under separate prim roots of one stage.
+
+    The activated robots of the settings make up cell 1, under `template_root` (by default
+    the deepest prim above every robot and camera prim path). Cells 2 to `count` are prims
+    next to it with an internal reference to the template root, on a square grid `spacing`
+    stage units apart, so every cell has its own robot articulations and cameras in the
+    same World and physics scene. `settings` holds the robot settings of every cell: the
+    robots of a clone are named `<robot>_CellNN` and connect to the TMflow IP of the
+    template robot plus `index * ip_stride`.
+
+    The virtual camera server tells cells apart by the TMflow IP of the client, so a cell's
+    cameras are registered under the serial numbers of the template cell (`camera_key`)
+    and every TMflow project runs unchanged against its own cell.
+    """
+
+    def __init__(
+        self,
+        template_settings: list[RobotSetting],
+        count: int,
+        template_root: str = None,
+        spacing: float = 3.0,
+        ip_stride: int = 0,
+    ):
+        if not template_settings:
+            raise ValueError("No activated robot to clone")
+
+        paths = [
+            getattr(setting, name)
+            for setting in template_settings
+            for name in _PRIM_PATH_FIELDS
+            if getattr(setting, name, "")
+        ]
+        self.template_root = (template_root or _common_root(paths)).rstrip("/")
+        if self.template_root.count("/") < 2:
+            raise ValueError(
+                f"Can't clone {self.template_root or '/'}, set a cell template root "
+                "below the default prim"
+            )
+        outside = [path for path in paths if not _has_prefix(path, self.template_root)]
+        if outside:
+            raise ValueError(f"{', '.join(outside)} not below {self.template_root}")
+
+        self.spacing = spacing
+        self.ip_stride = ip_stride or len(template_settings)
+        self.cells: list[Cell] = []
+        self.settings: list[RobotSetting] = []
+        self._cell_of: dict[str, Cell] = {}  # [robot name]
+        self._step_seconds: dict[int, float] = {}  # [cell index] of the current step
+
+        columns = math.ceil(math.sqrt(count))
+        for index in range(count):
+            offset = (
+                (index % columns) * spacing,
+                (index // columns) * spacing,
+                0.0,
+            )
+            self._add_cell(index, offset, template_settings)
+
+    def _add_cell(self, index: int, offset: tuple, template_settings: list):
+        name = CELL_NAME.format(index + 1)
+        root_path = self.template_root if index == 0 else f"{self.template_root}_{name}"
+        cell = Cell(index, name, root_path, offset)
+        cell.step_seconds = metrics.registry.histogram(
+            "digital_robot_cell_step_seconds",
+            "Time of one physics step spent on the robots of a cell",
+            cell=name,
+        )
+        self.cells.append(cell)
+
+        for template in template_settings:
+            if index == 0:
+                setting = template
+            else:
+                values = {**vars(template)}
+                values["name"] = f"{template.name}_{name}"
+                values["ip"] = str(
+                    ipaddress.ip_address(template.ip) + index * self.ip_stride
+                )
+                values["cameras_activated"] = dict(template.cameras_activated)
+                for field_name in _PRIM_PATH_FIELDS:
+                    path = values.get(field_name) or ""
+                    if path:
+                        values[field_name] = root_path + path[len(self.template_root) :]
+                setting = RobotSetting(**values)
+            cell.template_names[setting.name] = template.name
+            self._cell_of[setting.name] = cell
+            self.settings.append(setting)
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def cell_of(self, robot_name: str) -> Cell:
+        return self._cell_of.get(robot_name)
+
+    def clone(self, stage: Usd.Stage):
+        # Every clone composes the template root, moved by its grid offset
+        template = stage.GetPrimAtPath(Sdf.Path(self.template_root))
+        if not template.IsValid():
+            raise ValueError(f"Cell template root {self.template_root} not found")
+        translate = template.GetAttribute("xformOp:translate")
+        origin = Gf.Vec3d(translate.Get() if translate else (0, 0, 0))
+
+        for cell in self.cells[1:]:
+            rss = get_rss_bytes()
+            prim = stage.DefinePrim(Sdf.Path(cell.root_path), template.GetTypeName())
+            prim.GetReferences().AddInternalReference(Sdf.Path(self.template_root))
+            position = origin + Gf.Vec3d(cell.offset)
+            if prim.GetAttribute("xformOp:translate"):
+                prim.GetAttribute("xformOp:translate").Set(position)
+            else:
+                UsdGeom.XformCommonAPI(prim).SetTranslate(position)
+            cell.rss_bytes += get_rss_bytes() - rss
+        logger.info(f"Cloned {self.template_root} to {len(self.cells) - 1} cells")
+
+    def remove(self, stage: Usd.Stage):
+        # The template cell stays, the saved scene has no clones
+        for cell in self.cells[1:]:
+            if stage.GetPrimAtPath(Sdf.Path(cell.root_path)).IsValid():
+                stage.RemovePrim(Sdf.Path(cell.root_path))
+
+    def camera_key(self, robot_name: str, serial_number: str) -> str:
+        # Serial number of the camera in the template cell, e.g. Robot01_Cell02_EIH -> Robot01_EIH
+        cell = self._cell_of.get(robot_name)
+        if cell is None or not serial_number.startswith(robot_name):
+            return serial_number
+        return cell.template_names[robot_name] + serial_number[len(robot_name) :]
+
+    def add_robot(self, robot_name: str, rss_bytes: int, cameras=()):
+        # Memory of creating a robot and the frame size of its cameras
+        cell = self._cell_of.get(robot_name)
+        if cell is None:
+            return
+        cell.rss_bytes += rss_bytes
+        for camera in cameras:
+            width, height = camera.get_image_size()
+            cell.frame_bytes += width * height * 3
+
+    def add_step_time(self, robot_name: str, seconds: float):
+        cell = self._cell_of.get(robot_name)
+        if cell is not None:
+            self._step_seconds[cell.index] = (
+                self._step_seconds.get(cell.index, 0.0) + seconds
+            )
+
+    def end_step(self):
+        # One observation per cell and physics step, the robots of a cell summed
+        for index, seconds in self._step_seconds.items():
+            cell = self.cells[index]
+            cell.steps += 1
+            cell.step_seconds.observe(seconds)
+        self._step_seconds.clear()
+
+    def get_stats(self) -> dict[str, dict]:
+        stats = {}
+        for cell in self.cells:
+            step = cell.step_seconds.to_dict()
+            stats[cell.name] = {
+                **cell.to_dict(),
+                "step_p50_ms": step["p50_ms"],
+                "step_p99_ms": step["p99_ms"],
+            }
+        return stats
@@ -0,0 +1,228 @@
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+# isort: off
+from tmrobot.digital_robot.services.trajectory_buffer import JointTrajectoryBuffer
+
+# isort: on
+
+HEALTH_IN_SYNC = "in sync"
+HEALTH_LAGGING = "lagging"
+HEALTH_STARVED = "starved"
+
+# Without a trajectory buffer a robot moves in visible jumps below this many frames per step
+STARVED_FRAMES_PER_STEP = 0.5
+# Bounds of the trajectory clock rate, wall seconds per simulated second
+MAX_TIME_SCALE = 4.0
+# Factor the trajectory latency is raised by per window with an underrun, and lowered by
+LATENCY_FACTOR = 1.5
+RECOVER_WINDOWS = 10
+# A window this many times longer than configured spans a pause of the physics
+PAUSE_WINDOWS = 4
+
+
+@dataclass
+class FlowStats:
+    health: str = HEALTH_IN_SYNC
+    # Frames the slave sent and physics steps, per wall second of the last window
+    frame_rate: float = 0.0
+    step_rate: float = 0.0
+    # Simulated seconds per wall second of the last window
+    real_time_factor: float = 1.0
+    # Mean age of the frames applied in the last window, motion mailbox only
+    age: float = 0.0
+    decimation: int = 1
+    transitions: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "health": self.health,
+            "frame_rate": self.frame_rate,
+            "step_rate": self.step_rate,
+            "real_time_factor": self.real_time_factor,
+            "age_ms": self.age * 1000,
+            "decimation": self.decimation,
+            "transitions": self.transitions,
+        }
+
+
+class FlowController:
+    """Matches the motion stream of every robot to the rate the physics step consumes it.
+
+    The physics step calls `step` after applying its motions. Every `window` seconds the
+    frames each slave sent (`TMSVRMaster.slave_frame_count`) are compared with the physics
+    steps and simulated time of the window and with the stats of the motion source. A robot
+    is starved when no frame arrived, its `JointTrajectoryBuffer` trajectory ran dry, or
+    (from a `MotionMailbox`) it got fewer than one frame per two steps. It is lagging when
+    the physics runs below `lag_ratio` of real time, or mailbox frames were dropped or were
+    older than `max_age` when applied. A new health is reported to
+    `on_health(robot_name, stats)` once it held for `hold` windows.
+
+    While a robot lags its master queues only every k-th frame, k being the frames per step
+    (at most `max_decimation`), so the frames a step would skip anyway are not parsed. The
+    trajectory clock runs at the measured wall seconds per simulated second instead of
+    drifting and snapping back, and the trajectory latency is raised while a robot is
+    running dry (at most `max_latency`) and lowered back after `RECOVER_WINDOWS` in sync.
+    Used from the physics step only.
+    """
+
+    def __init__(
+        self,
+        masters: dict,
+        motion_source,
+        window: float = 0.5,
+        hold: int = 2,
+        lag_ratio: float = 0.9,
+        max_age: float = 0.1,
+        max_decimation: int = 8,
+        max_latency: float = 0.2,
+        on_health: Callable[[str, FlowStats], None] = None,
+    ):
+        self.window = window
+        self.hold = hold
+        self.lag_ratio = lag_ratio
+        self.max_age = max_age
+        self.max_decimation = max_decimation
+        self.max_latency = max_latency
+        self._masters = masters  # [robot name] TMSVRMaster
+        self._source = motion_source
+        self._trajectory = isinstance(motion_source, JointTrajectoryBuffer)
+        self._base_latency = motion_source.latency if self._trajectory else 0.0
+        self._on_health = on_health
+        self._stats: dict[str, FlowStats] = {}
+        self._pending: dict[str, tuple[str, int]] = {}  # [robot name] health, windows
+        self._in_sync_windows = 0
+        self._window_start: float = None
+        self._steps = 0
+        self._simulated = 0.0
+        self._frame_counts: dict[str, int] = {}
+        self._source_stats: dict[str, dict] = {}
+
+    def step(self, step_size: float):
+        self._steps += 1
+        self._simulated += step_size
+        now = time.monotonic()
+        if self._window_start is None:
+            self._start_window(now)
+            return
+
+        elapsed = now - self._window_start
+        if elapsed >= self.window * PAUSE_WINDOWS:
+            # The physics was paused, the window tells nothing about the rates
+            self._start_window(now)
+        elif elapsed >= self.window:
+            self._evaluate(elapsed)
+            self._start_window(now)
+
+    def _start_window(self, now: float):
+        self._window_start = now
+        self._steps = 0
+        self._simulated = 0.0
+        self._frame_counts = {
+            name: master.slave_frame_count for name, master in self._masters.items()
+        }
+        self._source_stats = self._source.get_stats()
+
+    def _evaluate(self, elapsed: float):
+        steps = self._steps
+        real_time_factor = self._simulated / elapsed
+        source_stats = self._source.get_stats()
+        underrun = False
+
+        for name, master in list(self._masters.items()):
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = FlowStats()
+            current = source_stats.get(name, {})
+            previous = self._source_stats.get(name, {})
+
+            def _delta(key: str) -> float:
+                return current.get(key, 0) - previous.get(key, 0)
+
+            frames = master.slave_frame_count - self._frame_counts.get(name, 0)
+            stats.frame_rate = frames / elapsed
+            stats.step_rate = steps / elapsed
+            stats.real_time_factor = real_time_factor
+            applied = _delta("applied")
+            if applied > 0:
+                # The mailbox reports the mean age over every applied frame
+                total_age = current["mean_age_ms"] * current["applied"] - previous.get(
+                    "mean_age_ms", 0
+                ) * previous.get("applied", 0)
+                stats.age = total_age / applied / 1000
+
+            ran_dry = _delta("underruns") > 0
+            underrun = underrun or ran_dry
+            if (
+                frames == 0
+                or ran_dry
+                or (not self._trajectory and frames < steps * STARVED_FRAMES_PER_STEP)
+            ):
+                health = HEALTH_STARVED
+            elif (
+                real_time_factor < self.lag_ratio
+                or _delta("drops") > 0
+                or (applied > 0 and stats.age > self.max_age)
+            ):
+                health = HEALTH_LAGGING
+            else:
+                health = HEALTH_IN_SYNC
+            self._update_health(name, stats, health)
+
+            decimation = 1
+            if stats.health == HEALTH_LAGGING and steps > 0:
+                decimation = min(self.max_decimation, frames // steps)
+                if self._trajectory:
+                    # Interpolated frames stay well within the latency
+                    decimation = min(
+                        decimation, int(self._source.latency * frames / elapsed / 2)
+                    )
+            master.decimation = decimation
+            stats.decimation = master.decimation
+
+        if self._trajectory:
+            self._adapt_trajectory(elapsed, underrun)
+
+    def _update_health(self, name: str, stats: FlowStats, health: str):
+        if health == stats.health:
+            self._pending.pop(name, None)
+            return
+
+        pending, windows = self._pending.get(name, (health, 0))
+        windows = windows + 1 if pending == health else 1
+        if windows < self.hold:
+            self._pending[name] = (health, windows)
+            return
+
+        self._pending.pop(name, None)
+        stats.health = health
+        stats.transitions += 1
+        if self._on_health is not None:
+            self._on_health(name, stats)
+
+    def _adapt_trajectory(self, elapsed: float, underrun: bool):
+        buffer: JointTrajectoryBuffer = self._source
+        if self._simulated > 0:
+            time_scale = min(
+                MAX_TIME_SCALE, max(1 / MAX_TIME_SCALE, elapsed / self._simulated)
+            )
+            buffer.time_scale = time_scale
+
+        # A longer latency only helps when frames arrive, but too late
+        healths = [stats.health for stats in self._stats.values()]
+        if underrun:
+            self._in_sync_windows = 0
+            buffer.target_latency = min(
+                self.max_latency, buffer.target_latency * LATENCY_FACTOR
+            )
+        elif all(health == HEALTH_IN_SYNC for health in healths):
+            self._in_sync_windows += 1
+            if self._in_sync_windows >= RECOVER_WINDOWS:
+                self._in_sync_windows = 0
+                buffer.target_latency = max(
+                    self._base_latency, buffer.target_latency / LATENCY_FACTOR
+                )
+
+    def get_stats(self) -> dict[str, dict]:
+        return {name: stats.to_dict() for name, stats in self._stats.items()}
@@ -0,0 +1,135 @@
+import logging
+import os
+import re
+import tempfile
+import time
+from typing import Callable
+
+import numpy as np
+
+# isort: off
+from tmrobot.digital_robot.services import metrics
+from tmrobot.digital_robot.services.camera_access import (
+    get_annotator_rgb,
+    get_world_transform,
+)
+from tmrobot.digital_robot.services.frame_ring import FILE_SUFFIX, FrameRingWriter
+
+# isort: on
+
+logger = logging.getLogger(__name__)
+
+
+def default_frame_directory() -> str:
+    # Memory-backed on Linux, so the rings never touch the disk
+    root = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(root, "tmrobot_digital_robot")
+
+
+class FramePublisher:
+    """Writes the raw RGB frames of `DigitalCamera`s to one `FrameRingWriter` per camera.
+
+    `publish` reads the annotator frame of every camera, as getGrabImageData does, and
+    copies it with the camera's world pose and `frame_index()` into the ring
+    `<directory>/<robot name>-<serial number>.frames`, at most once per `min_interval`
+    seconds per camera. Call it from the Kit thread, e.g. on every update. A ring is created
+    with the first frame of its camera; a camera without a rendered frame yet is skipped,
+    and so is a camera whose frame index and pose are those of its last written frame. The
+    frame index has to change whenever the scene may have, e.g. count the physics steps:
+    a robot settling on its target or a falling workpiece moves without any new input.
+    Read the rings with `frame_ring.FrameRingReader`.
+    """
+
+    def __init__(
+        self,
+        directory: str = None,
+        slot_count: int = 4,
+        min_interval: float = 0.0,
+        frame_index: Callable[[], int] = None,
+    ):
+        self.directory = directory or default_frame_directory()
+        self.slot_count = slot_count
+        self.min_interval = min_interval
+        self.frame_count = 0
+        self._frame_index = frame_index
+        self._cameras: dict[str, object] = {}  # [ring path] DigitalCamera
+        self._writers: dict[str, FrameRingWriter] = {}  # [ring path]
+        self._published: dict[str, float] = {}  # [ring path] time of the last frame
+        self._publish_seconds: dict[str, metrics.Histogram] = {}  # [ring path]
+        # [ring path] (frame index, pose bytes) of the last frame written
+        self._written: dict[str, tuple[int, bytes]] = {}
+        os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def paths(self) -> list[str]:
+        return list(self._cameras)
+
+    def add_camera(self, robot_name: str, camera) -> str:
+        name = re.sub(r"[^\w.-]", "_", f"{robot_name}-{camera.get_serial_number()}")
+        path = os.path.join(self.directory, f"{name}{FILE_SUFFIX}")
+        self._cameras[path] = camera
+        return path
+
+    def publish(self) -> int:
+        # Returns the number of frames written
+        now = time.monotonic()
+        frame_index = self._frame_index() if self._frame_index is not None else 0
+        written = 0
+        for path, camera in self._cameras.items():
+            if now - self._published.get(path, -np.inf) < self.min_interval:
+                continue
+            try:
+                if self._publish(path, camera, frame_index):
+                    self._published[path] = now
+                    written += 1
+            except Exception as e:
+                logger.warning(f"Failed to publish the frame of {path}: {e}")
+        self.frame_count += written
+        return written
+
+    def _publish(self, path: str, camera, frame_index: int) -> bool:
+        start = time.perf_counter()
+        pose = self._get_pose(camera)
+        # Without a frame index every frame is taken as new
+        state = (frame_index, pose.tobytes())
+        if self._frame_index is not None and self._written.get(path) == state:
+            return False
+
+        rgb = get_annotator_rgb(camera)
+        if rgb is None or not np.size(rgb):
+            return False
+
+        writer = self._writers.get(path)
+        if writer is None:
+            writer = self._writers[path] = FrameRingWriter(
+                path, self.slot_count, rgb.nbytes
+            )
+            self._publish_seconds[path] = metrics.registry.histogram(
+                "digital_robot_frame_publish_seconds",
+                "Time to read one camera frame and write it to its shared-memory ring",
+                camera=camera.get_serial_number(),
+            )
+            logger.info(f"Publish the frames of {camera.get_serial_number()} to {path}")
+        writer.write(rgb, pose, frame_index)
+        self._written[path] = state
+        self._publish_seconds[path].observe(time.perf_counter() - start)
+        return True
+
+    def _get_pose(self, camera) -> np.ndarray:
+        # The world pose covers cameras mounted on a moving robot flange
+        return np.array(get_world_transform(camera), dtype=np.float64)
+
+    def get_stats(self) -> dict:
+        return {
+            os.path.basename(path): writer.sequence
+            for path, writer in self._writers.items()
+        }
+
+    def close(self):
+        # The rings are removed; readers keep their mapping until they close it
+        for writer in self._writers.values():
+            writer.close(remove=True)
+        self._writers.clear()
+        self._published.clear()
+        self._publish_seconds.clear()
+        self._written.clear()
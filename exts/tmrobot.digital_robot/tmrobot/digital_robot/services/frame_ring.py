@@ -0,0 +1,282 @@
+import logging
+import mmap
+import os
+import struct
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Only NumPy is needed: vision programs outside Kit load this file by path to read the rings.
+#
+# File: header, then `slot count` slots of `slot size` bytes. Frame n (from 1) is written to
+# slot (n - 1) % slot count. A slot is a slot header followed by the pixels:
+#   sequence    uint64       0 while the slot is written
+#   frame index uint64       scene version of the extension when the frame was read
+#   timestamp   float64      time.time() when the frame was read
+#   width, height, channels  uint32
+#   pose        float64[16]  camera local-to-world transform, row-major as USD (row vectors)
+#   pixels      uint8[height, width, channels]
+# The header counts the resizes of the slots (generation) and holds the latest sequence.
+MAGIC = b"TMFRAMES"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQ")  # magic, version, slot count, slot size, generation
+HEADER_SIZE = 64
+LATEST_OFFSET = 32
+SEQUENCE = struct.Struct("<Q")
+SLOT_META = struct.Struct("<QdIII4x16d")  # after the sequence
+SLOT_HEADER_SIZE = 192
+FILE_SUFFIX = ".frames"
+
+_NO_POSE = (float("nan"),) * 16
+
+
+def _slot_size(capacity: int) -> int:
+    # Pixels start and end 64 byte aligned
+    return SLOT_HEADER_SIZE + (capacity + 63) // 64 * 64
+
+
+class FrameRingWriter:
+    """Writes frames into a memory-mapped ring of `slot_count` slots.
+
+    A slot holds frames of up to `capacity` bytes; a larger frame grows every slot, which
+    readers notice by the generation of the header. The sequence of a slot is cleared while
+    its pixels are written and set last, so a reader can tell a complete frame from one
+    being overwritten. One writer per file; written from one thread.
+    """
+
+    def __init__(self, path: str, slot_count: int = 4, capacity: int = 0):
+        self.path = path
+        self.slot_count = slot_count
+        self.sequence = 0
+        self.generation = 0
+        self.capacity = 0
+        self._slot_size = 0
+        self._file = open(path, "w+b")
+        self._mmap: mmap.mmap = None
+        self._resize(capacity)
+
+    def write(
+        self,
+        rgb: np.ndarray,
+        pose: np.ndarray = None,
+        frame_index: int = 0,
+        timestamp: float = None,
+    ) -> int:
+        # Copies the frame into the next slot and returns its sequence number. A strided
+        # view (the RGB channels of an RGBA annotator frame) is copied in one pass
+        height, width = rgb.shape[:2]
+        channels = rgb.shape[2] if rgb.ndim == 3 else 1
+        size = height * width * channels
+        if size > self.capacity:
+            self._resize(size)
+
+        sequence = self.sequence + 1
+        offset = HEADER_SIZE + (sequence - 1) % self.slot_count * self._slot_size
+        SEQUENCE.pack_into(self._mmap, offset, 0)
+        pixels = np.frombuffer(
+            self._mmap, dtype=np.uint8, count=size, offset=offset + SLOT_HEADER_SIZE
+        )
+        pixels.reshape(rgb.shape)[...] = rgb
+        # The map can't be resized while a view of it exists
+        del pixels
+        SLOT_META.pack_into(
+            self._mmap,
+            offset + SEQUENCE.size,
+            frame_index,
+            time.time() if timestamp is None else timestamp,
+            width,
+            height,
+            channels,
+            *(_NO_POSE if pose is None else np.asarray(pose, dtype=np.float64).flat),
+        )
+        SEQUENCE.pack_into(self._mmap, offset, sequence)
+        SEQUENCE.pack_into(self._mmap, LATEST_OFFSET, sequence)
+        self.sequence = sequence
+        return sequence
+
+    def close(self, remove: bool = False):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+        if remove:
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                # Still mapped by a reader on Windows
+                logger.debug(f"Failed to remove {self.path}: {e}")
+
+    def _resize(self, capacity: int):
+        # Readers drop their frames of the previous generation
+        slot_size = _slot_size(capacity)
+        size = HEADER_SIZE + self.slot_count * slot_size
+        if self._mmap is not None:
+            SEQUENCE.pack_into(self._mmap, LATEST_OFFSET, 0)
+            self._mmap.close()
+            self._mmap = None
+        self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        for slot in range(self.slot_count):
+            SEQUENCE.pack_into(self._mmap, HEADER_SIZE + slot * slot_size, 0)
+        self.generation += 1
+        self.capacity = slot_size - SLOT_HEADER_SIZE
+        self._slot_size = slot_size
+        HEADER.pack_into(
+            self._mmap, 0, MAGIC, VERSION, self.slot_count, slot_size, self.generation
+        )
+        SEQUENCE.pack_into(self._mmap, LATEST_OFFSET, self.sequence)
+
+
+@dataclass
+class Frame:
+    """A frame of a `FrameRingReader`; `rgb` is a read-only view into the ring.
+
+    The writer overwrites the slot `slot count` frames later. Check `is_valid` after using
+    `rgb`, or copy it, when the reader may fall that far behind.
+    """
+
+    sequence: int
+    frame_index: int
+    timestamp: float
+    width: int
+    height: int
+    channels: int
+    pose: np.ndarray  # 4x4, a copy
+    rgb: np.ndarray
+    _reader: "FrameRingReader" = field(repr=False, default=None)
+    _offset: int = field(repr=False, default=0)
+    _generation: int = field(repr=False, default=0)
+
+    def is_valid(self) -> bool:
+        return self._reader._slot_sequence(self._offset, self._generation) == (
+            self.sequence
+        )
+
+
+class FrameRingReader:
+    """Reads the frames of a `FrameRingWriter` file without copying the pixels."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap: mmap.mmap = None
+        self.slot_count = 0
+        self.generation = 0
+        self._slot_size = 0
+        if not self._map():
+            self._file.close()
+            raise ValueError(f"{path} is being created or resized, open it again")
+
+    @property
+    def sequence(self) -> int:
+        # The latest frame written, 0 before the first one
+        return SEQUENCE.unpack_from(self._mmap, LATEST_OFFSET)[0]
+
+    def latest(self) -> Frame:
+        self._check_generation()
+        return self.get(self.sequence)
+
+    def get(self, sequence: int) -> Frame:
+        # Frame `sequence` if it is still in the ring, None otherwise
+        self._check_generation()
+        if sequence < 1 or sequence > self.sequence:
+            return None
+
+        offset = HEADER_SIZE + (sequence - 1) % self.slot_count * self._slot_size
+        if SEQUENCE.unpack_from(self._mmap, offset)[0] != sequence:
+            return None
+        frame_index, timestamp, width, height, channels, *pose = SLOT_META.unpack_from(
+            self._mmap, offset + SEQUENCE.size
+        )
+        rgb = np.frombuffer(
+            self._mmap,
+            dtype=np.uint8,
+            count=width * height * channels,
+            offset=offset + SLOT_HEADER_SIZE,
+        ).reshape((height, width, channels))
+        frame = Frame(
+            sequence,
+            frame_index,
+            timestamp,
+            width,
+            height,
+            channels,
+            np.array(pose, dtype=np.float64).reshape(4, 4),
+            rgb,
+            self,
+            offset,
+            self.generation,
+        )
+        # The metadata was read after the sequence, make sure it belongs to the same frame
+        return frame if frame.is_valid() else None
+
+    def wait(self, after: int = 0, timeout: float = None, interval: float = 0.001):
+        # The latest frame once its sequence is beyond `after`, None after `timeout` seconds
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._check_generation()
+            if self.sequence > after:
+                frame = self.latest()
+                if frame is not None:
+                    return frame
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(interval)
+
+    def close(self):
+        self._release()
+        self._file.close()
+
+    def _map(self) -> bool:
+        mapped = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(mapped, 0)
+        magic, version, slot_count, slot_size, generation = header
+        if magic == bytes(len(MAGIC)):
+            # Created, the writer didn't write the header yet
+            mapped.close()
+            return False
+        if magic != MAGIC or version != VERSION:
+            mapped.close()
+            raise ValueError(f"{self.path} is not a frame ring")
+        if len(mapped) < HEADER_SIZE + slot_count * slot_size or (
+            HEADER.unpack_from(mapped, 0) != header
+        ):
+            # Being resized by the writer
+            mapped.close()
+            return False
+
+        if self._mmap is not None:
+            self._release()
+        self._mmap = mapped
+        self.slot_count, self._slot_size, self.generation = header[2:]
+        return True
+
+    def _release(self):
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Frames are still referenced, the map is closed with the last of them
+            pass
+
+    def _check_generation(self):
+        # The writer grew the slots, map the file again (or on the next call)
+        if HEADER.unpack_from(self._mmap, 0)[4] != self.generation:
+            self._map()
+
+    def _slot_sequence(self, offset: int, generation: int) -> int:
+        if generation != self.generation or (
+            HEADER.unpack_from(self._mmap, 0)[4] != generation
+        ):
+            return 0
+        return SEQUENCE.unpack_from(self._mmap, offset)[0]
+
+
+def find_frame_rings(directory: str) -> list[str]:
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.endswith(FILE_SUFFIX)
+    )
@@ -0,0 +1,115 @@
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class ImageCacheStats:
+    # Served from the camera state without reading the frame
+    state_hits: int = 0
+    # Same pixels as an earlier frame, encoding skipped
+    content_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+    def to_dict(self) -> dict:
+        lookups = self.state_hits + self.content_hits + self.misses
+        return {
+            "state_hits": self.state_hits,
+            "content_hits": self.content_hits,
+            "misses": self.misses,
+            "hit_rate": (
+                (self.state_hits + self.content_hits) / lookups if lookups else 0.0
+            ),
+            "evictions": self.evictions,
+            "entries": self.entries,
+            "bytes": self.bytes,
+        }
+
+
+def frame_digest(frame: np.ndarray) -> tuple:
+    # CRC-32 releases the GIL on large buffers, so it is computed in the encoder pool
+    return (frame.shape, zlib.crc32(memoryview(frame).cast("B")))
+
+
+class ImageCache:
+    """LRU cache of encoded images, bounded by the total size of the cached bytes.
+
+    Entries are addressed by content: the digest of the raw frame plus the encoding
+    parameters. On top of that the key of the last grab of every camera (physics step,
+    pose, image size, gain, shutter time, white balance and encoding) is remembered, so a
+    repeated grab within one physics step returns without reading the frame; such a state
+    entry expires after `max_state_age` seconds in case the render of that step arrived
+    after the grab.
+    """
+
+    def __init__(self, max_bytes: int = 64 << 20, max_state_age: float = 0.5):
+        self.max_bytes = max_bytes
+        self.max_state_age = max_state_age
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, bytes] = OrderedDict()
+        # [serial number] (camera state, content key, time)
+        self._states: dict[str, tuple] = {}
+        self._stats = ImageCacheStats()
+
+    def get_by_state(self, serial_number: str, state: tuple) -> bytes:
+        with self._lock:
+            entry = self._states.get(serial_number)
+            if entry is None or entry[0] != state:
+                return None
+            if time.monotonic() - entry[2] > self.max_state_age:
+                return None
+            data = self._entries.get(entry[1])
+            if data is None:
+                return None
+            self._entries.move_to_end(entry[1])
+            self._stats.state_hits += 1
+            return data
+
+    def get(self, key: tuple) -> bytes:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats.content_hits += 1
+            return data
+
+    def put(self, key: tuple, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._stats.bytes -= len(previous)
+            self._entries[key] = data
+            self._stats.bytes += len(data)
+
+            while self._stats.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._stats.bytes -= len(evicted)
+                self._stats.evictions += 1
+            self._stats.entries = len(self._entries)
+
+    def remember_state(self, serial_number: str, state: tuple, key: tuple):
+        with self._lock:
+            self._states[serial_number] = (state, key, time.monotonic())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._states.clear()
+            self._stats.entries = 0
+            self._stats.bytes = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return self._stats.to_dict()
@@ -0,0 +1,199 @@
+import asyncio
+import io
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# isort: off
+from tmrobot.digital_robot.services import metrics
+from tmrobot.digital_robot.services.image_cache import ImageCache, frame_digest
+
+# isort: on
+
+logger = logging.getLogger(__name__)
+
+IMAGE_TYPE_JPG = "jpg"
+IMAGE_TYPE_PNG = "png"
+IMAGE_TYPE_RAW = "raw"
+
+BACKEND_AUTO = "auto"
+BACKEND_PIL = "pil"
+BACKEND_SIMPLEJPEG = "simplejpeg"
+BACKEND_TURBOJPEG = "turbojpeg"
+
+try:
+    import simplejpeg  # type: ignore
+except ImportError:
+    simplejpeg = None
+
+try:
+    from turbojpeg import TJPF_RGB, TJPF_RGBX, TurboJPEG  # type: ignore
+except ImportError:
+    TurboJPEG = None
+
+_turbojpeg = None
+
+
+def get_available_backends() -> list[str]:
+    backends = [BACKEND_PIL]
+    if simplejpeg is not None:
+        backends.append(BACKEND_SIMPLEJPEG)
+    if TurboJPEG is not None:
+        backends.append(BACKEND_TURBOJPEG)
+    return backends
+
+
+def resolve_backend(backend: str) -> str:
+    if backend == BACKEND_AUTO:
+        # Prefer the libjpeg-turbo bindings, they release the GIL while encoding
+        return get_available_backends()[-1]
+    if backend not in get_available_backends():
+        logger.warning(f"JPEG backend {backend} is not installed, use {BACKEND_PIL}")
+        return BACKEND_PIL
+    return backend
+
+
+def copy_frame(rgb: np.ndarray) -> np.ndarray:
+    # The one copy of the annotator buffer, a plain memcpy; an RGBA frame keeps its alpha
+    # channel here and is read as RGBX by the encoders
+    return np.array(rgb, dtype=np.uint8, order="C", copy=True)
+
+
+def _to_image(frame: np.ndarray) -> Image.Image:
+    height, width = frame.shape[:2]
+    if frame.ndim == 3 and frame.shape[2] == 4:
+        return Image.frombytes("RGB", (width, height), frame, "raw", "RGBX")
+    return Image.fromarray(frame)
+
+
+def encode_frame(
+    frame: np.ndarray,
+    image_type: str = IMAGE_TYPE_JPG,
+    quality: int = 50,
+    backend: str = BACKEND_PIL,
+) -> bytes:
+    rgbx = frame.ndim == 3 and frame.shape[2] == 4
+
+    if image_type == IMAGE_TYPE_RAW:
+        return (frame[:, :, :3] if rgbx else frame).tobytes()
+
+    if image_type == IMAGE_TYPE_PNG:
+        buffer = io.BytesIO()
+        _to_image(frame).save(buffer, format="PNG", compress_level=1)
+        return buffer.getvalue()
+
+    if backend == BACKEND_SIMPLEJPEG:
+        return simplejpeg.encode_jpeg(
+            frame, quality=quality, colorspace="RGBX" if rgbx else "RGB"
+        )
+
+    if backend == BACKEND_TURBOJPEG:
+        global _turbojpeg
+        if _turbojpeg is None:
+            _turbojpeg = TurboJPEG()
+        return _turbojpeg.encode(
+            frame, quality=quality, pixel_format=TJPF_RGBX if rgbx else TJPF_RGB
+        )
+
+    buffer = io.BytesIO()
+    _to_image(frame).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def _encode_frame_timed(
+    frame: np.ndarray, image_type: str, quality: int, backend: str
+) -> tuple[bytes, float]:
+    # Timed in the worker, the wait for a free worker is not part of the encode time
+    start = time.perf_counter()
+    data = encode_frame(frame, image_type, quality, backend)
+    return data, time.perf_counter() - start
+
+
+class ImageEncoder:
+    """Encodes camera frames in a worker pool so the Kit event loop keeps running.
+
+    `encode` copies the frame once on the calling thread and awaits the encoded bytes. A
+    thread pool is the default since PIL and the libjpeg-turbo bindings release the GIL while
+    encoding; a process pool also works but pays for pickling every frame. With a `cache`,
+    frames with the same pixels as a cached one are not encoded again.
+    """
+
+    def __init__(
+        self,
+        image_type: str = IMAGE_TYPE_JPG,
+        quality: int = 50,
+        backend: str = BACKEND_AUTO,
+        workers: int = 2,
+        use_processes: bool = False,
+        cache: ImageCache = None,
+    ):
+        self.image_type = image_type
+        self.quality = quality
+        self.backend = resolve_backend(backend)
+        self.cache = cache
+        self._encode_seconds: dict[tuple, metrics.Histogram] = {}  # [(camera, type)]
+        self._executor: Executor = (
+            ProcessPoolExecutor(workers)
+            if use_processes
+            else ThreadPoolExecutor(workers, thread_name_prefix="image-encoder")
+        )
+
+    async def encode(
+        self,
+        rgb: np.ndarray,
+        image_type: str = None,
+        quality: int = None,
+        serial_number: str = "",
+    ) -> bytes:
+        return (await self.encode_keyed(rgb, image_type, quality, serial_number))[1]
+
+    async def encode_keyed(
+        self,
+        rgb: np.ndarray,
+        image_type: str = None,
+        quality: int = None,
+        serial_number: str = "",
+    ) -> tuple[tuple, bytes]:
+        # Returns the cache key of the content with the encoded bytes (None without cache)
+        image_type = image_type or self.image_type
+        quality = quality or self.quality
+        frame = copy_frame(rgb)
+        loop = asyncio.get_running_loop()
+
+        key = None
+        if self.cache is not None:
+            digest = await loop.run_in_executor(self._executor, frame_digest, frame)
+            key = (digest, image_type, quality, self.backend)
+            data = self.cache.get(key)
+            if data is not None:
+                return key, data
+
+        data, seconds = await loop.run_in_executor(
+            self._executor,
+            _encode_frame_timed,
+            frame,
+            image_type,
+            quality,
+            self.backend,
+        )
+        histogram = self._encode_seconds.get((serial_number, image_type))
+        if histogram is None:
+            histogram = self._encode_seconds[serial_number, image_type] = (
+                metrics.registry.histogram(
+                    "digital_robot_image_encode_seconds",
+                    "Time to encode one camera frame in the encoder pool",
+                    camera=serial_number,
+                    image_type=image_type,
+                    backend=self.backend,
+                )
+            )
+        histogram.observe(seconds)
+        if key is not None:
+            self.cache.put(key, data)
+        return key, data
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,252 @@
+import logging
+import threading
+import time
+
+# isort: off
+from tmrobot.digital_robot.services import metrics
+from tmrobot.digital_robot.services.log_pipeline import CONSOLE
+from tmrobot.digital_robot.services.tmsvr import MODE_STRING, build_packet
+
+# isort: on
+
+logger = logging.getLogger(__name__)
+
+# Content of the slave's acknowledgment of a successful write
+ACK_OK = "00"
+
+
+def _format_changes(changes: dict) -> str:
+    # One TMSVR write statement per line, e.g. "End_DI[0]=1\r\nCtrl_DI[3]=0"
+    return "\r\n".join(
+        f"{item}[{index}]={value}" for (item, index), value in changes.items()
+    )
+
+
+class _Transaction:
+    __slots__ = ("changes", "sequence", "sent", "attempt", "timer")
+
+    def __init__(self, changes: dict, sequence: int, sent: float, attempt: int, timer):
+        self.changes = changes
+        self.sequence = sequence
+        self.sent = sent
+        self.attempt = attempt
+        self.timer = timer
+
+
+class IOCommandChannel:
+    """DI writes of one robot, merged per physics step and pipelined to the Ethernet slave.
+
+    `set` only records the newest value of a DI under a lock, so the physics callback never
+    waits for the master loop or the socket. `flush` (called at the end of the physics step)
+    sends every pending change in one TMSVR packet; changes nobody flushes are sent by the
+    master loop, which checks every `flush_delay` seconds while connected. Up to `max_in_flight` packets
+    wait for their acknowledgment at once, further changes keep merging until one is
+    acknowledged. A packet not acknowledged within `timeout` is sent again up to `retries`
+    times, except for the DIs that have a newer value pending or were written again by a later
+    packet (in flight or acknowledged): the slave may apply packets out of order, so a retry
+    must never overwrite a newer value with an older one.
+    """
+
+    def __init__(
+        self,
+        master,
+        timeout: float = 1.0,
+        max_in_flight: int = 4,
+        retries: int = 2,
+        flush_delay: float = 0.02,
+    ):
+        self._master = master
+        self.timeout = timeout
+        self.max_in_flight = max(1, max_in_flight)
+        self.retries = retries
+        self.flush_delay = flush_delay
+        self.set_count = 0
+        self.coalesced_count = 0
+        self.sent_count = 0
+        self.ack_count = 0
+        self.error_count = 0
+        self.timeout_count = 0
+        self._lock = threading.Lock()
+        self._changes: dict[tuple[str, int], int] = {}  # [(item, index)]
+        self._batch_opened: float = None  # time of the first change not sent yet
+        self._send_scheduled = False
+        self._poll_handle = None
+        self._in_flight: dict[str, _Transaction] = {}  # [transaction id]
+        self._next_id = 0
+        # Sequence of the newest packet that wrote a DI, retries keep their first sequence
+        self._sequence = 0
+        self._last_written: dict[tuple[str, int], int] = {}  # [(item, index)]
+        self._rtt_seconds = metrics.registry.histogram(
+            "digital_robot_tmsvr_io_rtt_seconds",
+            "Time from sending a DI write packet to its acknowledgment",
+            robot=master.robot_name,
+        )
+        self._batch_size = metrics.registry.histogram(
+            "digital_robot_tmsvr_io_batch_size",
+            "DI changes sent in one TMSVR packet",
+            buckets=(1, 2, 4, 8, 16, 32),
+            robot=master.robot_name,
+        )
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    @property
+    def pending(self) -> int:
+        return len(self._changes)
+
+    def set(self, item: str, index: int, value: int):
+        # Callable from any thread, the change is sent with the next flush
+        loop = self._master._loop
+        if loop is None or loop.is_closed():
+            logger.warning(
+                "%s: not connected, drop %s[%s]",
+                self._master.robot_name,
+                item,
+                index,
+                extra={"rate_limit_key": (self._master.robot_name, "drop")},
+            )
+            return
+
+        with self._lock:
+            key = (item, index)
+            if key in self._changes:
+                self.coalesced_count += 1
+            self._changes[key] = value
+            self.set_count += 1
+            if self._batch_opened is None:
+                self._batch_opened = time.monotonic()
+
+    def flush(self):
+        # Sends the changes made since the last flush, without waiting for the master loop
+        with self._lock:
+            if not self._changes or self._send_scheduled:
+                return
+            self._send_scheduled = True
+        loop = self._master._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._send)
+
+    def acknowledge(self, response) -> bool:
+        # Runs on the master loop for every response, True if it belongs to a DI write
+        transaction = self._in_flight.pop(response.transaction_id, None)
+        if transaction is None:
+            return False
+
+        transaction.timer.cancel()
+        self._rtt_seconds.observe(time.monotonic() - transaction.sent)
+        if response.content.strip() == ACK_OK:
+            self.ack_count += 1
+        else:
+            self.error_count += 1
+            logger.warning(
+                "%s: Ethernet slave rejected %r: %s",
+                self._master.robot_name,
+                _format_changes(transaction.changes),
+                response.content,
+                extra={"rate_limit_key": (self._master.robot_name, "io error")},
+            )
+        # A freed slot lets the changes held back by max_in_flight go out
+        self._send()
+        return True
+
+    def start(self):
+        # Runs on the master loop once connected
+        self._poll_handle = self._master._loop.call_later(self.flush_delay, self._poll)
+
+    def reset(self):
+        # Forgets the packets in flight, e.g. when the connection is lost
+        if self._poll_handle is not None:
+            self._poll_handle.cancel()
+            self._poll_handle = None
+        for transaction in self._in_flight.values():
+            transaction.timer.cancel()
+        self._in_flight.clear()
+
+    def _send(self):
+        if len(self._in_flight) >= self.max_in_flight:
+            return
+
+        with self._lock:
+            changes = self._changes
+            self._changes = {}
+            self._batch_opened = None
+            self._send_scheduled = False
+        if changes:
+            self._sequence += 1
+            for key in changes:
+                self._last_written[key] = self._sequence
+            self._write(changes, self._sequence, 0)
+
+    def _write(self, changes: dict, sequence: int, attempt: int):
+        master = self._master
+        content = _format_changes(changes)
+        if not master.connected:
+            logger.warning(
+                "%s: not connected, drop %r",
+                master.robot_name,
+                content,
+                extra={"rate_limit_key": (master.robot_name, "drop")},
+            )
+            return
+
+        # A counter is unique per connection and cheaper than a UUID
+        self._next_id += 1
+        transaction_id = f"io{self._next_id:x}"
+        master._transport.write(build_packet(transaction_id, MODE_STRING, content))
+        self._in_flight[transaction_id] = _Transaction(
+            changes,
+            sequence,
+            time.monotonic(),
+            attempt,
+            master._loop.call_later(self.timeout, self._expire, transaction_id),
+        )
+        self.sent_count += 1
+        self._batch_size.observe(len(changes))
+        logger.info(
+            "%s: Set %s",
+            master.robot_name,
+            content.replace("\r\n", ", "),
+            extra=CONSOLE,
+        )
+
+    def _poll(self):
+        # Sends changes that were not flushed, e.g. made outside the physics step
+        batch_opened = self._batch_opened
+        if batch_opened is not None and (
+            time.monotonic() - batch_opened >= self.flush_delay
+        ):
+            self._send()
+        self._poll_handle = self._master._loop.call_later(self.flush_delay, self._poll)
+
+    def _expire(self, transaction_id: str):
+        transaction = self._in_flight.pop(transaction_id, None)
+        if transaction is None:
+            return
+
+        self.timeout_count += 1
+        with self._lock:
+            # DIs set again since are sent, or were sent, with their newer value
+            changes = {
+                key: value
+                for key, value in transaction.changes.items()
+                if key not in self._changes
+                and self._last_written.get(key) == transaction.sequence
+            }
+        if not changes:
+            self._send()
+            return
+
+        if transaction.attempt >= self.retries:
+            logger.warning(
+                "%s: no acknowledgment for %r after %d attempts",
+                self._master.robot_name,
+                _format_changes(changes),
+                transaction.attempt + 1,
+                extra={"rate_limit_key": (self._master.robot_name, "io timeout")},
+            )
+            self._send()
+            return
+
+        self._write(changes, transaction.sequence, transaction.attempt + 1)
@@ -0,0 +1,105 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from pxr import Sdf
+
+logger = logging.getLogger(__name__)
+
+USD_EXTENSIONS = (".usd", ".usda", ".usdc")
+
+
+def find_layers(directories: list[str]) -> list[str]:
+    # Every USD file under the directories, in a stable order
+    paths = []
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            paths.extend(
+                os.path.join(root, name)
+                for name in sorted(files)
+                if name.lower().endswith(USD_EXTENSIONS)
+            )
+    return paths
+
+
+class LayerPrefetcher:
+    """Opens USD layers on a background thread so later references compose from memory.
+
+    Every USD file under `directories`, and the local layers they sublayer or reference, is
+    opened with `Sdf.Layer.FindOrOpen` and kept open until `close`. While a layer is open
+    the layer registry returns it to every other open, e.g. when the services start and
+    reference grippers, cameras or workpieces, instead of reading and parsing the file again.
+    """
+
+    def __init__(self, directories: list[str]):
+        self.directories = [path for path in directories if os.path.isdir(path)]
+        self.seconds = 0.0
+        self.failed: list[str] = []
+        self._layers: dict[str, Sdf.Layer] = {}  # [absolute path]
+        self._stopping = threading.Event()
+        self._done = threading.Event()
+        self._thread: threading.Thread = None
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def layer_count(self) -> int:
+        return len(self._layers)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="usd-layer-prefetch", daemon=True
+        )
+        self._thread.start()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def close(self, timeout: float = 1.0):
+        # Stops after the layer being opened and lets the layers go
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._layers.clear()
+
+    def _run(self):
+        start = time.perf_counter()
+        queue = deque(find_layers(self.directories))
+        seen = set(queue)
+        try:
+            while queue and not self._stopping.is_set():
+                path = queue.popleft()
+                layer = self._open(path)
+                if layer is None:
+                    continue
+
+                for asset_path in layer.GetCompositionAssetDependencies():
+                    dependency = os.path.normpath(layer.ComputeAbsolutePath(asset_path))
+                    if dependency not in seen and os.path.isfile(dependency):
+                        seen.add(dependency)
+                        queue.append(dependency)
+        finally:
+            self.seconds = time.perf_counter() - start
+            self._done.set()
+        logger.info(
+            f"Prefetched {len(self._layers)} USD layers in {self.seconds * 1000:.0f} ms"
+        )
+
+    def _open(self, path: str) -> Sdf.Layer:
+        try:
+            layer = Sdf.Layer.FindOrOpen(path)
+        except Exception as e:
+            layer = None
+            logger.debug(f"Failed to prefetch {path}: {e}")
+        if not layer:
+            self.failed.append(path)
+            return None
+        self._layers[path] = layer
+        return layer
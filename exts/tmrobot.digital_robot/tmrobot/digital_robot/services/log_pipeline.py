@@ -0,0 +1,190 @@
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+LOGGER_NAME = "tmrobot.digital_robot"
+
+# `logger.info(message, extra=CONSOLE)` also prints the message to stdout like the former
+# _console methods: "<UTC time> [Info] [tmrobot.digital_robot] <message>"
+CONSOLE = {"console": True}
+
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+class _ConsoleFormatter(logging.Formatter):
+    converter = time.gmtime
+
+    def __init__(self):
+        super().__init__(
+            "%(asctime)s [Info] [tmrobot.digital_robot] %(message)s",
+            "%Y-%m-%d %H:%M:%S",
+        )
+
+
+class _ConsoleFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        return getattr(record, "console", False)
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets the same message through at most once per `interval` seconds.
+
+    Messages are the same when their logger, level, template and arguments are, so
+    f-strings are deduplicated by text and `%`-style calls by their values. A record with a
+    `rate_limit_key` extra is limited by that key instead, e.g. one warning per robot for a
+    message whose arguments change on every call. The next message that passes tells how
+    many were suppressed.
+    """
+
+    def __init__(self, interval: float = 1.0, max_keys: int = 4096):
+        super().__init__()
+        self.interval = interval
+        self.max_keys = max_keys
+        self.suppressed_count = 0
+        self._windows: dict = {}  # [key] = [window start, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.interval <= 0:
+            return True
+
+        key = getattr(record, "rate_limit_key", None)
+        if key is None:
+            key = (record.name, record.levelno, record.msg, record.args)
+            try:
+                hash(key)
+            except TypeError:
+                key = (record.name, record.levelno, record.msg)
+
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None and now - window[0] < self.interval:
+                window[1] += 1
+                self.suppressed_count += 1
+                return False
+
+            if len(self._windows) >= self.max_keys:
+                self._prune(now)
+            self._windows[key] = [now, 0]
+
+        if window is not None and window[1]:
+            record.msg = f"{record.msg} ({window[1]} similar messages suppressed)"
+        return True
+
+    def _prune(self, now: float):
+        expired = [
+            key
+            for key, (start, _) in self._windows.items()
+            if now - start >= self.interval
+        ]
+        for key in expired:
+            del self._windows[key]
+        if len(self._windows) >= self.max_keys:
+            self._windows.clear()
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    # QueueHandler.prepare formats every record on the calling thread; the queue stays in
+    # this process, so records whose arguments can't change later are formatted by the
+    # listener thread instead
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # The traceback must be rendered while the frames are still alive
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if record.args and not all(
+            isinstance(arg, _SCALAR_TYPES) for arg in _iter_args(record.args)
+        ):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def _iter_args(args):
+    return args.values() if isinstance(args, dict) else args
+
+
+class _ForwardingHandler(logging.Handler):
+    # The handlers of the pipeline on the calling thread, for when it isn't queued
+    def __init__(self, handlers: list[logging.Handler]):
+        super().__init__()
+        self._handlers = handlers
+
+    def emit(self, record: logging.LogRecord):
+        for handler in self._handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class LogPipeline:
+    """Moves the log output of the extension and its services off the calling threads.
+
+    `start` hangs one queue handler on the `tmrobot.digital_robot` logger; a listener thread
+    hands the records to the handlers the root logger had (Kit's log) and prints the
+    `CONSOLE` ones to stdout. Callers only pay for the rate limit check and a queue put,
+    `%`-style messages are formatted by the listener. Without `queued` the same handlers run
+    on the calling thread, still rate limited.
+    """
+
+    def __init__(
+        self,
+        logger_name: str = LOGGER_NAME,
+        rate_limit_interval: float = 1.0,
+        queued: bool = True,
+    ):
+        self.logger = logging.getLogger(logger_name)
+        self.rate_limit = RateLimitFilter(rate_limit_interval)
+        self.queued = queued
+        self._handler: logging.Handler = None
+        self._listener: logging.handlers.QueueListener = None
+        self._propagate = self.logger.propagate
+
+    @property
+    def running(self) -> bool:
+        return self._handler is not None
+
+    def start(self):
+        if self.running:
+            return
+
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(_ConsoleFormatter())
+        console_handler.addFilter(_ConsoleFilter())
+        handlers = [
+            handler
+            for handler in logging.getLogger().handlers
+            if not isinstance(handler, logging.handlers.QueueHandler)
+        ] or [logging.lastResort]
+        handlers.append(console_handler)
+
+        if self.queued:
+            records = queue.SimpleQueue()
+            handler = _LazyQueueHandler(records)
+            self._listener = logging.handlers.QueueListener(
+                records, *handlers, respect_handler_level=True
+            )
+            self._listener.start()
+        else:
+            handler = _ForwardingHandler(handlers)
+        handler.addFilter(self.rate_limit)
+
+        self._handler = handler
+        self.logger.addHandler(handler)
+        self._propagate = self.logger.propagate
+        self.logger.propagate = False
+
+    def stop(self):
+        # Flushes every queued record before returning
+        if self._handler is None:
+            return
+        self.logger.removeHandler(self._handler)
+        self.logger.propagate = self._propagate
+        self._handler = None
+
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
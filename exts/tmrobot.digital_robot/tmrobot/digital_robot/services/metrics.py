@@ -0,0 +1,271 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from a 50 us parse to a 10 s stalled grab
+DEFAULT_BUCKETS = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations in seconds, safe to observe from any thread."""
+
+    __slots__ = ("name", "labels", "buckets", "counts", "sum", "count", "max", "_lock")
+
+    def __init__(self, name: str, labels: tuple, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.labels = labels
+        self.buckets = buckets
+        # One count per bucket plus +Inf, not cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+            if value > self.max:
+                self.max = value
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+    def quantile(self, q: float) -> float:
+        # Linear interpolation inside the bucket holding the q-th observation
+        with self._lock:
+            counts = list(self.counts)
+            count = self.count
+            maximum = self.max
+        if count == 0:
+            return 0.0
+
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else maximum
+                upper = min(upper, maximum)
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return maximum
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            count = self.count
+            total = self.sum
+            maximum = self.max
+        return {
+            "labels": dict(self.labels),
+            "count": count,
+            "sum": total,
+            "mean_ms": total / count * 1000 if count else 0.0,
+            "p50_ms": self.quantile(0.5) * 1000,
+            "p90_ms": self.quantile(0.9) * 1000,
+            "p99_ms": self.quantile(0.99) * 1000,
+            "max_ms": maximum * 1000,
+        }
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple, extra: str = None) -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class MetricsRegistry:
+    """Histograms by metric name and label values, e.g. robot="Robot01" or camera="<serial>".
+
+    Hot paths fetch their histogram once and call `observe`; `to_prometheus` and `snapshot`
+    can be called from any thread while the histograms are being updated.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._descriptions: dict[str, str] = {}
+        self._histograms: dict[tuple, Histogram] = {}
+
+    def histogram(
+        self,
+        name: str,
+        description: str = "",
+        buckets: tuple = DEFAULT_BUCKETS,
+        **labels,
+    ) -> Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is not None:
+            return histogram
+
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(name, key[1], buckets)
+                if description or name not in self._descriptions:
+                    self._descriptions[name] = description
+            return histogram
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def _grouped(self) -> dict[str, list[Histogram]]:
+        with self._lock:
+            histograms = list(self._histograms.values())
+        grouped: dict[str, list[Histogram]] = {}
+        for histogram in histograms:
+            grouped.setdefault(histogram.name, []).append(histogram)
+        return grouped
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, histograms in sorted(self._grouped().items()):
+            lines.append(f"# HELP {name} {self._descriptions.get(name, '')}")
+            lines.append(f"# TYPE {name} histogram")
+            for histogram in histograms:
+                with histogram._lock:
+                    counts = list(histogram.counts)
+                    total = histogram.sum
+                    count = histogram.count
+                cumulative = 0
+                for bucket, bucket_count in zip(histogram.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(histogram.labels, f'le="{bucket}"')
+                    lines.append(f"{name}_bucket{labels} {cumulative}")
+                labels = _format_labels(histogram.labels, 'le="+Inf"')
+                lines.append(f"{name}_bucket{labels} {count}")
+                labels = _format_labels(histogram.labels)
+                lines.append(f"{name}_sum{labels} {total}")
+                lines.append(f"{name}_count{labels} {count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {
+            "timestamp": time.time(),
+            "metrics": {
+                name: {
+                    "description": self._descriptions.get(name, ""),
+                    "type": "histogram",
+                    "series": [histogram.to_dict() for histogram in histograms],
+                }
+                for name, histograms in sorted(self._grouped().items())
+            },
+        }
+
+
+# Process-wide registry the services record into
+registry = MetricsRegistry()
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = registry
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body = self.registry.to_prometheus().encode("utf-8")
+            content_type = PROMETHEUS_CONTENT_TYPE
+        elif path == "/metrics.json":
+            body = json.dumps(self.registry.snapshot()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class MetricsServer:
+    """Serves `/metrics` (Prometheus text) and `/metrics.json` from a daemon thread.
+
+    Scrapes are answered off the Kit event loop, so they also work while it is stalled.
+    """
+
+    def __init__(
+        self,
+        metrics: MetricsRegistry = registry,
+        host: str = "127.0.0.1",
+        port: int = 9464,
+    ):
+        self.host = host
+        self.port = port
+        self._metrics = metrics
+        self._server: ThreadingHTTPServer = None
+        self._thread: threading.Thread = None
+
+    def start(self):
+        handler = type(
+            "MetricsRequestHandler",
+            (_MetricsRequestHandler,),
+            {"registry": self._metrics},
+        )
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics-server", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Metrics served at http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
@@ -0,0 +1,425 @@
+import asyncio
+import heapq
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+# isort: off
+from tmrobot.digital_robot.services.tmsvr import DEFAULT_IO_SIZES, EthernetFrame
+
+# isort: on
+
+logger = logging.getLogger(__name__)
+
+# File: header, then chunks of up to CHUNK_ROWS rows. A chunk is a chunk header followed by
+# one contiguous column per field, so every column of a chunk maps to a NumPy view:
+#   timestamp float64[rows]  seconds since the recording started
+#   sequence  uint32[rows]   frame number of the parser
+#   joints    float64[rows, 6]
+#   io        uint8[rows, io size]  ctrl_di, ctrl_do, end_di, end_do
+# The columns of a chunk are sized for its capacity; full chunks have CHUNK_ROWS, the last
+# chunk written by flush or close only as many as it holds.
+MAGIC = b"TMSVRLOG"
+VERSION = 1
+HEADER = struct.Struct("<8sII32sd4H8x")  # magic, version, chunk rows, robot, start, io
+CHUNK_HEADER = struct.Struct("<4sII4x")  # b"CHNK", rows, capacity
+CHUNK_MAGIC = b"CHNK"
+CHUNK_ROWS = 4096
+JOINT_COUNT = 6
+FILE_SUFFIX = ".tmlog"
+
+IO_ATTRIBUTES = tuple(DEFAULT_IO_SIZES)
+
+
+def _chunk_layout(chunk_rows: int, io_size: int) -> tuple[dict, int]:
+    # Column offsets from the start of a chunk and the chunk size
+    offsets = {}
+    offset = CHUNK_HEADER.size
+    for name, size in (
+        ("timestamp", 8),
+        ("sequence", 4),
+        ("joints", 8 * JOINT_COUNT),
+        ("io", io_size),
+    ):
+        offsets[name] = offset
+        # Keep every column 8 byte aligned
+        offset += (chunk_rows * size + 7) // 8 * 8
+    return offsets, offset
+
+
+class MotionLogWriter:
+    """Appends the frames of one robot to a motion log file.
+
+    Rows are copied into a preallocated chunk; a full chunk is written to the file in one
+    call, so `append` costs a few array assignments. Completed chunks survive a crash.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        robot_name: str,
+        io_sizes: dict[str, int] = None,
+        chunk_rows: int = CHUNK_ROWS,
+    ):
+        self.path = path
+        self.robot_name = robot_name
+        self.io_sizes = {
+            name: (io_sizes or DEFAULT_IO_SIZES)[name] for name in IO_ATTRIBUTES
+        }
+        self.chunk_rows = chunk_rows
+        self.row_count = 0
+        self.start_time: float = None
+        self._io_size = sum(self.io_sizes.values())
+        self._offsets, self._chunk_size = _chunk_layout(chunk_rows, self._io_size)
+        self._chunk = bytearray(self._chunk_size)
+        self._timestamps = self._column("timestamp", np.float64)
+        self._sequences = self._column("sequence", np.uint32)
+        self._joints = self._column("joints", np.float64).reshape(-1, JOINT_COUNT)
+        self._io = self._column("io", np.uint8).reshape(-1, self._io_size)
+        self._rows = 0
+        self._file = open(path, "wb")
+        self._lock = threading.Lock()
+
+    def _column(self, name: str, dtype) -> np.ndarray:
+        count = self.chunk_rows * {"joints": JOINT_COUNT, "io": self._io_size}.get(
+            name, 1
+        )
+        return np.frombuffer(
+            self._chunk, dtype=dtype, count=count, offset=self._offsets[name]
+        )
+
+    def append(self, frame: EthernetFrame):
+        with self._lock:
+            if self._file is None:
+                return
+            if self.start_time is None:
+                self.start_time = frame.timestamp
+                self._write_header(time.time() - (time.monotonic() - frame.timestamp))
+
+            row = self._rows
+            self._timestamps[row] = frame.timestamp - self.start_time
+            self._sequences[row] = frame.sequence
+            self._joints[row] = frame.joint_radian[:JOINT_COUNT]
+            if len(frame.io) == self._io_size:
+                self._io[row] = frame.io
+            else:
+                # IO items of another size than at the start of the recording
+                size = min(len(frame.io), self._io_size)
+                self._io[row, :size] = frame.io[:size]
+                self._io[row, size:] = 0
+            self._rows += 1
+            self.row_count += 1
+            if self._rows == self.chunk_rows:
+                self._write_chunk()
+
+    def flush(self):
+        # Writes the partial chunk; appending continues in a new chunk
+        with self._lock:
+            if self._file is not None and self._rows:
+                self._write_chunk()
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                if self.start_time is None:
+                    self._write_header(0.0)
+                self._file.close()
+                self._file = None
+
+    def _write_header(self, wall_time: float):
+        # wall_time: time.time() of the first frame
+        self._file.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                self.chunk_rows,
+                self.robot_name.encode("utf-8")[:32],
+                wall_time,
+                *self.io_sizes.values(),
+            )
+        )
+
+    def _write_chunk(self):
+        rows = self._rows
+        self._rows = 0
+        if rows == self.chunk_rows:
+            CHUNK_HEADER.pack_into(self._chunk, 0, CHUNK_MAGIC, rows, rows)
+            self._file.write(self._chunk)
+            return
+
+        # A partial chunk is written with columns sized for its rows
+        offsets, size = _chunk_layout(rows, self._io_size)
+        chunk = bytearray(size)
+        CHUNK_HEADER.pack_into(chunk, 0, CHUNK_MAGIC, rows, rows)
+        for name, column in (
+            ("timestamp", self._timestamps),
+            ("sequence", self._sequences),
+            ("joints", self._joints),
+            ("io", self._io),
+        ):
+            data = column[:rows].tobytes()
+            chunk[offsets[name] : offsets[name] + len(data)] = data
+        self._file.write(chunk)
+
+
+class MotionLog:
+    """A motion log file, memory-mapped; columns are NumPy views of the file per chunk."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic,
+            version,
+            self.chunk_rows,
+            robot_name,
+            self.start_time,
+            *io_sizes,
+        ) = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a motion log")
+
+        self.robot_name = robot_name.rstrip(b"\0").decode("utf-8")
+        self.io_sizes = dict(zip(IO_ATTRIBUTES, io_sizes))
+        self._io_size = sum(io_sizes)
+        # (offset, rows, column offsets) of every chunk
+        self._chunks: list[tuple[int, int, dict]] = []
+        offset = HEADER.size
+        while offset + CHUNK_HEADER.size <= len(self._mmap):
+            magic, rows, capacity = CHUNK_HEADER.unpack_from(self._mmap, offset)
+            offsets, size = _chunk_layout(capacity, self._io_size)
+            if magic != CHUNK_MAGIC or offset + size > len(self._mmap):
+                # Cut off while writing
+                break
+            self._chunks.append((offset, rows, offsets))
+            offset += size
+
+    def __len__(self) -> int:
+        return sum(rows for _, rows, _ in self._chunks)
+
+    @property
+    def duration(self) -> float:
+        last = None
+        for chunk in self.chunks():
+            last = chunk["timestamp"]
+        return float(last[-1]) if last is not None and len(last) else 0.0
+
+    def chunks(self):
+        # Yields dicts of column views {"timestamp", "sequence", "joints", "io"}, no copies
+        for start, rows, offsets in self._chunks:
+
+            def _view(name: str, dtype, count: int) -> np.ndarray:
+                return np.frombuffer(
+                    self._mmap, dtype=dtype, count=count, offset=start + offsets[name]
+                )
+
+            yield {
+                "timestamp": _view("timestamp", np.float64, rows),
+                "sequence": _view("sequence", np.uint32, rows),
+                "joints": _view("joints", np.float64, rows * JOINT_COUNT).reshape(
+                    rows, JOINT_COUNT
+                ),
+                "io": _view("io", np.uint8, rows * self._io_size).reshape(
+                    rows, self._io_size
+                ),
+            }
+
+    def column(self, name: str) -> np.ndarray:
+        # One column of every chunk concatenated (a copy)
+        columns = [chunk[name] for chunk in self.chunks()]
+        return np.concatenate(columns) if columns else np.zeros(0)
+
+    def rows(self):
+        # (timestamp, joints, io) per row, views into the file
+        for chunk in self.chunks():
+            timestamps, joints, io = chunk["timestamp"], chunk["joints"], chunk["io"]
+            for row in range(len(timestamps)):
+                yield float(timestamps[row]), joints[row], io[row]
+
+    def close(self):
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Column views are still referenced, the map is closed with the last of them
+            pass
+
+
+class MotionLogRecorder:
+    """One `MotionLogWriter` per robot in `directory`, fed by `TMSVRMaster.recorder`."""
+
+    def __init__(self, directory: str, chunk_rows: int = CHUNK_ROWS):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self._writers: dict[str, MotionLogWriter] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def paths(self) -> list[str]:
+        return [writer.path for writer in self._writers.values()]
+
+    def append(self, frame: EthernetFrame):
+        writer = self._writers.get(frame.robot_name)
+        if writer is None:
+            with self._lock:
+                writer = self._writers.get(frame.robot_name)
+                if writer is None:
+                    writer = self._writers[frame.robot_name] = MotionLogWriter(
+                        os.path.join(
+                            self.directory, f"{frame.robot_name}{FILE_SUFFIX}"
+                        ),
+                        frame.robot_name,
+                        {name: len(getattr(frame, name)) for name in IO_ATTRIBUTES},
+                        self.chunk_rows,
+                    )
+        writer.append(frame)
+
+    def flush(self):
+        for writer in list(self._writers.values()):
+            writer.flush()
+
+    def close(self):
+        for writer in list(self._writers.values()):
+            writer.close()
+            logger.info(f"Recorded {writer.row_count} frames to {writer.path}")
+
+
+def find_motion_logs(directory: str) -> list[str]:
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.endswith(FILE_SUFFIX)
+    )
+
+
+class MotionReplay:
+    """Feeds recorded frames to a motion queue the way the Ethernet masters do.
+
+    The frames of every log are merged by their recorded time and put on `motion_queue`
+    (a `MotionMailbox` or `JointTrajectoryBuffer`) with the current time as timestamp. A
+    log's times count from its robot's first frame, so every log is shifted by the wall
+    time its recording started after the earliest one; robots that connected later keep
+    their delay.
+    `run` keeps the recorded timing scaled by `speed` (10 plays ten times faster, 0 as fast
+    as possible), which only suits a consumer at least as fast as the frames. `step` is
+    lockstep replay instead: one call per physics step puts the next frame of every robot,
+    so every recorded frame is applied however fast the world is stepped; `time` is the
+    recorded time of the last frame put. One frame per robot is refilled for every put, the
+    motion queue copies it as it does the parser's frame of `TMSVRMaster`.
+    """
+
+    def __init__(
+        self,
+        logs: list[MotionLog],
+        motion_queue,
+        speed: float = 1.0,
+    ):
+        self.logs = logs
+        self.speed = speed
+        self.frame_count = 0
+        self.time = 0.0
+        self._motion_queue = motion_queue
+        self._frames = {
+            log.robot_name: EthernetFrame(log.robot_name, log.io_sizes) for log in logs
+        }
+        self._sequences = {log.robot_name: 0 for log in logs}
+        self._rows = None  # rows() of step
+        self._next_row = None
+
+    @classmethod
+    def from_directory(cls, directory: str, motion_queue, speed: float = 1.0):
+        return cls(
+            [MotionLog(path) for path in find_motion_logs(directory)],
+            motion_queue,
+            speed,
+        )
+
+    @property
+    def duration(self) -> float:
+        offsets = self.get_offsets()
+        return max(
+            (offsets[log.robot_name] + log.duration for log in self.logs), default=0.0
+        )
+
+    def get_offsets(self) -> dict[str, float]:
+        # [robot name] seconds the log started after the earliest, from the header wall times
+        starts = [log.start_time for log in self.logs if len(log)]
+        first = min(starts, default=0.0)
+        return {
+            log.robot_name: log.start_time - first if len(log) else 0.0
+            for log in self.logs
+        }
+
+    def rows(self):
+        # (time since the earliest recording started, robot name, joints, io) in time order
+        offsets = self.get_offsets()
+        return heapq.merge(
+            *(self._log_rows(log, offsets[log.robot_name]) for log in self.logs),
+            key=lambda row: row[0],
+        )
+
+    @staticmethod
+    def _log_rows(log: MotionLog, offset: float):
+        # A generator per log, a nested generator expression would bind the last log
+        for timestamp, joints, io in log.rows():
+            yield offset + timestamp, log.robot_name, joints, io
+
+    def put(self, robot_name: str, joints: np.ndarray, io: np.ndarray):
+        self._sequences[robot_name] += 1
+        frame = self._frames[robot_name]
+        frame.joint_radian[:] = joints
+        frame.io[:] = io
+        frame.sequence = self._sequences[robot_name]
+        frame.timestamp = time.monotonic()
+        self._motion_queue.put(frame)
+        self.frame_count += 1
+
+    @property
+    def done(self) -> bool:
+        # Every frame was put by step
+        return self._rows is not None and self._next_row is None
+
+    def step(self) -> bool:
+        # Puts frames in time order until a robot would get its second one, False once done
+        if self._rows is None:
+            self._rows = self.rows()
+            self._next_row = next(self._rows, None)
+        robot_names = set()
+        while self._next_row is not None and self._next_row[1] not in robot_names:
+            self.time, robot_name, joints, io = self._next_row
+            self.put(robot_name, joints, io)
+            robot_names.add(robot_name)
+            self._next_row = next(self._rows, None)
+        return self._next_row is not None
+
+    async def run(self, batch: int = 64):
+        # With speed 0 the loop is yielded every `batch` frames
+        start = time.monotonic()
+        for timestamp, robot_name, joints, io in self.rows():
+            if self.speed:
+                delay = start + timestamp / self.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif self.frame_count % batch == 0:
+                await asyncio.sleep(0)
+            self.time = timestamp
+            self.put(robot_name, joints, io)
+
+    def close(self):
+        # The pending row and generators hold views of the logs
+        if self._rows is not None:
+            self._next_row = None
+            self._rows.close()
+        for log in self.logs:
+            log.close()
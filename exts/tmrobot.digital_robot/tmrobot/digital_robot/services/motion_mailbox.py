@@ -0,0 +1,148 @@
+import threading
+import time
+from dataclasses import dataclass
+
+# isort: off
+from tmrobot.digital_robot.services.tmsvr import EthernetFrame
+
+# isort: on
+
+
+@dataclass
+class MailboxStats:
+    received: int = 0
+    # Frames replaced by a newer one before a physics step read them
+    overwrites: int = 0
+    # Frames discarded at read time because they were older than max_age
+    drops: int = 0
+    applied: int = 0
+    last_age: float = 0.0
+    max_age: float = 0.0
+    total_age: float = 0.0
+
+    @property
+    def mean_age(self) -> float:
+        return self.total_age / self.applied if self.applied else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "overwrites": self.overwrites,
+            "drops": self.drops,
+            "applied": self.applied,
+            "last_age_ms": self.last_age * 1000,
+            "mean_age_ms": self.mean_age * 1000,
+            "max_age_ms": self.max_age * 1000,
+        }
+
+
+class _Slot:
+    __slots__ = ("pending", "taken", "received_at", "full")
+
+    def __init__(self):
+        self.pending = None  # written by put
+        self.taken = None  # read by the physics step until the next take
+        self.received_at = 0.0
+        self.full = False
+
+    def store(self, motion):
+        # An EthernetFrame is refilled by its parser, copy it into a frame of the slot
+        if not isinstance(motion, EthernetFrame):
+            self.pending = motion
+            return
+        if not isinstance(self.pending, EthernetFrame):
+            self.pending = EthernetFrame(motion.robot_name)
+        self.pending.copy_from(motion)
+
+    def take(self):
+        self.pending, self.taken = self.taken, self.pending
+        self.full = False
+        return self.taken
+
+
+class MotionMailbox:
+    """Latest-value motion slots, one per robot name.
+
+    Receive threads call `put` (same call shape as `queue.Queue.put`, so the mailbox can be
+    handed to `EthernetMaster.receive_data`), and never block. The physics step calls
+    `take_all` to get the newest frame of every robot at once.
+
+    An `EthernetFrame` is copied into a preallocated frame of its slot under the lock, so
+    the parser can refill its own frame right away. Every slot has two frames: `take`
+    swaps them, and a taken frame stays valid until the next take of its robot.
+    """
+
+    def __init__(self, robot_names: list[str], max_age: float = 0.5):
+        self._lock = threading.Lock()
+        self._max_age = max_age
+        self._slots: dict[str, _Slot] = {name: _Slot() for name in robot_names}
+        self._stats: dict[str, MailboxStats] = {
+            name: MailboxStats() for name in robot_names
+        }
+
+    def put(self, motion, block=True, timeout=None):
+        received_at = time.monotonic()
+        robot_name = motion.robot_name
+
+        with self._lock:
+            slot = self._slots.get(robot_name)
+            if slot is None:
+                slot = self._slots[robot_name] = _Slot()
+            stats = self._stats.get(robot_name)
+            if stats is None:
+                stats = self._stats[robot_name] = MailboxStats()
+
+            if slot.full:
+                stats.overwrites += 1
+
+            slot.store(motion)
+            slot.received_at = received_at
+            slot.full = True
+            stats.received += 1
+
+    put_nowait = put
+
+    def take(self, robot_name: str):
+        with self._lock:
+            slot = self._slots.get(robot_name)
+            if slot is None or not slot.full:
+                return None
+            return self._accept(robot_name, slot, time.monotonic())
+
+    def take_all(self) -> list:
+        motions = []
+        now = time.monotonic()
+
+        with self._lock:
+            for robot_name, slot in self._slots.items():
+                if not slot.full:
+                    continue
+                motion = self._accept(robot_name, slot, now)
+                if motion is not None:
+                    motions.append(motion)
+
+        return motions
+
+    def _accept(self, robot_name: str, slot: _Slot, now: float):
+        motion = slot.take()
+        age = now - slot.received_at
+        stats = self._stats[robot_name]
+
+        if self._max_age is not None and age > self._max_age:
+            stats.drops += 1
+            return None
+
+        stats.applied += 1
+        stats.last_age = age
+        stats.total_age += age
+        stats.max_age = max(stats.max_age, age)
+        return motion
+
+    def clear(self):
+        with self._lock:
+            for slot in self._slots.values():
+                slot.full = False
+
+    def get_stats(self) -> dict[str, dict]:
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in self._stats.items()}
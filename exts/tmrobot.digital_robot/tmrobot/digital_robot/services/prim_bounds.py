@@ -0,0 +1,197 @@
+import logging
+
+from pxr import Gf, Sdf, Tf, Usd, UsdGeom
+
+logger = logging.getLogger(__name__)
+
+# Beyond this many changed paths between two queries every cached bound is dropped at once
+MAX_PENDING_PATHS = 256
+
+
+def _time_key(time: Usd.TimeCode):
+    return None if time.IsDefault() else time.GetValue()
+
+
+def _overlaps(path: Sdf.Path, changed: set) -> bool:
+    # True if a changed prim is the prim, one of its ancestors or one of its descendants
+    return any(path.HasPrefix(other) or other.HasPrefix(path) for other in changed)
+
+
+class PrimBounds:
+    """World bounds of prims, kept across calls until the stage changes them.
+
+    One `UsdGeom.BBoxCache` per time code is kept, plus the world bound of every prim asked
+    for. `Usd.Notice.ObjectsChanged` only records the changed paths; the next query drops
+    the bounds of their ancestors and descendants, so bounds of other subtrees are answered
+    from memory. A BBoxCache can only be cleared as a whole: it is cleared when a change
+    touches a prim it was asked about, an ancestor or a descendant, and kept otherwise, so
+    the robots moving every physics step don't empty it for the workpieces. The price is a
+    path check of every changed prim against every prim asked about since the last clear,
+    once per query with changes pending, and bounds that also depend on prims outside these
+    subtrees (e.g. through a proxyPrim relationship) are not refreshed by their changes.
+    `set_sizes` and `scale` write the scale of many prims in one `Sdf.ChangeBlock`; unlike
+    ChangeProperty they are not undoable.
+    """
+
+    def __init__(self, stage: Usd.Stage, purposes: list = None):
+        self.stage = stage
+        self._purposes = purposes or [UsdGeom.Tokens.default_]
+        self._bbox_caches: dict = {}  # [time code value, None for default]
+        self._bounds: dict[tuple, Gf.BBox3d] = {}  # [(prim path, time code value)]
+        self._cached_paths: set[Sdf.Path] = set()  # prims asked of the BBoxCaches
+        self._pending: set[Sdf.Path] = set()
+        self._all_stale = False
+        self._listener = Tf.Notice.Register(
+            Usd.Notice.ObjectsChanged, self._on_objects_changed, stage
+        )
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.Revoke()
+            self._listener = None
+        self._bbox_caches.clear()
+        self._bounds.clear()
+        self._cached_paths.clear()
+
+    def get_world_bound(
+        self, prim_path: str, time: Usd.TimeCode = Usd.TimeCode.Default()
+    ) -> Gf.BBox3d:
+        self._invalidate()
+        key = (Sdf.Path(prim_path), _time_key(time))
+        bound = self._bounds.get(key)
+        if bound is None:
+            prim = self.stage.GetPrimAtPath(key[0])
+            self._cached_paths.add(key[0])
+            bound = self._bounds[key] = self._bbox_cache(time).ComputeWorldBound(prim)
+        return bound
+
+    def get_size(
+        self, prim_path: str, time: Usd.TimeCode = Usd.TimeCode.Default()
+    ) -> Gf.Vec3d:
+        return self.get_world_bound(prim_path, time).ComputeAlignedRange().GetSize()
+
+    def set_sizes(self, target_sizes: dict[str, tuple]) -> dict[str, Gf.Vec3d]:
+        """Scales every prim so its world aligned size is the target size, in meters.
+
+        The size at scale 1 is computed from the cached bounds instead of writing scale 1
+        and reading the bound back; prims whose scale op isn't the innermost one are sized
+        that way, one at a time. Returns the new size of every prim.
+        """
+        self._invalidate()
+        bbox_cache = self._bbox_cache(Usd.TimeCode.Default())
+        xform_cache = UsdGeom.XformCache()
+        scales = {}
+        for prim_path, target_size in target_sizes.items():
+            prim = self.stage.GetPrimAtPath(Sdf.Path(prim_path))
+            unit_size = self._get_unit_size(prim, bbox_cache, xform_cache)
+            if unit_size is None:
+                self._scale_attribute(prim).Set(Gf.Vec3d(1, 1, 1))
+                self._invalidate_all()
+                xform_cache.Clear()
+                unit_size = self.get_size(prim_path)
+            scales[prim_path] = Gf.Vec3d(
+                *(target / size for target, size in zip(target_size, unit_size))
+            )
+
+        self._write_scales(scales)
+        return {prim_path: self.get_size(prim_path) for prim_path in target_sizes}
+
+    def scale(self, factors: dict[str, tuple]) -> dict[str, Gf.Vec3d]:
+        # Multiplies the scale of every prim by its (x, y, z) factor, returns the new sizes
+        scales = {}
+        for prim_path, factor in factors.items():
+            attribute = self._scale_attribute(
+                self.stage.GetPrimAtPath(Sdf.Path(prim_path))
+            )
+            current = attribute.Get() or Gf.Vec3d(1, 1, 1)
+            scales[prim_path] = Gf.Vec3d(
+                *(value * ratio for value, ratio in zip(current, factor))
+            )
+
+        self._write_scales(scales)
+        return {prim_path: self.get_size(prim_path) for prim_path in factors}
+
+    def _write_scales(self, scales: dict[str, Gf.Vec3d]):
+        with Sdf.ChangeBlock():
+            for prim_path, scale in scales.items():
+                self._scale_attribute(
+                    self.stage.GetPrimAtPath(Sdf.Path(prim_path))
+                ).Set(scale)
+
+    def _scale_attribute(self, prim: Usd.Prim) -> Usd.Attribute:
+        attribute = prim.GetAttribute("xformOp:scale")
+        if not attribute:
+            attribute = UsdGeom.Xformable(prim).AddScaleOp().GetAttr()
+        return attribute
+
+    def _get_unit_size(
+        self,
+        prim: Usd.Prim,
+        bbox_cache: UsdGeom.BBoxCache,
+        xform_cache: UsdGeom.XformCache,
+    ) -> Gf.Vec3d:
+        # World aligned size of the prim with scale 1, None unless scale is the innermost op
+        xformable = UsdGeom.Xformable(prim)
+        ops = xformable.GetOrderedXformOps()
+        if not ops or ops[-1].GetOpName() != "xformOp:scale":
+            return None
+
+        scale = Gf.Vec3d(ops[-1].Get() or Gf.Vec3d(1, 1, 1))
+        if any(value == 0 for value in scale):
+            return None
+
+        # The innermost op is the first factor of the row-vector local transform
+        unscale = Gf.Matrix4d().SetScale(Gf.Vec3d(*(1 / value for value in scale)))
+        local, _ = xform_cache.GetLocalTransformation(prim)
+        world = unscale * local * xform_cache.GetParentToWorldTransform(prim)
+
+        self._cached_paths.add(prim.GetPath())
+        bound = bbox_cache.ComputeUntransformedBound(prim)
+        bound.Transform(world)
+        return bound.ComputeAlignedRange().GetSize()
+
+    def _bbox_cache(self, time: Usd.TimeCode) -> UsdGeom.BBoxCache:
+        key = _time_key(time)
+        bbox_cache = self._bbox_caches.get(key)
+        if bbox_cache is None:
+            bbox_cache = self._bbox_caches[key] = UsdGeom.BBoxCache(
+                time, includedPurposes=self._purposes
+            )
+        return bbox_cache
+
+    def _on_objects_changed(self, notice, stage):
+        # Runs for every authored change, e.g. every physics step; keep it to a set update
+        if self._all_stale:
+            return
+        self._pending.update(notice.GetResyncedPaths())
+        self._pending.update(notice.GetChangedInfoOnlyPaths())
+        if len(self._pending) > MAX_PENDING_PATHS:
+            self._all_stale = True
+            self._pending.clear()
+
+    def _invalidate_all(self):
+        self._all_stale = True
+        self._invalidate()
+
+    def _invalidate(self):
+        if not self._all_stale and not self._pending:
+            return
+
+        if self._all_stale:
+            self._clear_bbox_caches()
+            self._bounds.clear()
+        else:
+            changed = {path.GetPrimPath() for path in self._pending}
+            if any(_overlaps(path, changed) for path in self._cached_paths):
+                self._clear_bbox_caches()
+            for key in list(self._bounds):
+                if _overlaps(key[0], changed):
+                    del self._bounds[key]
+        self._pending.clear()
+        self._all_stale = False
+
+    def _clear_bbox_caches(self):
+        # BBoxCache can only be cleared as a whole, it is refilled for the queried prims
+        for bbox_cache in self._bbox_caches.values():
+            bbox_cache.Clear()
+        self._cached_paths.clear()
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+
+import numpy as np
+from pxr import Gf, Sdf, Usd
+
+logger = logging.getLogger(__name__)
+
+EASING_LINEAR = "linear"
+EASING_SMOOTH = "smooth"
+
+
+def _ease(progress: np.ndarray, smooth: np.ndarray) -> np.ndarray:
+    # Smoothstep starts and stops at zero speed, linear keeps one speed
+    return np.where(smooth, progress * progress * (3.0 - 2.0 * progress), progress)
+
+
+def _resolve(future: asyncio.Future, result: bool):
+    if not future.done():
+        future.set_result(result)
+
+
+class PrimTweens:
+    """Moves the translate of many prims towards their targets, all rows at once.
+
+    `move` starts (or redirects) the tween of a prim and returns a future that is resolved
+    with True when the prim arrives, False when the tween is cancelled or replaced. A tween
+    runs for `duration` seconds or at `speed` m/s along the straight line. `step` advances
+    every tween by `dt` with NumPy and writes all translates in one `Sdf.ChangeBlock`,
+    outside the undo history. Without `step` being called, `start` steps on Kit updates.
+    """
+
+    def __init__(self, stage: Usd.Stage):
+        self.stage = stage
+        self._paths: list[str] = []
+        self._attributes: list[Usd.Attribute] = []
+        self._futures: list[asyncio.Future] = []
+        self._start = np.zeros((0, 3))
+        self._target = np.zeros((0, 3))
+        self._elapsed = np.zeros(0)
+        self._duration = np.zeros(0)
+        self._smooth = np.zeros(0, dtype=bool)
+        self._update_subscription = None
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def __contains__(self, prim_path: str) -> bool:
+        return prim_path in self._paths
+
+    def target_of(self, prim_path: str) -> tuple:
+        return tuple(self._target[self._paths.index(prim_path)])
+
+    def move(
+        self,
+        prim_path: str,
+        target,
+        speed: float = None,
+        duration: float = None,
+        easing: str = EASING_LINEAR,
+    ) -> asyncio.Future:
+        if (speed is None) == (duration is None):
+            raise ValueError("Give either speed or duration")
+
+        attribute = self.stage.GetPrimAtPath(Sdf.Path(prim_path)).GetAttribute(
+            "xformOp:translate"
+        )
+        if not attribute:
+            raise ValueError(f"{prim_path} has no xformOp:translate")
+
+        self.cancel(prim_path)
+        start = np.array(attribute.Get(), dtype=np.float64)
+        target = np.asarray(target, dtype=np.float64)
+        if duration is None:
+            duration = float(np.linalg.norm(target - start)) / speed
+
+        future = asyncio.get_event_loop().create_future()
+        self._paths.append(prim_path)
+        self._attributes.append(attribute)
+        self._futures.append(future)
+        self._start = np.vstack((self._start, start))
+        self._target = np.vstack((self._target, target))
+        self._elapsed = np.append(self._elapsed, 0.0)
+        self._duration = np.append(self._duration, max(duration, 0.0))
+        self._smooth = np.append(self._smooth, easing == EASING_SMOOTH)
+        return future
+
+    def cancel(self, prim_path: str = None):
+        # The prims stay where they are, their futures are resolved with False
+        if prim_path is None:
+            done = np.ones(len(self._paths), dtype=bool)
+        else:
+            done = np.array([path == prim_path for path in self._paths], dtype=bool)
+        self._remove(done, False)
+
+    def step(self, dt: float):
+        if not self._paths:
+            return
+
+        self._elapsed += dt
+        progress = np.divide(
+            self._elapsed,
+            self._duration,
+            out=np.ones_like(self._elapsed),
+            where=self._duration > 0,
+        )
+        np.clip(progress, 0.0, 1.0, out=progress)
+        eased = _ease(progress, self._smooth)
+        positions = self._start + (self._target - self._start) * eased[:, None]
+
+        with Sdf.ChangeBlock():
+            for attribute, position in zip(self._attributes, positions.tolist()):
+                attribute.Set(Gf.Vec3d(*position))
+
+        # Awaiting code may have given up on a tween
+        abandoned = np.array([future.done() for future in self._futures], dtype=bool)
+        self._remove(progress >= 1.0, True, abandoned)
+
+    def start(self):
+        # Steps on every Kit update until `stop`
+        if self._update_subscription is not None:
+            return
+
+        import omni.kit.app
+
+        self._update_subscription = (
+            omni.kit.app.get_app()
+            .get_update_event_stream()
+            .create_subscription_to_pop(
+                lambda event: self.step(event.payload["dt"]),
+                name="tmrobot.digital_robot.prim_tweens",
+            )
+        )
+
+    def stop(self):
+        self._update_subscription = None
+        self.cancel()
+
+    def _remove(self, done: np.ndarray, result: bool, abandoned: np.ndarray = None):
+        removed = done if abandoned is None else done | abandoned
+        if not removed.any():
+            return
+
+        for index in np.flatnonzero(removed):
+            _resolve(self._futures[index], result)
+        keep = ~removed
+        self._paths = [path for path, kept in zip(self._paths, keep) if kept]
+        self._attributes = [
+            attribute for attribute, kept in zip(self._attributes, keep) if kept
+        ]
+        self._futures = [future for future, kept in zip(self._futures, keep) if kept]
+        self._start = self._start[keep]
+        self._target = self._target[keep]
+        self._elapsed = self._elapsed[keep]
+        self._duration = self._duration[keep]
+        self._smooth = self._smooth[keep]
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+import grpc
+from google.protobuf import empty_pb2
+
+# isort: off
+from tmrobot.digital_robot.grpcs import OmniverseAPI_pb2_grpc  # type: ignore
+from tmrobot.digital_robot.ui import constants as const  # type: ignore
+
+# isort: on
+
+logger = logging.getLogger(__name__)
+
+SERVICE_VIRTUAL_CAMERA_API = "Virtual Camera API"
+SERVICE_ETHERNET = "Ethernet"
+
+# The echo server of TMSimulator presents the virtual_camera certificate
+ECHO_CERTIFICATE_PATH = os.path.join(
+    os.path.dirname(__file__), "credentials", "virtual_camera.crt"
+)
+ECHO_TARGET_NAME = "virtual_camera"
+
+
+class ChannelPool:
+    """Secure gRPC channels by IP, created once and shared by every caller.
+
+    A channel reconnects by itself, so the TLS handshake is only paid again after the
+    peer went away; `close` drops the channels, e.g. when the extension shuts down.
+    """
+
+    def __init__(
+        self,
+        port: int,
+        root_certificate_path: str = ECHO_CERTIFICATE_PATH,
+        target_name: str = ECHO_TARGET_NAME,
+    ):
+        self.port = port
+        self._root_certificate_path = root_certificate_path
+        self._target_name = target_name
+        self._credentials: grpc.ChannelCredentials = None
+        self._channels: dict[str, grpc.Channel] = {}
+        self._lock = threading.Lock()
+
+    def get(self, ip: str) -> grpc.Channel:
+        with self._lock:
+            channel = self._channels.get(ip)
+            if channel is None:
+                if self._credentials is None:
+                    with open(self._root_certificate_path, "rb") as file:
+                        self._credentials = grpc.ssl_channel_credentials(file.read())
+                channel = self._channels[ip] = grpc.secure_channel(
+                    f"{ip}:{self.port}",
+                    credentials=self._credentials,
+                    options=(("grpc.ssl_target_name_override", self._target_name),),
+                )
+            return channel
+
+    def close(self, ip: str = None):
+        with self._lock:
+            ips = list(self._channels) if ip is None else [ip]
+            channels = [self._channels.pop(ip) for ip in ips if ip in self._channels]
+        for channel in channels:
+            channel.close()
+
+
+# Channels to the TMflow echo server, shared by every probe
+echo_channels = ChannelPool(const.PORT_ECHO_SERVER)
+
+
+@dataclass
+class ProbeResult:
+    robot_name: str
+    ip: str
+    service: str
+    available: bool
+    elapsed: float
+    error: str = ""
+
+
+def _to_asyncio(call: grpc.Future) -> asyncio.Future:
+    # The gRPC callback runs on a gRPC thread, resolve the asyncio future on its loop
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def _resolve(call: grpc.Future):
+        if future.done():
+            return
+        if call.cancelled():
+            future.cancel()
+        elif call.exception() is not None:
+            future.set_exception(call.exception())
+        else:
+            future.set_result(call.result())
+
+    def _cancel(future: asyncio.Future):
+        if future.cancelled():
+            call.cancel()
+
+    call.add_done_callback(lambda call: loop.call_soon_threadsafe(_resolve, call))
+    future.add_done_callback(_cancel)
+    return future
+
+
+async def probe_virtual_camera_api(
+    ip: str, timeout: float = 3.0, pool: ChannelPool = None
+):
+    # Same call as EchoClient.connectVirtualCameraAPI, without blocking the event loop
+    stub = OmniverseAPI_pb2_grpc.OmniverseApiStub((pool or echo_channels).get(ip))
+    await _to_asyncio(stub.connectTMFlow.future(empty_pb2.Empty(), timeout=timeout))
+
+
+async def probe_tcp(ip: str, port: int, timeout: float = 1.0):
+    _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def _probe(robot_name: str, ip: str, service: str, probe) -> ProbeResult:
+    start = time.monotonic()
+    try:
+        await probe
+    except Exception as e:
+        error = "timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+        if isinstance(e, grpc.RpcError):
+            error = e.code().name
+        return ProbeResult(
+            robot_name, ip, service, False, time.monotonic() - start, error
+        )
+    return ProbeResult(robot_name, ip, service, True, time.monotonic() - start)
+
+
+async def probe_robots(
+    robots: list[tuple[str, str]],
+    on_result: Callable[[ProbeResult], None] = None,
+    echo_timeout: float = 3.0,
+    ethernet_timeout: float = 1.0,
+    ethernet_port: int = None,
+    pool: ChannelPool = None,
+) -> list[ProbeResult]:
+    """Probes the Virtual Camera API and the Ethernet slave of every (name, ip) at once.
+
+    Every probe has its own deadline, so an offline controller costs one timeout in total
+    instead of one per service and robot. `on_result` is called as each result arrives.
+    """
+    ethernet_port = ethernet_port or const.PORT_ETHERNET
+    probes = []
+    for robot_name, ip in robots:
+        probes.append(
+            _probe(
+                robot_name,
+                ip,
+                SERVICE_VIRTUAL_CAMERA_API,
+                probe_virtual_camera_api(ip, echo_timeout, pool),
+            )
+        )
+        probes.append(
+            _probe(
+                robot_name,
+                ip,
+                SERVICE_ETHERNET,
+                probe_tcp(ip, ethernet_port, ethernet_timeout),
+            )
+        )
+
+    results = []
+    for probe in asyncio.as_completed(probes):
+        result = await probe
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+    return results
@@ -0,0 +1,325 @@
+import re
+import time
+from collections import deque
+
+import numpy as np
+
+# TMSVR packet: $TMSVR,<length>,<id>,<mode>,<content>,*<checksum>\r\n
+# <length> is the byte length of "<id>,<mode>,<content>" and <checksum> is the XOR of every
+# byte between "$" and "*" written as two hex digits.
+HEADER = b"$TMSVR,"
+TRAILER_SIZE = len(b",*00\r\n")
+
+MODE_RESPONSE = 0
+MODE_STRING = 2
+MODE_READ_STRING = 12
+
+# Ethernet slave transmit items (see tmflow_sample_project/.../digital_robot_motion.xml)
+JOINT_ITEM = b"Joint_Angle"
+IO_ITEMS = {
+    b"Ctrl_DI": "ctrl_di",
+    b"Ctrl_DO": "ctrl_do",
+    b"End_DI": "end_di",
+    b"End_DO": "end_do",
+}
+DEFAULT_IO_SIZES = {"ctrl_di": 16, "ctrl_do": 16, "end_di": 4, "end_do": 4}
+
+_ITEM_NAME_PATTERN = re.compile(rb"(\w+)=\{")
+_ITEM_VALUE_PATTERN = re.compile(rb"\{([^}]*)\}")
+_MODE_STRING_FIELD = b"%d," % MODE_STRING
+
+
+def get_checksum(data) -> int:
+    return int(np.bitwise_xor.reduce(np.frombuffer(data, dtype=np.uint8)))
+
+
+def build_packet(transaction_id: str, mode: int, content: str) -> bytes:
+    body = f"{transaction_id},{mode},{content}".encode("utf-8")
+    message = b"TMSVR," + str(len(body)).encode() + b"," + body + b","
+    return b"$" + message + b"*" + f"{get_checksum(message):02X}".encode() + b"\r\n"
+
+
+class EthernetFrame:
+    """Slotted counterpart of `EthernetData` filled in place by `TMSVRStreamParser`.
+
+    `ctrl_di`, `ctrl_do`, `end_di` and `end_do` are views into the single `io` array.
+    """
+
+    __slots__ = (
+        "robot_name",
+        "sequence",
+        "timestamp",
+        "joint_radian",
+        "io",
+        "ctrl_di",
+        "ctrl_do",
+        "end_di",
+        "end_do",
+        "io_layout",
+    )
+
+    def __init__(self, robot_name: str, io_sizes: dict[str, int] = None):
+        self.robot_name = robot_name
+        self.sequence = 0
+        self.timestamp = 0.0
+        self.joint_radian = np.zeros(6, dtype=np.float64)
+        self.resize_io(io_sizes or DEFAULT_IO_SIZES)
+
+    def resize_io(self, io_sizes: dict[str, int]):
+        self._bind_io(np.zeros(sum(io_sizes.values()), dtype=np.uint8), io_sizes)
+
+    def copy_from(self, frame: "EthernetFrame"):
+        # Refills this frame in place, its arrays are only reallocated when the layout changed
+        self.robot_name = frame.robot_name
+        self.sequence = frame.sequence
+        self.timestamp = frame.timestamp
+        if self.joint_radian.shape != frame.joint_radian.shape:
+            self.joint_radian = np.empty_like(frame.joint_radian)
+        np.copyto(self.joint_radian, frame.joint_radian)
+        if self.io_layout != frame.io_layout:
+            self._bind_io(
+                np.empty_like(frame.io), dict(zip(IO_ITEMS.values(), frame.io_layout))
+            )
+        np.copyto(self.io, frame.io)
+
+    def _bind_io(self, io: np.ndarray, io_sizes: dict[str, int]):
+        self.io = io
+        # Sizes of ctrl_di, ctrl_do, end_di and end_do
+        self.io_layout = tuple(
+            io_sizes.get(attribute, 0) for attribute in IO_ITEMS.values()
+        )
+        offset = 0
+        for attribute, size in zip(IO_ITEMS.values(), self.io_layout):
+            setattr(self, attribute, io[offset : offset + size])
+            offset += size
+
+
+class TMSVRResponse:
+    __slots__ = ("transaction_id", "mode", "content")
+
+    def __init__(self, transaction_id: str, mode: int, content: str):
+        self.transaction_id = transaction_id
+        self.mode = mode
+        self.content = content
+
+
+class TMSVRStreamParser:
+    """Incremental TMSVR parser working on one reusable receive buffer.
+
+    Bytes are received straight into the buffer (`recv_from` / `writable` + `commit`),
+    frames are delimited by their length field and checked in place, and all values of a
+    frame are converted in a single NumPy call. Data frames are written into one
+    preallocated `EthernetFrame`, so a yielded frame is only valid until the next one is
+    parsed; other threads get a `copy_from` of it, as `MotionMailbox` and
+    `JointTrajectoryBuffer` make into frames of their own. Other packets are queued on
+    `responses`. With a `decimation` of k only every k-th data frame is checked and parsed,
+    the others are counted in `skip_count` and dropped unparsed.
+    """
+
+    def __init__(self, robot_name: str, buffer_size: int = 1 << 16):
+        self.robot_name = robot_name
+        self.frame_count = 0
+        self.checksum_errors = 0
+        self.decimation = 1
+        self.skip_count = 0
+        self.responses: deque[TMSVRResponse] = deque(maxlen=32)
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._array = np.frombuffer(self._buffer, dtype=np.uint8)
+        self._start = 0
+        self._end = 0
+        self._frame = EthernetFrame(robot_name)
+        self._joint_slice: slice = None
+        self._io_index: np.ndarray = None
+        self._layout_size = 0
+        self._data_count = 0
+
+    def writable(self) -> memoryview:
+        if self._start == self._end:
+            self._start = self._end = 0
+        elif self._end == len(self._buffer):
+            self._compact()
+        return self._view[self._end :]
+
+    def commit(self, size: int):
+        self._end += size
+
+    def feed(self, data) -> None:
+        if self._start == self._end:
+            self._start = self._end = 0
+
+        size = len(data)
+        if self._end + size <= len(self._buffer):
+            self._buffer[self._end : self._end + size] = data
+            self._end += size
+            return
+
+        data = memoryview(data)
+        while data:
+            target = self.writable()
+            size = min(len(target), len(data))
+            target[:size] = data[:size]
+            self.commit(size)
+            data = data[size:]
+
+    def recv_from(self, sock) -> int:
+        size = sock.recv_into(self.writable())
+        self.commit(size)
+        return size
+
+    def frames(self):
+        buffer = self._buffer
+        while True:
+            position = buffer.find(HEADER, self._start, self._end)
+            if position < 0:
+                # Keep a possible partial header at the end of the buffer
+                self._start = max(self._start, self._end - len(HEADER) + 1)
+                return
+
+            length_start = position + len(HEADER)
+            length_end = buffer.find(b",", length_start, self._end)
+            if length_end < 0:
+                self._start = position
+                return
+
+            try:
+                length = int(buffer[length_start:length_end])
+            except ValueError:
+                self._start = position + 1
+                continue
+
+            payload_start = length_end + 1
+            payload_end = payload_start + length
+            frame_end = payload_end + TRAILER_SIZE
+            if frame_end > self._end:
+                self._start = position
+                return
+
+            if buffer[payload_end : payload_end + 2] != b",*":
+                self._start = position + 1
+                continue
+
+            self._start = frame_end
+            if self.decimation > 1 and self._skip(payload_start, payload_end):
+                continue
+
+            try:
+                checksum = int(buffer[payload_end + 2 : payload_end + 4], 16)
+            except ValueError:
+                checksum = -1
+            calculated = np.bitwise_xor.reduce(
+                self._array[position + 1 : payload_end + 1]
+            )
+            if calculated != checksum:
+                self.checksum_errors += 1
+                continue
+
+            frame = self._parse_payload(payload_start, payload_end)
+            if frame is not None:
+                yield frame
+
+    def _skip(self, start: int, end: int) -> bool:
+        # Only data frames are decimated, responses (e.g. IO acknowledgments) never are
+        buffer = self._buffer
+        id_end = buffer.find(b",", start, end)
+        if id_end < 0 or buffer[id_end + 1 : id_end + 3] != _MODE_STRING_FIELD:
+            return False
+        self._data_count += 1
+        if self._data_count % self.decimation == 0:
+            return False
+        self.skip_count += 1
+        return True
+
+    def _parse_payload(self, start: int, end: int):
+        buffer = self._buffer
+        id_end = buffer.find(b",", start, end)
+        mode_end = buffer.find(b",", id_end + 1, end)
+        if id_end < 0 or mode_end < 0:
+            return None
+
+        try:
+            mode = int(buffer[id_end + 1 : mode_end])
+        except ValueError:
+            return None
+
+        values = []
+        if mode == MODE_STRING:
+            values = _ITEM_VALUE_PATTERN.findall(buffer, mode_end + 1, end)
+
+        data = None
+        if values:
+            try:
+                # One vectorized conversion for every item value in the frame
+                data = np.array(b",".join(values).split(b","), dtype=np.float64)
+            except ValueError:
+                pass
+
+        if data is None:
+            self.responses.append(
+                TMSVRResponse(
+                    buffer[start:id_end].decode("utf-8"),
+                    mode,
+                    buffer[mode_end + 1 : end].decode("utf-8"),
+                )
+            )
+            return None
+
+        if data.size != self._layout_size:
+            self._update_layout(mode_end + 1, end, values, data.size)
+
+        frame = self._frame
+        if self._joint_slice is not None:
+            np.radians(data[self._joint_slice], out=frame.joint_radian)
+        frame.io[:] = data[self._io_index]
+
+        self.frame_count += 1
+        frame.sequence = self.frame_count
+        frame.timestamp = time.monotonic()
+        return frame
+
+    def _update_layout(self, start: int, end: int, values: list, size: int):
+        names = _ITEM_NAME_PATTERN.findall(self._buffer, start, end)
+        joint_slice = None
+        io_offsets = {}
+        offset = 0
+        for name, value in zip(names, values):
+            count = value.count(b",") + 1 if value.strip() else 0
+            if name == JOINT_ITEM:
+                joint_slice = slice(offset, offset + count)
+            elif name in IO_ITEMS:
+                io_offsets[IO_ITEMS[name]] = (offset, count)
+            offset += count
+
+        # IO values are gathered in the order of EthernetFrame.io
+        io_index = []
+        io_sizes = {}
+        for attribute in IO_ITEMS.values():
+            item_offset, count = io_offsets.get(attribute, (0, 0))
+            io_index.extend(range(item_offset, item_offset + count))
+            io_sizes[attribute] = count
+
+        frame = self._frame
+        if joint_slice is not None:
+            joint_count = joint_slice.stop - joint_slice.start
+            if frame.joint_radian.size != joint_count:
+                frame.joint_radian = np.zeros(joint_count, dtype=np.float64)
+        if frame.io.size != len(io_index):
+            frame.resize_io(io_sizes)
+
+        self._joint_slice = joint_slice
+        self._io_index = np.array(io_index, dtype=np.intp)
+        self._layout_size = size
+
+    def _compact(self):
+        remaining = self._end - self._start
+        if self._start == 0:
+            # A single packet is larger than the buffer
+            buffer = bytearray(len(self._buffer) * 2)
+            buffer[:remaining] = self._buffer[: self._end]
+            self._buffer = buffer
+            self._view = memoryview(buffer)
+            self._array = np.frombuffer(buffer, dtype=np.uint8)
+        else:
+            self._view[:remaining] = self._view[self._start : self._end]
+        self._start = 0
+        self._end = remaining
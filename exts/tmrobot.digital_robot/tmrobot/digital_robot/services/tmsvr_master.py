@@ -0,0 +1,340 @@
+import asyncio
+import base64
+import logging
+import threading
+import time
+import uuid
+
+# isort: off
+from tmrobot.digital_robot.services import metrics
+from tmrobot.digital_robot.services.io_commands import IOCommandChannel
+from tmrobot.digital_robot.services.log_pipeline import CONSOLE
+from tmrobot.digital_robot.services.tmsvr import MODE_READ_STRING
+from tmrobot.digital_robot.services.tmsvr import TMSVRStreamParser, build_packet
+from tmrobot.digital_robot.ui import constants as const  # type: ignore
+
+# isort: on
+
+logger = logging.getLogger(__name__)
+
+
+class TMSVRProtocol(asyncio.BufferedProtocol):
+    # Receives straight into the parser buffer, no intermediate bytes objects
+    def __init__(self, master: "TMSVRMaster"):
+        self._master = master
+        self._parser = master.parser
+
+    def connection_made(self, transport):
+        self._master._on_connection_made(transport)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self._parser.writable()
+
+    def buffer_updated(self, nbytes: int):
+        self._parser.commit(nbytes)
+        self._master._on_frames(self._parser.frames())
+
+    def eof_received(self):
+        return False
+
+    def connection_lost(self, exc):
+        self._master._on_connection_lost(exc)
+
+
+class TMSVRMaster:
+    """asyncio Ethernet master for the TMflow Ethernet slave.
+
+    Every master runs on the loop of one `TMSVRMasterLoop`. Received frames are put on
+    `motion_queue`, which copies them out of the parser's frame into its own, and reconnects
+    back off exponentially. DI writes go through the
+    `IOCommandChannel` `io` (configured by `io_options`): they never block the caller and
+    the writes of one physics step are sent in one packet by `flush_io`.
+    A `recorder` (e.g. `MotionLogRecorder`) gets every received frame before it is queued.
+    `decimation` (set by `FlowController`) queues only every k-th frame, unless recording.
+    """
+
+    def __init__(
+        self,
+        robot_name: str,
+        tmflow_ip: str,
+        motion_queue,
+        port: int = None,
+        timeout: float = 3.0,
+        reconnect_delay: float = 0.5,
+        max_reconnect_delay: float = 10.0,
+        recorder=None,
+        io_options: dict = None,
+    ):
+        self.robot_name = robot_name
+        self.tmflow_ip = tmflow_ip
+        self.port = port or const.PORT_ETHERNET
+        self.timeout = timeout
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.recorder = recorder
+        self.running = False
+        self.receive_count = 0
+        self.reconnect_count = 0
+        self.current_fps = 0.0
+        self.parser = TMSVRStreamParser(robot_name)
+        self.io = IOCommandChannel(self, **(io_options or {}))
+        self._motion_queue = motion_queue
+        self._loop: asyncio.AbstractEventLoop = None
+        self._transport: asyncio.Transport = None
+        self._connected = asyncio.Event()
+        self._disconnected: asyncio.Future = None
+        self._pending: dict[str, tuple[str, asyncio.Future]] = {}
+        self._fps_count = 0
+        self._fps_start = 0.0
+        self._last_frame_time: float = None
+        self._receive_seconds = metrics.registry.histogram(
+            "digital_robot_tmsvr_receive_interval_seconds",
+            "Time between consecutive TMSVR frames of a robot",
+            robot=robot_name,
+        )
+        self._parse_seconds = metrics.registry.histogram(
+            "digital_robot_tmsvr_parse_seconds",
+            "Time to parse one TMSVR frame from the receive buffer",
+            robot=robot_name,
+        )
+        self._enqueue_seconds = metrics.registry.histogram(
+            "digital_robot_tmsvr_enqueue_seconds",
+            "Time to put one parsed frame on the motion queue",
+            robot=robot_name,
+        )
+
+    @property
+    def decimation(self) -> int:
+        return self.parser.decimation
+
+    @decimation.setter
+    def decimation(self, value: int):
+        # Read by the loop thread on the next frame, the recorder keeps every frame
+        self.parser.decimation = 1 if self.recorder is not None else max(1, int(value))
+
+    @property
+    def slave_frame_count(self) -> int:
+        # Frames sent by the slave, queued or skipped by the decimation
+        return self.receive_count + self.parser.skip_count
+
+    @property
+    def connected(self) -> bool:
+        return self._transport is not None and not self._transport.is_closing()
+
+    async def connect(self):
+        self._loop = asyncio.get_running_loop()
+        self._disconnected = self._loop.create_future()
+        await asyncio.wait_for(
+            self._loop.create_connection(
+                lambda: TMSVRProtocol(self), self.tmflow_ip, self.port
+            ),
+            self.timeout,
+        )
+
+    async def run(self):
+        # Keep the connection alive until cancelled, reconnecting with backoff
+        self.running = True
+        delay = self.reconnect_delay
+        try:
+            while True:
+                try:
+                    await self.connect()
+                except (OSError, asyncio.TimeoutError) as e:
+                    logger.warning(
+                        f"{self.robot_name}: can't connect to {self.tmflow_ip}:{self.port}: "
+                        f"{e}, retry in {delay:.1f}s"
+                    )
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_reconnect_delay)
+                    continue
+
+                delay = self.reconnect_delay
+                await asyncio.shield(self._disconnected)
+                self.reconnect_count += 1
+                await asyncio.sleep(delay)
+        finally:
+            self.running = False
+            self.close()
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    async def get_robot_model(self) -> str:
+        try:
+            await asyncio.wait_for(self._connected.wait(), self.timeout)
+            content = await self.request(MODE_READ_STRING, "Robot_Model")
+            return content.split("=", 1)[-1].strip().strip('"')
+        except Exception as e:
+            logger.error(
+                f"{self.robot_name}: Get wrong robot model with exception: {e}"
+            )
+            return "Unknown"
+
+    async def request(self, mode: int, content: str) -> str:
+        transaction_id = self._generate_short_uuid()
+        future = self._loop.create_future()
+        self._pending[transaction_id] = (content.split("[", 1)[0], future)
+        try:
+            self._transport.write(build_packet(transaction_id, mode, content))
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            self._pending.pop(transaction_id, None)
+
+    def set_ctrl_di(self, index: int, value: int):
+        self.io.set("Ctrl_DI", index, value)
+
+    def set_end_di(self, index: int, value: int):
+        self.io.set("End_DI", index, value)
+
+    def flush_io(self):
+        # Sends the DI writes since the last call in one packet, from any thread
+        self.io.flush()
+
+    def _on_connection_made(self, transport: asyncio.Transport):
+        self._transport = transport
+        self._last_frame_time = None
+        self._connected.set()
+        self.io.start()
+        self._fps_start = time.monotonic()
+        self._console(f"{self.robot_name}: connected to {self.tmflow_ip}:{self.port}")
+
+    def _on_connection_lost(self, exc: Exception):
+        self._transport = None
+        self._connected.clear()
+        self.io.reset()
+        for _, future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionAbortedError("Connection lost"))
+        if self._disconnected is not None and not self._disconnected.done():
+            self._disconnected.set_result(exc)
+        if self.running:
+            logger.warning(f"{self.robot_name}: connection lost: {exc}")
+
+    def _on_frames(self, frames):
+        # `frames` parses lazily, the time until the next frame is yielded is its parse time
+        parse_start = time.perf_counter()
+        for frame in frames:
+            parsed = time.perf_counter()
+            if self.recorder is not None:
+                self.recorder.append(frame)
+            self._motion_queue.put(frame)
+            enqueued = time.perf_counter()
+            self.receive_count += 1
+
+            self._parse_seconds.observe(parsed - parse_start)
+            self._enqueue_seconds.observe(enqueued - parsed)
+            if self._last_frame_time is not None:
+                self._receive_seconds.observe(parsed - self._last_frame_time)
+            self._last_frame_time = parsed
+            parse_start = enqueued
+
+        while self.parser.responses:
+            self._resolve(self.parser.responses.popleft())
+
+        now = time.monotonic()
+        if now - self._fps_start >= 1.0:
+            self.current_fps = (self.receive_count - self._fps_count) / (
+                now - self._fps_start
+            )
+            self._fps_count = self.receive_count
+            self._fps_start = now
+
+    def _resolve(self, response):
+        if self.io.acknowledge(response):
+            return
+
+        pending = self._pending.get(response.transaction_id)
+        if pending is None:
+            # Replies that do not echo the transaction id are matched by item name
+            pending = next(
+                (
+                    entry
+                    for entry in self._pending.values()
+                    if response.content.startswith(entry[0])
+                ),
+                None,
+            )
+        if pending is not None and not pending[1].done():
+            pending[1].set_result(response.content)
+
+    def _generate_short_uuid(self) -> str:
+        return base64.urlsafe_b64encode(uuid.uuid4().bytes)[:8].decode()
+
+    def _console(self, message: str):
+        logger.info(message, extra=CONSOLE)
+
+
+class TMSVRMasterLoop:
+    """One background thread and event loop shared by every `TMSVRMaster`."""
+
+    def __init__(self, name: str = "tmsvr-master"):
+        self._name = name
+        self._loop: asyncio.AbstractEventLoop = None
+        self._thread: threading.Thread = None
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run_loop, name=self._name, daemon=True
+        )
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+        self._loop.close()
+
+    def submit(self, coroutine):
+        # Returns a concurrent.futures.Future, wrap it with asyncio.wrap_future to await
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    async def add_master(self, master: TMSVRMaster) -> str:
+        # Keep the master running on the loop and return its robot model
+        async def _start():
+            self._tasks[master.robot_name] = asyncio.create_task(master.run())
+            return await master.get_robot_model()
+
+        return await asyncio.wrap_future(self.submit(_start()))
+
+    async def _cancel_all(self):
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self, timeout: float = 3.0):
+        # Cancel every master, wait until their sockets are closed and join the thread
+        if self._thread is None:
+            return
+        try:
+            self.submit(self._cancel_all()).result(timeout)
+        except Exception as e:
+            logger.warning(f"Failed to stop Ethernet masters cleanly: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+
+    async def stop_async(self, timeout: float = 3.0):
+        if self._thread is None:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.wrap_future(self.submit(self._cancel_all())), timeout
+            )
+        except Exception as e:
+            logger.warning(f"Failed to stop Ethernet masters cleanly: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._thread.join, timeout
+        )
+        self._thread = None
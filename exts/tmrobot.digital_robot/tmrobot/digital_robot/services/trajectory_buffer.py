@@ -0,0 +1,323 @@
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+# isort: off
+from tmrobot.digital_robot.services.tmsvr import EthernetFrame
+
+# isort: on
+
+INTERPOLATION_LINEAR = "linear"
+INTERPOLATION_CUBIC = "cubic"
+# Seconds the latency changes per second towards target_latency, slow enough not to be seen
+LATENCY_SLEW_RATE = 0.05
+
+
+@dataclass
+class TrajectoryStats:
+    received: int = 0
+    # Frames with a sequence number not newer than the last one
+    out_of_order: int = 0
+    # Samples taken between two received frames
+    interpolated: int = 0
+    # Samples taken after the newest frame, within max_extrapolation
+    extrapolated: int = 0
+    # Times the trajectory ran dry beyond max_extrapolation, the robot then holds still
+    underruns: int = 0
+    # Smoothed inter-arrival jitter (RFC 3550 style) and the largest inter-arrival gap
+    jitter: float = 0.0
+    max_gap: float = 0.0
+    period: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "out_of_order": self.out_of_order,
+            "interpolated": self.interpolated,
+            "extrapolated": self.extrapolated,
+            "underruns": self.underruns,
+            "jitter_ms": float(self.jitter) * 1000,
+            "max_gap_ms": float(self.max_gap) * 1000,
+            "period_ms": float(self.period) * 1000,
+        }
+
+
+class TrajectorySample:
+    __slots__ = ("robot_name", "joint_radian", "frame", "extrapolated")
+
+    def __init__(self, robot_name: str, joint_count: int):
+        self.robot_name = robot_name
+        self.joint_radian = np.zeros(joint_count, dtype=np.float64)
+        self.frame = None
+        self.extrapolated = False
+
+    # IO values of the newest received frame, same attributes as EthernetFrame
+    @property
+    def ctrl_di(self):
+        return self.frame.ctrl_di
+
+    @property
+    def ctrl_do(self):
+        return self.frame.ctrl_do
+
+    @property
+    def end_di(self):
+        return self.frame.end_di
+
+    @property
+    def end_do(self):
+        return self.frame.end_do
+
+
+class _RobotTrajectory:
+    def __init__(self, robot_name: str, capacity: int, joint_count: int = 6):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.positions = np.zeros((capacity, joint_count), dtype=np.float64)
+        self.count = 0
+        self.start = 0
+        self.sequence = -1
+        self.last_arrival = None
+        self.last_time = None
+        # Newest received frame, swapped with the sample's frame by the next sample
+        self.frame = None
+        self.fresh = False
+        self.held = False
+        self.sample = TrajectorySample(robot_name, joint_count)
+        self.stats = TrajectoryStats()
+
+    def resize(self, joint_count: int):
+        self.positions = np.zeros((self.capacity, joint_count), dtype=np.float64)
+        self.sample.joint_radian = np.zeros(joint_count, dtype=np.float64)
+        self.count = 0
+        self.start = 0
+
+    def append(self, timestamp: float, joint_radian: np.ndarray):
+        index = (self.start + self.count) % self.capacity
+        if self.count == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.count += 1
+        self.times[index] = timestamp
+        self.positions[index] = joint_radian
+
+    def store(self, motion):
+        # An EthernetFrame is refilled by its parser, copy it into a frame of the trajectory
+        if not isinstance(motion, EthernetFrame):
+            self.frame = motion
+        else:
+            if not isinstance(self.frame, EthernetFrame):
+                self.frame = EthernetFrame(motion.robot_name)
+            self.frame.copy_from(motion)
+        self.fresh = True
+
+    def ordered(self):
+        order = (np.arange(self.count) + self.start) % self.capacity
+        return self.times[order], self.positions[order]
+
+
+class JointTrajectoryBuffer:
+    """Per-robot joint trajectories resampled to the physics step time.
+
+    Receive threads call `put` (same call shape as `MotionMailbox.put`). Every frame is
+    stored with a dejittered timestamp: frames are spaced by the estimated send period and
+    pulled slowly towards their receive time, so a burst of late frames is spread out again
+    instead of being applied in one step. The physics step calls `sample_all` with the step
+    time; samples are taken `latency` seconds in the past, interpolated linearly or with a
+    cubic Hermite spline, and extrapolated for at most `max_extrapolation` seconds when the
+    next frame is late. The step clock advances by the step size times `time_scale`, so it
+    keeps up with wall time when the physics runs slower or faster than real time, and `latency`
+    moves slowly towards `target_latency` (both set by `FlowController`).
+    """
+
+    def __init__(
+        self,
+        robot_names: list[str],
+        latency: float = 0.05,
+        interpolation: str = INTERPOLATION_CUBIC,
+        max_extrapolation: float = 0.02,
+        capacity: int = 64,
+    ):
+        if interpolation not in (INTERPOLATION_LINEAR, INTERPOLATION_CUBIC):
+            raise ValueError(f"Unknown interpolation: {interpolation}")
+
+        self.latency = latency
+        self.target_latency = latency
+        self.time_scale = 1.0
+        self.interpolation = interpolation
+        self.max_extrapolation = max_extrapolation
+        self._capacity = capacity
+        self._lock = threading.Lock()
+        self._clock: float = None
+        self._trajectories: dict[str, _RobotTrajectory] = {
+            name: _RobotTrajectory(name, capacity) for name in robot_names
+        }
+
+    def put(self, motion, block=True, timeout=None):
+        arrival = motion.timestamp or time.monotonic()
+        sequence = getattr(motion, "sequence", None)
+
+        with self._lock:
+            trajectory = self._trajectories.get(motion.robot_name)
+            if trajectory is None:
+                trajectory = self._trajectories[motion.robot_name] = _RobotTrajectory(
+                    motion.robot_name, self._capacity, len(motion.joint_radian)
+                )
+            stats = trajectory.stats
+
+            if sequence is not None:
+                if sequence <= trajectory.sequence:
+                    stats.out_of_order += 1
+                    return
+                trajectory.sequence = sequence
+
+            if len(motion.joint_radian) != trajectory.positions.shape[1]:
+                trajectory.resize(len(motion.joint_radian))
+
+            timestamp = self._dejitter(trajectory, arrival)
+            trajectory.append(timestamp, motion.joint_radian)
+            trajectory.store(motion)
+            trajectory.held = False
+            stats.received += 1
+
+    put_nowait = put
+
+    def _dejitter(self, trajectory: _RobotTrajectory, arrival: float) -> float:
+        stats = trajectory.stats
+        if trajectory.last_arrival is None:
+            trajectory.last_arrival = trajectory.last_time = arrival
+            return arrival
+
+        gap = arrival - trajectory.last_arrival
+        trajectory.last_arrival = arrival
+        stats.max_gap = max(stats.max_gap, gap)
+        if stats.period == 0.0:
+            stats.period = gap
+        else:
+            stats.jitter += (abs(gap - stats.period) - stats.jitter) / 16
+            stats.period += (gap - stats.period) / 64
+
+        # Space frames by the send period, resynchronize when too far from the arrival time
+        expected = trajectory.last_time + stats.period
+        if abs(arrival - expected) > self.latency:
+            timestamp = arrival
+        else:
+            timestamp = expected + (arrival - expected) * 0.1
+        trajectory.last_time = timestamp
+        return timestamp
+
+    def advance(self, step_size: float) -> float:
+        # Physics step clock: advances by the step size so sub-stepped physics gets evenly
+        # spaced sample times, and snaps back to wall time when it drifts too far
+        now = time.monotonic()
+        step = step_size * self.time_scale
+        if self._clock is None or abs(now - (self._clock + step)) > self.latency:
+            self._clock = now
+        else:
+            self._clock += step
+
+        if self.latency != self.target_latency:
+            slew = step * LATENCY_SLEW_RATE
+            self.latency = min(
+                max(self.target_latency, self.latency - slew), self.latency + slew
+            )
+        return self._clock
+
+    def sample(self, robot_name: str, now: float = None) -> TrajectorySample:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            trajectory = self._trajectories.get(robot_name)
+            if trajectory is None:
+                return None
+            return self._sample(trajectory, now - self.latency)
+
+    def sample_all(self, now: float = None) -> list[TrajectorySample]:
+        now = time.monotonic() if now is None else now
+        samples = []
+        with self._lock:
+            for trajectory in self._trajectories.values():
+                sample = self._sample(trajectory, now - self.latency)
+                if sample is not None:
+                    samples.append(sample)
+        return samples
+
+    def _sample(self, trajectory: _RobotTrajectory, target: float) -> TrajectorySample:
+        if trajectory.count == 0 or trajectory.held:
+            return None
+
+        stats = trajectory.stats
+        sample = trajectory.sample
+        if trajectory.fresh:
+            # The sample's frame stays valid for the physics step until the next sample
+            trajectory.frame, sample.frame = sample.frame, trajectory.frame
+            trajectory.fresh = False
+        sample.extrapolated = False
+        times, positions = trajectory.ordered()
+
+        if trajectory.count == 1 or target <= times[0]:
+            sample.joint_radian[:] = positions[0 if target <= times[0] else -1]
+            return sample
+
+        if target >= times[-1]:
+            overshoot = target - times[-1]
+            if overshoot > self.max_extrapolation:
+                stats.underruns += 1
+                # Hold at the extrapolation bound until the next frame arrives
+                trajectory.held = True
+                overshoot = self.max_extrapolation
+            else:
+                stats.extrapolated += 1
+            velocity = (positions[-1] - positions[-2]) / max(
+                times[-1] - times[-2], 1e-6
+            )
+            np.add(positions[-1], velocity * overshoot, out=sample.joint_radian)
+            sample.extrapolated = True
+            return sample
+
+        index = int(np.searchsorted(times, target, side="right")) - 1
+        t0, t1 = times[index], times[index + 1]
+        p0, p1 = positions[index], positions[index + 1]
+        h = max(t1 - t0, 1e-6)
+        alpha = (target - t0) / h
+        stats.interpolated += 1
+
+        if self.interpolation == INTERPOLATION_LINEAR:
+            np.add(p0, (p1 - p0) * alpha, out=sample.joint_radian)
+            return sample
+
+        # Cubic Hermite spline with finite-difference tangents (one-sided at the ends)
+        if index > 0:
+            m0 = (p1 - positions[index - 1]) / max(t1 - times[index - 1], 1e-6)
+        else:
+            m0 = (p1 - p0) / h
+        if index + 2 < trajectory.count:
+            m1 = (positions[index + 2] - p0) / max(times[index + 2] - t0, 1e-6)
+        else:
+            m1 = (p1 - p0) / h
+
+        a2 = alpha * alpha
+        a3 = a2 * alpha
+        sample.joint_radian[:] = (
+            (2 * a3 - 3 * a2 + 1) * p0
+            + (a3 - 2 * a2 + alpha) * h * m0
+            + (-2 * a3 + 3 * a2) * p1
+            + (a3 - a2) * h * m1
+        )
+        return sample
+
+    def clear(self):
+        with self._lock:
+            for name, trajectory in self._trajectories.items():
+                self._trajectories[name] = _RobotTrajectory(
+                    name, self._capacity, trajectory.positions.shape[1]
+                )
+        self._clock = None
+
+    def get_stats(self) -> dict[str, dict]:
+        with self._lock:
+            return {
+                name: trajectory.stats.to_dict()
+                for name, trajectory in self._trajectories.items()
+            }
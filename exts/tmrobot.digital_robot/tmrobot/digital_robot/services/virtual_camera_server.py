@@ -0,0 +1,220 @@
+import functools
+import logging
+import time
+from typing import Callable
+
+import grpc
+from google.protobuf.json_format import MessageToJson
+
+# isort: off
+from tmrobot.digital_robot.grpcs import VirtualCameraAPI_pb2  # type: ignore
+from tmrobot.digital_robot.models.system_message import VirtualCameraServerMessage  # type: ignore
+from tmrobot.digital_robot.services import metrics
+from tmrobot.digital_robot.services import virtual_camera_server_secure  # type: ignore
+from tmrobot.digital_robot.services.camera_access import (
+    get_annotator_rgb,
+    get_world_transform,
+)
+from tmrobot.digital_robot.services.camera_registry import CameraRegistry, GrabLimiter
+from tmrobot.digital_robot.services.image_encoder import IMAGE_TYPE_RAW, ImageEncoder
+from tmrobot.digital_robot.services.log_pipeline import CONSOLE
+from tmrobot.digital_robot.services.virtual_camera_server_secure import VirtualCameraServerSecure  # type: ignore
+
+# isort: on
+
+logger = logging.getLogger(__name__)
+
+# VirtualCameraServerSecure labels its JPEG images "png" and TMflow decodes them by content, keep
+# the label TMflow has always received
+RESPONSE_IMAGE_TYPE = "png"
+# Metric label of the requests for a serial number that isn't registered
+UNKNOWN_CAMERA = "unknown"
+
+
+class VirtualCameraServer(VirtualCameraServerSecure):
+    """`VirtualCameraServerSecure` whose getGrabImageData encodes off the event loop.
+
+    The handler only reads the annotator frame on the Kit loop; the copy is encoded by
+    `image_encoder` and awaited, so rendering and physics keep running meanwhile. When the
+    encoder has a cache, a grab whose camera state (`frame_index()`, world pose and capture
+    settings) equals the previous grab of that camera is answered from the cache directly.
+    `frame_index()` must change with every physics step; while it returns None (e.g. the
+    world is paused) grabs are read and only skip encoding when the pixels are cached.
+
+    Cameras are looked up in a `CameraRegistry` instead of the nested `dg_cameras` dict.
+    Concurrent grabs of one camera and frame share one capture and at most
+    `max_grabs_per_camera` captures of a camera run at once (`GrabLimiter`).
+
+    Every gRPC method records its duration in `metrics.registry` per method and camera;
+    serial numbers that aren't registered share the camera label `UNKNOWN_CAMERA`.
+    The request and response dumps of `VirtualCameraServerSecure` are only built when its
+    logger is enabled for debug.
+    """
+
+    def __init__(
+        self,
+        set_queue,
+        dg_cameras,
+        image_encoder: ImageEncoder = None,
+        frame_index: Callable[[], int] = None,
+        max_grabs_per_camera: int = 1,
+    ):
+        super().__init__(set_queue, dg_cameras)
+        self.image_encoder = image_encoder or ImageEncoder()
+        self.camera_registry = CameraRegistry(dg_cameras)
+        self.grab_limiter = GrabLimiter(
+            1 if max_grabs_per_camera is None else max_grabs_per_camera
+        )
+        self._frame_index = frame_index
+
+        if self.image_encoder.image_type == IMAGE_TYPE_RAW:
+            # getGrabImageDataResponse.ImageType only knows encoded images
+            logger.warning("Raw images can't be sent to TMflow, use jpg instead")
+            self.image_encoder.image_type = "jpg"
+
+    async def getGrabImageData(self, request, context):
+        client_ip = context.peer().split(":")[1]
+        camera = self._find_camera_by_ip_sn(client_ip, request.SerialNumber)
+        if camera is None:
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details(VirtualCameraServerMessage.CAMERA_NOT_FOUND)
+            return VirtualCameraAPI_pb2.getGrabImageDataResponse()
+
+        try:
+            image_bytes = await self._grab(camera)
+        except Exception as e:
+            logger.error(
+                f"Failed to get jpg image, please try STOP service then START: {e}"
+            )
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            return VirtualCameraAPI_pb2.getGrabImageDataResponse()
+
+        return VirtualCameraAPI_pb2.getGrabImageDataResponse(
+            ImageType=RESPONSE_IMAGE_TYPE,
+            PixelFormat="RGB",
+            EncodeString=image_bytes,
+        )
+
+    def _find_camera_by_ip_sn(self, client_ip: str, serial_number: str):
+        return self.camera_registry.get(client_ip, serial_number)
+
+    def _find_camera_by_sn(self, serial_number: str):
+        return self.camera_registry.get_by_serial(serial_number)
+
+    async def _grab(self, camera) -> bytes:
+        # Grabs of the same frame while one is captured get its image
+        serial_number = camera.get_serial_number()
+        frame = self._frame_index() if self._frame_index is not None else None
+        return await self.grab_limiter.run(
+            serial_number, frame, lambda: self._capture(camera, serial_number, frame)
+        )
+
+    async def _capture(self, camera, serial_number: str, frame: int) -> bytes:
+        cache = self.image_encoder.cache
+        if cache is None or frame is None:
+            return await self.image_encoder.encode(
+                get_annotator_rgb(camera), serial_number=serial_number
+            )
+
+        state = self._get_camera_state(camera, frame)
+        image_bytes = cache.get_by_state(serial_number, state)
+        if image_bytes is not None:
+            return image_bytes
+
+        key, image_bytes = await self.image_encoder.encode_keyed(
+            get_annotator_rgb(camera), serial_number=serial_number
+        )
+        cache.remember_state(serial_number, state, key)
+        return image_bytes
+
+    def _get_camera_state(self, camera, frame: int) -> tuple:
+        transform = get_world_transform(camera)
+        return (
+            frame,
+            tuple(round(value, 6) for row in transform for value in row),
+            str(camera.get_image_size()),
+            camera.get_gain(),
+            camera.get_shutter_time(),
+            str(camera.get_white_balance()),
+            self.image_encoder.image_type,
+            self.image_encoder.quality,
+        )
+
+    def _console(self, message: str):
+        logger.info(message, extra=CONSOLE)
+
+    async def stop(self):
+        await super().stop()
+        self.image_encoder.shutdown()
+        logger.info(f"Camera grabs: {self.grab_limiter.get_stats()}")
+        if self.image_encoder.cache is not None:
+            logger.info(f"Image cache: {self.image_encoder.cache.get_stats()}")
+
+
+def _message_to_json(message, *args, **kwargs) -> str:
+    # VirtualCameraServerSecure logs "request:\n<json>" and "response:\n<json>" at info for
+    # every call, an empty dump is dropped by _SkippedDumpFilter
+    if not virtual_camera_server_secure.logger.isEnabledFor(logging.DEBUG):
+        return ""
+    return MessageToJson(message, *args, **kwargs)
+
+
+class _SkippedDumpFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.msg not in ("request:\n", "response:\n")
+
+
+virtual_camera_server_secure.MessageToJson = _message_to_json
+virtual_camera_server_secure.logger.addFilter(_SkippedDumpFilter())
+
+
+def _timed_rpc(method_name: str, method):
+    # [serial number, None without one] of the registered cameras only
+    histograms: dict[str, metrics.Histogram] = {}
+
+    @functools.wraps(method)
+    async def timed(self, request, context):
+        start = time.perf_counter()
+        try:
+            return await method(self, request, context)
+        finally:
+            serial_number = getattr(request, "SerialNumber", None)
+            histogram = histograms.get(serial_number)
+            if histogram is None:
+                histogram = _rpc_histogram(self, method_name, serial_number, histograms)
+            histogram.observe(time.perf_counter() - start)
+
+    return timed
+
+
+def _rpc_histogram(
+    server: VirtualCameraServer, method_name: str, serial_number: str, histograms: dict
+) -> metrics.Histogram:
+    # Any client can send any serial number, only registered ones become labels so the
+    # metrics stay bounded
+    if serial_number is None:
+        camera = ""
+    elif server.camera_registry.get_by_serial(serial_number) is not None:
+        camera = serial_number
+    else:
+        camera = UNKNOWN_CAMERA
+    histogram = metrics.registry.histogram(
+        "digital_robot_grpc_request_seconds",
+        "Time to handle one request of the virtual camera gRPC server",
+        method=method_name,
+        camera=camera,
+    )
+    if camera != UNKNOWN_CAMERA:
+        histograms[serial_number] = histogram
+    return histogram
+
+
+_service = VirtualCameraAPI_pb2.DESCRIPTOR.services_by_name["VirtualCameraApi"]
+for _method in _service.methods:
+    if hasattr(VirtualCameraServer, _method.name):
+        setattr(
+            VirtualCameraServer,
+            _method.name,
+            _timed_rpc(_method.name, getattr(VirtualCameraServer, _method.name)),
+        )